@@ -12,7 +12,9 @@ from airport.models import (
     Ticket,
     AirplaneType,
     Cabin,
+    FlightSchedule,
 )
+from airport.schedules import cancel_schedule, materialize_schedule
 
 
 model_list = [
@@ -31,3 +33,17 @@ model_list = [
 
 for model in model_list:
     admin.site.register(model)
+
+
+@admin.register(FlightSchedule)
+class FlightScheduleAdmin(admin.ModelAdmin):
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        materialize_schedule(form.instance, update=change)
+
+    def delete_model(self, request, obj):
+        cancel_schedule(obj)
+
+    def delete_queryset(self, request, queryset):
+        for schedule in queryset:
+            cancel_schedule(schedule)
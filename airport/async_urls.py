@@ -0,0 +1,21 @@
+from django.urls import path
+
+from airport.async_views import (
+    AirportListView,
+    FlightDetailView,
+    FlightListView,
+    RouteDetailView,
+    RouteListView,
+)
+
+urlpatterns = [
+    path("flights/", FlightListView.as_view(), name="flight-list"),
+    path(
+        "flights/<int:pk>/", FlightDetailView.as_view(), name="flight-detail"
+    ),
+    path("airports/", AirportListView.as_view(), name="airport-list"),
+    path("routes/", RouteListView.as_view(), name="route-list"),
+    path("routes/<int:pk>/", RouteDetailView.as_view(), name="route-detail"),
+]
+
+app_name = "airport-async"
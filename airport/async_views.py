@@ -0,0 +1,224 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from airport.models import Airport, Flight, Route
+from airport.pagination import FlightPagination
+from airport.permissions import IsAdminOrIfAuthenticatedReadOnly
+from airport.response_cache import (
+    acached_data,
+    flight_detail_cache_key,
+    flight_list_cache_key,
+)
+from airport.serializers import (
+    AirportListSerializer,
+    FlightDetailSerializer,
+    FlightListSerializer,
+    RouteDetailSerializer,
+    RouteListSerializer,
+)
+from airport.views import FlightSearchMixin
+from user.authentication import CachedJWTAuthentication
+
+
+class AsyncAPIView(View):
+    """Read-only view running on the event loop under ASGI. Authentication,
+    permissions, throttling and error bodies follow the DRF views, queries
+    are made with the async ORM and objects are serialized after all their
+    relations are loaded, so serializers never hit the database"""
+
+    http_method_names = ["get", "head"]
+    permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    serializer_class = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = Request(request)
+
+        try:
+            self.request.user = await self.authenticate(self.request)
+            self.check_permissions(self.request)
+            await sync_to_async(self.check_throttles)(self.request)
+
+            if request.method.lower() not in self.http_method_names:
+                raise exceptions.MethodNotAllowed(request.method)
+            handler = getattr(self, request.method.lower())
+            data, headers = await handler(self.request, *args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(exc)
+
+        return self.render(data, status.HTTP_200_OK, headers)
+
+    async def authenticate(self, request):
+        """CachedJWTAuthentication with the async cache and ORM"""
+        authentication = CachedJWTAuthentication()
+        header = authentication.get_header(request)
+        raw_token = header and authentication.get_raw_token(header)
+        if raw_token is None:
+            return AnonymousUser()
+
+        token = authentication.get_validated_token(raw_token)
+        return await authentication.aget_user(token)
+
+    def check_permissions(self, request):
+        for permission_class in self.permission_classes:
+            if not permission_class().has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+
+    def check_throttles(self, request):
+        waits = [
+            throttle.wait()
+            for throttle in (
+                throttle_class() for throttle_class in self.throttle_classes
+            )
+            if not throttle.allow_request(request, self)
+        ]
+        if waits:
+            raise exceptions.Throttled(
+                max((wait for wait in waits if wait is not None), default=None)
+            )
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs["context"] = {
+            "request": self.request,
+            "format": None,
+            "view": self,
+        }
+        return self.serializer_class(*args, **kwargs)
+
+    def render(self, data, status_code, headers=None):
+        response = HttpResponse(
+            JSONRenderer().render(data),
+            status=status_code,
+            content_type="application/json",
+        )
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
+
+    def handle_exception(self, exc):
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            exc.auth_header = CachedJWTAuthentication().authenticate_header(
+                self.request
+            )
+
+        response = exception_handler(
+            exc, {"view": self, "request": self.request}
+        )
+        if response is None:
+            raise exc
+
+        return self.render(
+            response.data,
+            response.status_code,
+            {
+                name: response[name]
+                for name in ("WWW-Authenticate", "Retry-After")
+                if response.has_header(name)
+            },
+        )
+
+
+class FlightListView(FlightSearchMixin, AsyncAPIView):
+    queryset = Flight.objects.select_related(
+        "route__departure__country",
+        "route__destination__country",
+        "airplane",
+    )
+    serializer_class = FlightListSerializer
+    pagination_class = FlightPagination
+    throttle_scope = "flights"
+
+    async def get_queryset(self):
+        departure = self.request.query_params.get("from")
+        destination = self.request.query_params.get("to")
+
+        route_ids = None
+        if departure or destination:
+            route_ids = Route.ids_between(departure, destination)
+
+        return self.filter_flights(self.queryset, route_ids)
+
+    async def get_data(self):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(
+            await self.get_queryset(), self.request, self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+
+    async def get(self, request, *args, **kwargs):
+        key = await sync_to_async(flight_list_cache_key)(request)
+        data, cached = await acached_data(key, self.get_data)
+        return data, {"X-Cache": "HIT" if cached else "MISS"}
+
+
+class FlightDetailView(AsyncAPIView):
+    queryset = Flight.objects.select_related(
+        "route__departure__country",
+        "route__destination__country",
+        "airplane__airplane_type",
+    ).prefetch_related("crew", "airplane__cabins__seat_class")
+    serializer_class = FlightDetailSerializer
+    throttle_scope = "flights"
+
+    async def get_data(self):
+        try:
+            flight = await self.queryset.aget(pk=self.kwargs["pk"])
+        except Flight.DoesNotExist:
+            raise exceptions.NotFound()
+
+        return self.get_serializer(flight).data
+
+    async def get(self, request, *args, **kwargs):
+        key = await sync_to_async(flight_detail_cache_key)(
+            request, kwargs["pk"]
+        )
+        data, cached = await acached_data(key, self.get_data)
+        return data, {"X-Cache": "HIT" if cached else "MISS"}
+
+
+class AirportListView(AsyncAPIView):
+    queryset = Airport.objects.select_related("country")
+    serializer_class = AirportListSerializer
+
+    async def get(self, request, *args, **kwargs):
+        airports = [airport async for airport in self.queryset.aiterator()]
+        return self.get_serializer(airports, many=True).data, None
+
+
+class RouteListView(AsyncAPIView):
+    queryset = Route.objects.select_related(
+        "departure__country", "destination__country"
+    )
+    serializer_class = RouteListSerializer
+    permission_classes = (IsAdminUser,)
+
+    async def get(self, request, *args, **kwargs):
+        routes = [route async for route in self.queryset.aiterator()]
+        return self.get_serializer(routes, many=True).data, None
+
+
+class RouteDetailView(AsyncAPIView):
+    queryset = RouteListView.queryset
+    serializer_class = RouteDetailSerializer
+    permission_classes = (IsAdminUser,)
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            route = await self.queryset.aget(pk=kwargs["pk"])
+        except Route.DoesNotExist:
+            raise exceptions.NotFound()
+
+        return self.get_serializer(route).data, None
@@ -0,0 +1,196 @@
+import math
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.utils import timezone
+from rest_framework.views import APIView
+
+from airport.async_views import AsyncAPIView
+from airport.models import (
+    AirplaneType,
+    SeatClass,
+    Airplane,
+    Country,
+    Airport,
+    Route,
+    Crew,
+    Flight,
+    Order,
+    Ticket,
+    Cabin,
+)
+from airport.search_rows import refresh_search_rows
+from airport.seat_counters import sync_airplane_capacity, sync_seat_counters
+
+PASSWORD = "bench-password"
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values"""
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+def seed(options):
+    """Fill the database with a random but reproducible dataset"""
+    rng = random.Random(options["seed"])
+    user_model = get_user_model()
+
+    users = {
+        "user": user_model.objects.create_user("user@bench.com", PASSWORD),
+        "admin": user_model.objects.create_superuser(
+            "admin@bench.com", PASSWORD
+        ),
+    }
+
+    seat_classes = SeatClass.objects.bulk_create(
+        SeatClass(name=name) for name in ("Economy", "Business", "First")
+    )
+    cabins = Cabin.objects.bulk_create(
+        Cabin(name=f"Cabin {i}", seat_class=seat_class, seats=seats)
+        for i, (seat_class, seats) in enumerate(
+            zip(seat_classes, (150, 30, 8))
+        )
+    )
+    airplane_type = AirplaneType.objects.create(name="Narrow-body")
+    airplanes = Airplane.objects.bulk_create(
+        Airplane(name=f"Airplane {i}", airplane_type=airplane_type)
+        for i in range(options["airplanes"])
+    )
+    Airplane.cabins.through.objects.bulk_create(
+        Airplane.cabins.through(airplane=airplane, cabin=cabin)
+        for airplane in airplanes
+        for cabin in cabins
+    )
+    sync_airplane_capacity([airplane.id for airplane in airplanes])
+
+    countries = Country.objects.bulk_create(
+        Country(name=f"Country {i}") for i in range(options["countries"])
+    )
+    airports = Airport.objects.bulk_create(
+        Airport(
+            name=f"Airport {i}",
+            near_city=f"City {i}",
+            country=countries[i % len(countries)],
+        )
+        for i in range(options["airports"])
+    )
+    pairs = set()
+    while len(pairs) < options["routes"]:
+        departure, destination = rng.sample(airports, 2)
+        pairs.add((departure, destination))
+    routes = Route.objects.bulk_create(
+        Route(
+            departure=departure,
+            destination=destination,
+            distance=rng.randint(200, 5000),
+        )
+        for departure, destination in pairs
+    )
+
+    crew = Crew.objects.bulk_create(
+        Crew(first_name=f"First {i}", last_name=f"Last {i}") for i in range(20)
+    )
+    start = timezone.now().replace(minute=0, second=0, microsecond=0)
+    flights = []
+    for _ in range(options["flights"]):
+        departure_time = start + timedelta(hours=rng.randint(1, 24 * 60))
+        flights.append(
+            Flight(
+                route=rng.choice(routes),
+                airplane=rng.choice(airplanes),
+                departure_time=departure_time,
+                arrival_time=departure_time
+                + timedelta(minutes=rng.randint(60, 600)),
+            )
+        )
+    flights = Flight.objects.bulk_create(flights)
+    Flight.crew.through.objects.bulk_create(
+        Flight.crew.through(flight=flight, crew=member)
+        for flight in flights
+        for member in rng.sample(crew, 2)
+    )
+
+    free_seats = [
+        (flight, cabin, seat)
+        for flight in flights
+        for cabin in cabins
+        for seat in range(1, cabin.seats + 1)
+    ]
+    rng.shuffle(free_seats)
+    sold = [free_seats.pop() for _ in range(options["tickets"])]
+    orders = Order.objects.bulk_create(
+        Order(user=users["user"]) for _ in range(0, len(sold), 4)
+    )
+    Ticket.objects.bulk_create(
+        Ticket(order=orders[i // 4], flight=flight, cabin=cabin, seat=seat)
+        for i, (flight, cabin, seat) in enumerate(sold)
+    )
+    sync_seat_counters(Flight.objects.all(), recount=True)
+    refresh_search_rows(Flight.objects.all())
+
+    return {
+        "users": users,
+        "seat_class": seat_classes[0],
+        "cabins": cabins,
+        "airplane_type": airplane_type,
+        "airplane": airplanes[0],
+        "country": countries[0],
+        "airports": airports,
+        "route": routes[0],
+        "crew": crew,
+        "flight": flights[0],
+        "free_seats": free_seats,
+    }
+
+
+def add_seed_arguments(parser):
+    parser.add_argument("--flights", type=int, default=2000)
+    parser.add_argument("--tickets", type=int, default=10000)
+    parser.add_argument("--routes", type=int, default=200)
+    parser.add_argument("--airports", type=int, default=50)
+    parser.add_argument("--countries", type=int, default=10)
+    parser.add_argument("--airplanes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+@contextmanager
+def seeded_test_database(options, stdout):
+    """Create a throwaway test database, seed it and yield the seeded
+    objects. Throttling is off and uploads go to a temporary directory"""
+    if options["routes"] > options["airports"] * (options["airports"] - 1):
+        raise CommandError("Too many routes for the number of airports")
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True
+    )
+    media_root = tempfile.TemporaryDirectory()
+    try:
+        with media_root, override_settings(
+            MEDIA_ROOT=media_root.name
+        ), mock.patch.object(
+            APIView, "check_throttles", lambda self, request: None
+        ), mock.patch.object(
+            AsyncAPIView, "check_throttles", lambda self, request: None
+        ):
+            stdout.write("Seeding the database...")
+            data = seed(options)
+            cache.clear()
+            yield data
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
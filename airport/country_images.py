@@ -0,0 +1,110 @@
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from airport.models import Country
+from airport.response_cache import invalidate_catalog
+
+WIDTHS = (320, 640, 1280)
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+QUALITY = 80
+DERIVED_PATH = "uploads/countries/derived/"
+
+executor = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="country-images"
+)
+
+
+def build_image_variants(image_name):
+    """Resize the stored image to every width up to its own in every
+    format. Files are named by the hash of the source, so existing ones
+    are reused and may be cached forever"""
+    with default_storage.open(image_name) as file:
+        content = file.read()
+
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    source = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+    source = source.convert("RGB")
+    widths = sorted({min(width, source.width) for width in WIDTHS})
+
+    variants = {"source": image_name}
+    for extension, (image_format, _) in FORMATS.items():
+        variants[extension] = {}
+        for width in widths:
+            name = os.path.join(DERIVED_PATH, f"{digest}-{width}w.{extension}")
+            if not default_storage.exists(name):
+                height = max(round(source.height * width / source.width), 1)
+                output = io.BytesIO()
+                source.resize((width, height), Image.LANCZOS).save(
+                    output, format=image_format, quality=QUALITY
+                )
+                default_storage.save(name, ContentFile(output.getvalue()))
+            variants[extension][width] = name
+
+    return variants
+
+
+def generate_image_variants(country_id):
+    """Build the variants of the current image of the country, unless
+    another image was uploaded meanwhile"""
+    image_name = (
+        Country.objects.filter(pk=country_id)
+        .values_list("image", flat=True)
+        .first()
+    )
+    if not image_name:
+        return
+
+    variants = build_image_variants(image_name)
+    if Country.objects.filter(pk=country_id, image=image_name).update(
+        image_variants=variants
+    ):
+        invalidate_catalog()
+
+
+def generate_in_background(country_id):
+    try:
+        generate_image_variants(country_id)
+    finally:
+        # connections of the worker thread aren't closed by any request
+        connections.close_all()
+
+
+def schedule_image_variants(country):
+    """Build the variants in a background thread once the uploaded image
+    is committed"""
+    transaction.on_commit(
+        lambda: executor.submit(generate_in_background, country.id)
+    )
+
+
+def image_srcset(country, url):
+    """Fallback src and srcset of every format of the country image, url
+    builds the URL of a stored file. Until the variants are built, the
+    original image is the only source"""
+    if not country.image:
+        return None
+
+    variants = country.image_variants or {}
+    if variants.get("source") != country.image.name:
+        return {"src": url(country.image.name), "srcset": {}}
+
+    jpeg = variants["jpeg"]
+    return {
+        "src": url(jpeg[max(jpeg, key=int)]),
+        "srcset": {
+            content_type: ", ".join(
+                f"{url(name)} {width}w"
+                for width, name in sorted(
+                    variants[extension].items(), key=lambda item: int(item[0])
+                )
+            )
+            for extension, (_, content_type) in FORMATS.items()
+        },
+    }
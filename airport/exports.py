@@ -0,0 +1,140 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from airport.models import Order, Ticket
+
+KINDS = ("orders", "tickets")
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+
+def parse_time_bound(value, end=False):
+    """Parse an ISO datetime or date, a date as the end of the window
+    includes the whole day"""
+    # parse_datetime takes a bare date for midnight, so dates go first
+    day = parse_date(value)
+    if day is not None:
+        try:
+            moment = datetime.combine(
+                day + timedelta(days=1) if end else day, time.min
+            )
+        except OverflowError:
+            raise ValueError(f"Date '{value}' is out of range")
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Invalid date or datetime '{value}'")
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def get_rows(kind, created_from=None, created_to=None):
+    """values() of orders or tickets of the orders created in the
+    half-open [created_from, created_to) window"""
+    if kind == "orders":
+        prefix = ""
+        queryset = Order.objects.values(
+            "id",
+            "created_at",
+            user_email=F("user__email"),
+            ticket_count=Count("tickets"),
+        ).order_by("created_at", "id")
+    else:
+        prefix = "order__"
+        queryset = Ticket.objects.values(
+            "id",
+            "order_id",
+            "flight_id",
+            "seat",
+            order_created_at=F("order__created_at"),
+            user_email=F("order__user__email"),
+            departure_time=F("flight__departure_time"),
+            departure=F("flight__route__departure__name"),
+            destination=F("flight__route__destination__name"),
+            cabin_name=F("cabin__name"),
+            seat_class=F("cabin__seat_class__name"),
+        ).order_by("order__created_at", "order_id", "id")
+
+    created_at = f"{prefix}created_at"
+    if created_from:
+        queryset = queryset.filter(**{f"{created_at}__gte": created_from})
+    if created_to:
+        queryset = queryset.filter(**{f"{created_at}__lt": created_to})
+
+    return queryset
+
+
+class Echo:
+    """File-like object returning what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def render_ndjson(fields, rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def render_csv(fields, rows):
+    writer = csv.DictWriter(Echo(), fieldnames=fields)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def buffered(lines):
+    """Join lines into chunks of about BUFFER_SIZE bytes"""
+    buffer = []
+    size = 0
+    for line in lines:
+        line = line.encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(
+    kind, export_format, created_from=None, created_to=None, compress=False
+):
+    """Bytes of the export, produced as the rows are fetched so memory use
+    doesn't depend on the number of rows"""
+    render = render_csv if export_format == "csv" else render_ndjson
+    queryset = get_rows(kind, created_from, created_to)
+    fields = [
+        *queryset.query.extra_select,
+        *queryset.query.values_select,
+        *queryset.query.annotation_select,
+    ]
+    chunks = buffered(render(fields, queryset.iterator(chunk_size=CHUNK_SIZE)))
+    return gzipped(chunks) if compress else chunks
+
+
+def export_filename(kind, export_format, compress=False):
+    filename = f"{kind}-{timezone.now():%Y%m%d%H%M%S}.{export_format}"
+    return f"{filename}.gz" if compress else filename
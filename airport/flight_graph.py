@@ -0,0 +1,326 @@
+import copy
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from airport_api.db_routing import primary_reads
+from airport.models import Flight
+
+VERSION_KEY = "airport:flight-graph:version"
+# More pending changes than that are applied by rebuilding the graph
+MAX_CHANGES = 1000
+CHANGE_TIMEOUT = 24 * 60 * 60
+CHUNK_SIZE = 5000
+
+# Times are POSIX timestamps, legs sort by departure
+Leg = namedtuple(
+    "Leg",
+    ("departure", "flight_id", "arrival", "origin", "destination"),
+)
+
+
+def change_key(version):
+    return f"airport:flight-graph:change:{version}"
+
+
+def _add_version():
+    # a random start, so graphs built before the counter was evicted don't
+    # match the new one and are rebuilt
+    cache.add(VERSION_KEY, uuid.uuid4().int >> 80, None)
+
+
+def get_change_version():
+    """Number of the last recorded change"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        _add_version()
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def _record_change(kind, ids):
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        _add_version()
+        version = cache.incr(VERSION_KEY)
+    cache.set(change_key(version), (kind, ids), CHANGE_TIMEOUT)
+
+
+def record_change(kind, ids):
+    """Log changed flights or routes for the graphs of every process once
+    the transaction is committed, so they reload the committed rows"""
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: _record_change(kind, ids))
+
+
+def flights_changed(flight_ids):
+    record_change("flights", flight_ids)
+
+
+def routes_changed(route_ids):
+    record_change("routes", route_ids)
+
+
+def _as_leg(row):
+    flight_id, origin, destination, departure, arrival = row
+    return Leg(
+        departure.timestamp(),
+        flight_id,
+        arrival.timestamp(),
+        origin,
+        destination,
+    )
+
+
+def _flight_rows(flights):
+    return flights.order_by().values_list(
+        "id",
+        "route__departure_id",
+        "route__destination_id",
+        "departure_time",
+        "arrival_time",
+    )
+
+
+class FlightGraph:
+    """Airports as nodes and flights as edges, the flights leaving each
+    airport are kept sorted by departure, so the connections of a leg are
+    found by bisection. Flights which departed before the graph was built
+    are left out. A graph isn't changed once built, changes give a new
+    graph, so searches running on it are not disturbed"""
+
+    def __init__(self, version=0):
+        self.version = version
+        self.since = timezone.now() - timedelta(days=1)
+        self.built_at = time.monotonic()
+        self.legs = defaultdict(list)
+        self.flights = {}
+
+    @classmethod
+    def build(cls):
+        # read the version first, changes made while loading are applied
+        # again by the next refresh
+        graph = cls(get_change_version())
+        flights = Flight.objects.filter(departure_time__gte=graph.since)
+        with primary_reads():
+            for row in _flight_rows(flights).iterator(chunk_size=CHUNK_SIZE):
+                leg = _as_leg(row)
+                graph.flights[leg.flight_id] = leg
+                graph.legs[leg.origin].append(leg)
+
+        for legs in graph.legs.values():
+            legs.sort()
+        return graph
+
+    def reload(self, flight_ids):
+        """Copy of the graph with the flights loaded again, the lists of
+        legs of airports without changed flights are shared with it"""
+        flights = Flight.objects.filter(
+            id__in=flight_ids, departure_time__gte=self.since
+        )
+        with primary_reads():
+            legs = [_as_leg(row) for row in _flight_rows(flights)]
+
+        graph = copy.copy(self)
+        graph.flights = dict(self.flights)
+        graph.legs = defaultdict(list, self.legs)
+        copied = set()
+
+        def departing_legs(airport_id):
+            if airport_id not in copied:
+                copied.add(airport_id)
+                graph.legs[airport_id] = list(graph.legs[airport_id])
+            return graph.legs[airport_id]
+
+        for flight_id in flight_ids:
+            leg = graph.flights.pop(flight_id, None)
+            if leg:
+                origin_legs = departing_legs(leg.origin)
+                del origin_legs[bisect_left(origin_legs, leg)]
+
+        for leg in legs:
+            graph.flights[leg.flight_id] = leg
+            insort(departing_legs(leg.origin), leg)
+        return graph
+
+    def apply(self, changes):
+        """Graph with the flights of logged changes reloaded, routes
+        changes reload the flights of the routes"""
+        flight_ids = set()
+        route_ids = set()
+        for kind, ids in changes:
+            (flight_ids if kind == "flights" else route_ids).update(ids)
+
+        if route_ids:
+            with primary_reads():
+                flight_ids.update(
+                    Flight.objects.filter(route_id__in=route_ids)
+                    .order_by()
+                    .values_list("id", flat=True)
+                )
+        return self.reload(list(flight_ids))
+
+    def expired(self):
+        """Whether the graph may miss changes of other processes, which
+        are only seen through a shared cache"""
+        return (
+            not settings.SHARED_CACHE
+            and time.monotonic() - self.built_at > settings.GRAPH_LOCAL_MAX_AGE
+        )
+
+    def is_current(self):
+        return not self.expired() and self.version == get_change_version()
+
+    def refresh(self):
+        """Bring the graph up to the change log, return the graph to use
+        from now on, a new one if changes are missing or too many"""
+        if self.expired():
+            return FlightGraph.build()
+
+        version = get_change_version()
+        if version == self.version:
+            return self
+        if version < self.version or version - self.version > MAX_CHANGES:
+            return FlightGraph.build()
+
+        keys = [change_key(v) for v in range(self.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            return FlightGraph.build()
+
+        graph = self.apply(changes[key] for key in keys)
+        graph.version = version
+        return graph
+
+    def departing(self, airport_id, start, end):
+        """Legs leaving the airport in the [start, end) window"""
+        legs = self.legs.get(airport_id, ())
+        index = bisect_left(legs, start, key=lambda leg: leg.departure)
+        while index < len(legs) and legs[index].departure < end:
+            yield legs[index]
+            index += 1
+
+    def search(
+        self,
+        origins,
+        destinations,
+        start,
+        end,
+        max_stops=1,
+        min_connection=None,
+        max_connection=None,
+        limit=20,
+    ):
+        """Itineraries, lists of legs, from any of the origins departing in
+        the [start, end) window to any of the destinations with up to
+        max_stops connections, sorted by total duration. Each connection
+        leaves min_connection to max_connection seconds after the arrival,
+        no airport is visited twice"""
+        if min_connection is None:
+            min_connection = settings.CONNECTION_MIN_MINUTES * 60
+        if max_connection is None:
+            max_connection = settings.CONNECTION_MAX_HOURS * 60 * 60
+
+        # max-heap of the best itineraries found so far by duration, of
+        # equal ones the last found is dropped first
+        best = []
+        found = itertools.count()
+
+        def worst_duration():
+            return -best[0][0] if len(best) == limit else float("inf")
+
+        def visit(itinerary, visited):
+            last = itinerary[-1]
+            first_departure = itinerary[0].departure
+            if last.destination in destinations:
+                entry = (
+                    first_departure - last.arrival,
+                    -next(found),
+                    itinerary,
+                )
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                else:
+                    heapq.heappushpop(best, entry)
+                return
+
+            if len(itinerary) > max_stops:
+                return
+
+            for leg in self.departing(
+                last.destination,
+                last.arrival + min_connection,
+                last.arrival + max_connection,
+            ):
+                # later legs can't arrive before they depart
+                if leg.departure - first_departure >= worst_duration():
+                    break
+                if (
+                    leg.destination not in visited
+                    and leg.arrival - first_departure < worst_duration()
+                ):
+                    visit(itinerary + [leg], visited | {leg.destination})
+
+        for origin in origins:
+            for leg in self.departing(origin, start, end):
+                if leg.destination not in origins and (
+                    leg.arrival - leg.departure < worst_duration()
+                ):
+                    visit([leg], {origin, leg.destination})
+
+        return sorted(
+            (itinerary for _, _, itinerary in best),
+            key=lambda itinerary: (
+                itinerary[-1].arrival - itinerary[0].departure,
+                itinerary[0].departure,
+                len(itinerary),
+            ),
+        )
+
+
+_graph = None
+_lock = threading.Lock()
+
+
+def get_graph():
+    """Graph of the process, built on first use and brought up to date
+    with the change log. One thread updates it at a time, outside of the
+    searches, which keep using the previous graph meanwhile"""
+    global _graph
+
+    graph = _graph
+    if graph is not None and graph.is_current():
+        return graph
+
+    # only the first build is waited for
+    if not _lock.acquire(blocking=graph is None):
+        return graph
+    try:
+        graph = _graph.refresh() if _graph else FlightGraph.build()
+        _graph = graph
+    finally:
+        _lock.release()
+    return graph
+
+
+def search_connections(origins, destinations, start, end, **kwargs):
+    """FlightGraph.search on the graph of the process"""
+    return get_graph().search(
+        set(origins),
+        set(destinations),
+        start.timestamp(),
+        end.timestamp(),
+        **kwargs,
+    )
@@ -0,0 +1,230 @@
+import csv
+import json
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from airport.flight_graph import flights_changed
+from airport.models import Airplane, Crew, Flight, Route
+from airport.response_cache import invalidate_flights
+from airport.search_rows import refresh_search_rows
+from airport.seat_counters import sync_seat_counters
+
+FIELDS = (
+    "departure",
+    "destination",
+    "airplane",
+    "departure_time",
+    "arrival_time",
+)
+AMBIGUOUS = object()
+
+
+def read_rows(file, file_format):
+    """Rows of a text file, CSV with crew names separated by ";" or a JSON
+    list of objects"""
+    if file_format == "json":
+        rows = json.load(file)
+        if not isinstance(rows, list):
+            raise ValueError("JSON must be a list of flights")
+        return rows
+
+    return list(csv.DictReader(file))
+
+
+def _lookup(pairs):
+    """Map natural keys to ids, keys shared by several rows map to
+    AMBIGUOUS"""
+    ids = {}
+    for key, pk in pairs:
+        ids[key] = AMBIGUOUS if key in ids else pk
+    return ids
+
+
+def _parse_time(value):
+    try:
+        moment = parse_datetime(str(value))
+    except ValueError:
+        return None
+
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class FlightImporter:
+    """Resolve routes by departure and destination airport names,
+    airplanes by name and crew by full name with maps loaded once, and
+    insert valid flights with their crew in batches. Invalid rows are
+    reported by their number and skipped"""
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.routes = _lookup(
+            ((departure, destination), pk)
+            for pk, departure, destination in Route.objects.values_list(
+                "id", "departure__name", "destination__name"
+            )
+        )
+        self.airplanes = _lookup(Airplane.objects.values_list("name", "id"))
+        self.crew = _lookup(
+            (f"{first_name} {last_name}", pk)
+            for pk, first_name, last_name in Crew.objects.values_list(
+                "id", "first_name", "last_name"
+            )
+        )
+
+    def resolve(self, lookup, key, name, errors):
+        """Id of the key, errors of several keys of the same name are
+        joined, so every unknown crew member of a row is reported"""
+        pk = lookup.get(key)
+        error = None
+        if pk is None:
+            error = f"No {name} {key!r}"
+        elif pk is AMBIGUOUS:
+            error = f"{key!r} matches several {name} records"
+
+        if error:
+            errors[name] = (
+                f"{errors[name]}; {error}" if name in errors else error
+            )
+        return pk
+
+    def parse_row(self, row):
+        """Flight and crew ids of the row, or its errors"""
+        if not isinstance(row, dict):
+            return None, None, {"row": "Must be an object"}
+
+        errors = {
+            field: "This field is required."
+            for field in FIELDS
+            if not row.get(field)
+        }
+        if errors:
+            return None, None, errors
+
+        route_id = self.resolve(
+            self.routes,
+            (str(row["departure"]), str(row["destination"])),
+            "route",
+            errors,
+        )
+        airplane_id = self.resolve(
+            self.airplanes, str(row["airplane"]), "airplane", errors
+        )
+
+        crew = row.get("crew") or []
+        if isinstance(crew, str):
+            crew = crew.split(";")
+        if not isinstance(crew, list):
+            errors["crew"] = "Must be a list of names"
+            crew = []
+        crew_ids = {
+            self.resolve(self.crew, str(name).strip(), "crew", errors)
+            for name in crew
+            if str(name).strip()
+        }
+
+        departure_time = _parse_time(row["departure_time"])
+        arrival_time = _parse_time(row["arrival_time"])
+        if departure_time is None:
+            errors["departure_time"] = "Must be an ISO 8601 datetime"
+        if arrival_time is None:
+            errors["arrival_time"] = "Must be an ISO 8601 datetime"
+        elif departure_time and arrival_time <= departure_time:
+            errors["arrival_time"] = "Must be after departure_time"
+
+        if errors:
+            return None, None, errors
+
+        flight = Flight(
+            route_id=route_id,
+            airplane_id=airplane_id,
+            departure_time=departure_time,
+            arrival_time=arrival_time,
+        )
+        return flight, crew_ids, None
+
+    def existing_flights(self, flights):
+        """(route_id, airplane_id, departure_time) of the flights which
+        already exist, looked up batch by batch on the routes, airplanes
+        and departure times of the batch"""
+        existing = set()
+        for start in range(0, len(flights), self.batch_size):
+            batch = flights[start : start + self.batch_size]
+            existing.update(
+                Flight.objects.filter(
+                    route_id__in={flight.route_id for flight in batch},
+                    airplane_id__in={flight.airplane_id for flight in batch},
+                    departure_time__in={
+                        flight.departure_time for flight in batch
+                    },
+                )
+                .order_by()
+                .values_list("route_id", "airplane_id", "departure_time")
+            )
+        return existing
+
+    def run(self, rows):
+        """Import the rows, return the number of created flights and
+        errors by row number, starting from 1"""
+        errors = {}
+        parsed = []
+        for number, row in enumerate(rows, start=1):
+            flight, crew_ids, row_errors = self.parse_row(row)
+            if row_errors:
+                errors[number] = row_errors
+            else:
+                parsed.append((number, flight, crew_ids))
+
+        seen = self.existing_flights([flight for _, flight, _ in parsed])
+        valid = []
+        for number, flight, crew_ids in parsed:
+            key = (flight.route_id, flight.airplane_id, flight.departure_time)
+            if key in seen:
+                errors[number] = {"row": "Flight already exists"}
+            else:
+                seen.add(key)
+                valid.append((flight, crew_ids))
+
+        created_ids = []
+        for start in range(0, len(valid), self.batch_size):
+            created_ids.extend(
+                create_flights(valid[start : start + self.batch_size])
+            )
+
+        if created_ids:
+            invalidate_flights([])
+
+        return len(created_ids), errors
+
+
+@transaction.atomic
+def create_flights(batch):
+    """Insert (flight, crew ids) pairs with bulk_create and fill seat
+    counters of the flights, return their ids"""
+    flights = Flight.objects.bulk_create([flight for flight, _ in batch])
+    Flight.crew.through.objects.bulk_create(
+        [
+            Flight.crew.through(flight_id=flight.id, crew_id=crew_id)
+            for flight, (_, crew_ids) in zip(flights, batch)
+            for crew_id in crew_ids
+        ]
+    )
+    ids = [flight.id for flight in flights]
+    # bulk_create doesn't send post_save, which fills seat counters and
+    # search rows
+    sync_seat_counters(Flight.objects.filter(id__in=ids))
+    refresh_search_rows(Flight.objects.filter(id__in=ids))
+    flights_changed(ids)
+    return ids
+
+
+def format_errors(errors):
+    """Errors by row number as readable lines"""
+    return [
+        f"Row {number}: "
+        + "; ".join(f"{field}: {error}" for field, error in row.items())
+        for number, row in sorted(errors.items())
+    ]
@@ -0,0 +1,555 @@
+import io
+import json
+import time
+import uuid
+from datetime import timedelta
+from itertools import count
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from airport.benchmark import (
+    PASSWORD,
+    PERCENTILES,
+    add_seed_arguments,
+    percentile,
+    seeded_test_database,
+)
+from airport.models import FlightSchedule
+
+
+def upload_image():
+    image = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(image, format="PNG")
+    return {
+        "image": SimpleUploadedFile(
+            "bench.png", image.getvalue(), content_type="image/png"
+        )
+    }
+
+
+def endpoints(data):
+    """(name, user, request) of every endpoint, where request(i) returns
+    method, url, payload and payload format of the i-th call"""
+    flight = data["flight"]
+    route = data["route"]
+    user = data["users"]["user"]
+    free_seats = data["free_seats"]
+
+    def next_seat():
+        if not free_seats:
+            raise CommandError("Out of free seats, seed more flights")
+        return free_seats.pop()
+
+    def hold_request(i):
+        seat_flight, cabin, seat = next_seat()
+        return (
+            "post",
+            reverse("airport:flight-holds", args=[seat_flight.id]),
+            {"seats": [{"cabin": cabin.id, "seat": seat}]},
+            "json",
+        )
+
+    def order_request(i):
+        seat_flight, cabin, seat = next_seat()
+        return (
+            "post",
+            reverse("airport:order-list"),
+            {
+                "tickets": [
+                    {"flight": seat_flight.id, "cabin": cabin.id, "seat": seat}
+                ]
+            },
+            "json",
+        )
+
+    def flight_payload(i):
+        return {
+            "route": route.id,
+            "airplane": data["airplane"].id,
+            "crew": [member.id for member in data["crew"][:2]],
+            "departure_time": flight.departure_time + timedelta(days=i),
+            "arrival_time": flight.arrival_time + timedelta(days=i),
+        }
+
+    def import_payload(i):
+        return [
+            {
+                "departure": route.departure.name,
+                "destination": route.destination.name,
+                "airplane": data["airplane"].name,
+                "departure_time": flight.departure_time
+                + timedelta(days=i, minutes=day * 5),
+                "arrival_time": flight.arrival_time
+                + timedelta(days=i, minutes=day * 5),
+                "crew": [str(member) for member in data["crew"][:2]],
+            }
+            for day in range(10)
+        ]
+
+    def schedule_payload(i):
+        return {
+            "route": route.id,
+            "airplane": data["airplane"].id,
+            "crew": [member.id for member in data["crew"][:2]],
+            "weekdays": [i % 7],
+            "departure_time": f"{i % 24:02}:15",
+            "duration": "02:00:00",
+            "timezone": "UTC",
+            "valid_from": flight.departure_time.date().isoformat(),
+        }
+
+    def schedule_update(i):
+        schedule = FlightSchedule.objects.order_by("id").last()
+        if not schedule:
+            raise CommandError("No flight schedule, run the create first")
+        return (
+            "patch",
+            reverse("airport:flightschedule-detail", args=[schedule.id]),
+            {"departure_time": f"{i % 24:02}:45"},
+            "json",
+        )
+
+    def get(url, params=None):
+        return lambda i: ("get", url, params, None)
+
+    def post(url, payload, format_="json"):
+        return lambda i: ("post", url, payload(i), format_)
+
+    flight_list = reverse("airport:flight-list")
+    schedule_list = reverse("airport:flightschedule-list")
+    place = data["airports"][0].near_city
+    between = {
+        "from": route.departure.near_city,
+        "to": route.destination.near_city,
+    }
+    day = flight.departure_time.date()
+
+    return [
+        ("api-root", "admin", get(reverse("airport:api-root"))),
+        (
+            "airplane-types:list",
+            "admin",
+            get(reverse("airport:airplanetype-list")),
+        ),
+        (
+            "airplane-types:create",
+            "admin",
+            post(
+                reverse("airport:airplanetype-list"),
+                lambda i: {"name": f"Type {i}"},
+            ),
+        ),
+        (
+            "seat-classes:list",
+            "admin",
+            get(reverse("airport:seatclass-list")),
+        ),
+        (
+            "seat-classes:create",
+            "admin",
+            post(
+                reverse("airport:seatclass-list"),
+                lambda i: {"name": f"Class {i}"},
+            ),
+        ),
+        ("cabins:list", "admin", get(reverse("airport:cabin-list"))),
+        (
+            "cabins:create",
+            "admin",
+            post(
+                reverse("airport:cabin-list"),
+                lambda i: {
+                    "name": f"Cabin {i}",
+                    "seat_class": data["seat_class"].id,
+                    "seats": 10,
+                },
+            ),
+        ),
+        ("airplanes:list", "admin", get(reverse("airport:airplane-list"))),
+        (
+            "airplanes:create",
+            "admin",
+            post(
+                reverse("airport:airplane-list"),
+                lambda i: {
+                    "name": f"Airplane {i}",
+                    "airplane_type": data["airplane_type"].id,
+                    "cabins": [cabin.id for cabin in data["cabins"]],
+                },
+            ),
+        ),
+        ("countries:list", "admin", get(reverse("airport:country-list"))),
+        (
+            "countries:create",
+            "admin",
+            post(
+                reverse("airport:country-list"),
+                lambda i: {"name": f"Country {i}"},
+            ),
+        ),
+        (
+            "countries:upload-image",
+            "admin",
+            post(
+                reverse(
+                    "airport:country-upload-image", args=[data["country"].id]
+                ),
+                lambda i: upload_image(),
+                "multipart",
+            ),
+        ),
+        ("airports:list", "admin", get(reverse("airport:airport-list"))),
+        (
+            "airports:create",
+            "admin",
+            post(
+                reverse("airport:airport-list"),
+                lambda i: {
+                    "name": f"Airport {i}",
+                    "near_city": f"City {i}",
+                    "country": data["country"].id,
+                },
+            ),
+        ),
+        ("routes:list", "admin", get(reverse("airport:route-list"))),
+        (
+            "routes:retrieve",
+            "admin",
+            get(reverse("airport:route-detail", args=[route.id])),
+        ),
+        (
+            "routes:create",
+            "admin",
+            post(
+                reverse("airport:route-list"),
+                lambda i: {
+                    "departure": route.departure_id,
+                    "destination": route.destination_id,
+                    "distance": 100 + i,
+                },
+            ),
+        ),
+        ("crew:list", "admin", get(reverse("airport:crew-list"))),
+        (
+            "routes:plan",
+            "admin",
+            get(reverse("airport:route-plan"), between),
+        ),
+        (
+            "crew:create",
+            "admin",
+            post(
+                reverse("airport:crew-list"),
+                lambda i: {"first_name": "Bench", "last_name": f"Crew {i}"},
+            ),
+        ),
+        ("flights:list", "user", get(flight_list)),
+        (
+            "flights:list:places",
+            "user",
+            get(flight_list, {"from": place}),
+        ),
+        (
+            "flights:list:date",
+            "user",
+            get(
+                flight_list,
+                {"date": flight.departure_time.date().isoformat()},
+            ),
+        ),
+        (
+            "flights:list:cursor",
+            "user",
+            get(flight_list, {"pagination": "cursor"}),
+        ),
+        (
+            "flights:calendar",
+            "user",
+            get(
+                reverse("airport:flight-calendar"),
+                {"month": day.strftime("%Y-%m")},
+            ),
+        ),
+        (
+            "flights:connections",
+            "user",
+            get(
+                reverse("airport:flight-connections"),
+                {**between, "date": day.isoformat()},
+            ),
+        ),
+        (
+            "flights:retrieve",
+            "user",
+            get(reverse("airport:flight-detail", args=[flight.id])),
+        ),
+        (
+            "flights:seats",
+            "user",
+            get(reverse("airport:flight-seats", args=[flight.id])),
+        ),
+        ("flights:holds", "user", hold_request),
+        (
+            "flights:cache-stats",
+            "admin",
+            get(reverse("airport:flight-cache-stats")),
+        ),
+        ("flights:create", "admin", post(flight_list, flight_payload)),
+        (
+            "flights:update",
+            "admin",
+            lambda i: (
+                "put",
+                reverse("airport:flight-detail", args=[flight.id]),
+                flight_payload(0),
+                "json",
+            ),
+        ),
+        (
+            "flights:import",
+            "admin",
+            post(reverse("airport:flight-bulk-import"), import_payload),
+        ),
+        ("flight-schedules:list", "admin", get(schedule_list)),
+        (
+            "flight-schedules:create",
+            "admin",
+            post(schedule_list, schedule_payload),
+        ),
+        ("flight-schedules:update", "admin", schedule_update),
+        ("orders:list", "user", get(reverse("airport:order-list"))),
+        ("orders:create", "user", order_request),
+        (
+            "orders:export",
+            "admin",
+            get(reverse("airport:order-export")),
+        ),
+        (
+            "orders:export:tickets",
+            "admin",
+            get(
+                reverse("airport:order-export"),
+                {"kind": "tickets", "export_format": "csv"},
+            ),
+        ),
+        (
+            "user:register",
+            None,
+            post(
+                reverse("user:create"),
+                lambda i: {
+                    "email": f"{uuid.uuid4().hex}@bench.com",
+                    "password": PASSWORD,
+                },
+            ),
+        ),
+        (
+            "user:token",
+            None,
+            post(
+                reverse("user:token_obtain_pair"),
+                lambda i: {"email": "user@bench.com", "password": PASSWORD},
+            ),
+        ),
+        (
+            "user:token-refresh",
+            None,
+            post(
+                reverse("user:token_refresh"),
+                lambda i: {"refresh": str(RefreshToken.for_user(user))},
+            ),
+        ),
+        (
+            "user:token-verify",
+            None,
+            post(
+                reverse("user:token_verify"),
+                lambda i: {"token": str(AccessToken.for_user(user))},
+            ),
+        ),
+        ("user:me", "user", get(reverse("user:manage"))),
+        (
+            "user:me:update",
+            "user",
+            lambda i: (
+                "patch",
+                reverse("user:manage"),
+                {"email": "user@bench.com"},
+                "json",
+            ),
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and measure latency percentiles, "
+        "SQL queries and response sizes of every API endpoint"
+    )
+
+    def add_arguments(self, parser):
+        add_seed_arguments(parser)
+        parser.add_argument("--repeat", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the cache before every request",
+        )
+        parser.add_argument(
+            "--only",
+            action="append",
+            default=[],
+            help="Run only endpoints which names start with the prefix",
+        )
+        parser.add_argument("--save", help="Write results to a JSON file")
+        parser.add_argument(
+            "--compare", help="Compare results with a saved JSON file"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=10.0,
+            help="Latency change in percent reported as a regression",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error if any endpoint regressed",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)
+
+        with seeded_test_database(options, self.stdout) as data:
+            results = self.run_endpoints(data, options)
+
+        self.report(results, baseline, options)
+
+        if options["save"]:
+            with open(options["save"], "w") as file:
+                json.dump(
+                    {
+                        "options": {
+                            key: options[key]
+                            for key in (
+                                "flights",
+                                "tickets",
+                                "routes",
+                                "airports",
+                                "repeat",
+                                "cold",
+                            )
+                        },
+                        "results": results,
+                    },
+                    file,
+                    indent=2,
+                )
+            self.stdout.write(f"Saved results to {options['save']}")
+
+    def run_endpoints(self, data, options):
+        clients = {None: APIClient()}
+        for name, user in data["users"].items():
+            clients[name] = APIClient()
+            clients[name].credentials(
+                HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+            )
+
+        results = {}
+        calls = count()
+
+        for name, user, build_request in endpoints(data):
+            if options["only"] and not name.startswith(tuple(options["only"])):
+                continue
+
+            timings, queries, sizes = [], [], []
+            for i in range(options["warmup"] + options["repeat"]):
+                method, url, payload, format_ = build_request(next(calls))
+                if options["cold"]:
+                    cache.clear()
+
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = getattr(clients[user], method)(
+                        url, payload, format=format_
+                    )
+                    if response.streaming:
+                        content = b"".join(response.streaming_content)
+                    else:
+                        content = response.content
+                    elapsed = (time.perf_counter() - start) * 1000
+
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f"{name}: {method.upper()} {url} returned "
+                        f"{response.status_code} {content[:500]!r}"
+                    )
+
+                if i >= options["warmup"]:
+                    timings.append(elapsed)
+                    queries.append(len(context.captured_queries))
+                    sizes.append(len(content))
+
+            timings.sort()
+            results[name] = {
+                **{
+                    f"p{percent}": round(percentile(timings, percent), 3)
+                    for percent in PERCENTILES
+                },
+                "queries": max(queries),
+                "bytes": round(sum(sizes) / len(sizes)),
+            }
+
+        return results
+
+    def report(self, results, baseline, options):
+        baseline_results = baseline["results"] if baseline else {}
+        header = (
+            f"{'endpoint':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            f"{'queries':>9}{'bytes':>10}"
+        )
+        if baseline:
+            header += f"{'p50 diff':>11}{'queries diff':>14}"
+        self.stdout.write(header)
+
+        regressions = []
+        for name, result in results.items():
+            line = (
+                f"{name:<28}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+                f"{result['p99']:>10.2f}{result['queries']:>9}"
+                f"{result['bytes']:>10}"
+            )
+            old = baseline_results.get(name)
+            if old:
+                change = (result["p50"] - old["p50"]) / old["p50"] * 100
+                queries = result["queries"] - old["queries"]
+                line += f"{change:>+10.1f}%{queries:>+14}"
+                if change > options["threshold"] or queries > 0:
+                    regressions.append(name)
+                    line = self.style.ERROR(line)
+                elif change < -options["threshold"] or queries < 0:
+                    line = self.style.SUCCESS(line)
+            elif baseline:
+                line += f"{'new':>11}"
+            self.stdout.write(line)
+
+        if regressions:
+            message = f"Regressed: {', '.join(regressions)}"
+            if options["fail_on_regression"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
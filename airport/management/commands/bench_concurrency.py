@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from airport.benchmark import (
+    PERCENTILES,
+    add_seed_arguments,
+    percentile,
+    seeded_test_database,
+)
+
+ENDPOINTS = ("flights", "flight", "airports", "routes")
+
+
+def endpoint_paths(flight_id, route_id):
+    """Sync and async path of every benchmarked endpoint"""
+    return {
+        "flights": (
+            reverse("airport:flight-list"),
+            reverse("airport-async:flight-list"),
+        ),
+        "flight": (
+            reverse("airport:flight-detail", args=[flight_id]),
+            reverse("airport-async:flight-detail", args=[flight_id]),
+        ),
+        "airports": (
+            reverse("airport:airport-list"),
+            reverse("airport-async:airport-list"),
+        ),
+        "routes": (
+            reverse("airport:route-detail", args=[route_id]),
+            reverse("airport-async:route-detail", args=[route_id]),
+        ),
+    }
+
+
+async def run_level(fetch, path, concurrency, total):
+    """Send total requests to path from concurrency clients at once"""
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                status = await fetch(path)
+            except Exception:
+                status = None
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        **{
+            f"p{percent}": percentile(latencies, percent)
+            for percent in PERCENTILES
+        },
+        "errors": errors,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of the sync and async read "
+        "endpoints at increasing numbers of concurrent clients"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[100, 500, 1000],
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=2000,
+            help="Requests sent to every endpoint at every concurrency",
+        )
+        parser.add_argument(
+            "--endpoint",
+            choices=ENDPOINTS,
+            action="append",
+            help="Benchmark only these endpoints",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Don't serve flights from the response cache",
+        )
+        parser.add_argument(
+            "--url",
+            help=(
+                "Base URL of a running ASGI server to benchmark over HTTP, "
+                "by default the ASGI application is driven in-process "
+                "against a seeded test database"
+            ),
+        )
+        parser.add_argument(
+            "--token", help="Admin access token for --url, not throttled"
+        )
+        parser.add_argument("--flight-id", type=int, default=1)
+        parser.add_argument("--route-id", type=int, default=1)
+        add_seed_arguments(parser)
+
+    def handle(self, *args, **options):
+        endpoints = options["endpoint"] or ENDPOINTS
+
+        if options["url"]:
+            if not options["token"]:
+                raise CommandError("--url requires --token")
+            paths = endpoint_paths(options["flight_id"], options["route_id"])
+            asyncio.run(self.run_http(paths, endpoints, options))
+            return
+
+        with seeded_test_database(
+            options, self.stdout
+        ) as data, override_settings(
+            FLIGHT_CACHE_TIMEOUT=0 if options["no_cache"] else 300
+        ):
+            paths = endpoint_paths(data["flight"].id, data["route"].id)
+            token = AccessToken.for_user(data["users"]["admin"])
+            headers = {"Authorization": f"Bearer {token}"}
+            client = AsyncClient()
+
+            async def fetch(path):
+                response = await client.get(path, headers=headers)
+                return response.status_code
+
+            asyncio.run(self.run(fetch, paths, endpoints, options))
+
+    async def run_http(self, paths, endpoints, options):
+        import aiohttp
+
+        base_url = options["url"].rstrip("/")
+        headers = {"Authorization": f"Bearer {options['token']}"}
+        connector = aiohttp.TCPConnector(limit=max(options["concurrency"]))
+
+        async with aiohttp.ClientSession(
+            connector=connector, headers=headers
+        ) as session:
+
+            async def fetch(path):
+                async with session.get(base_url + path) as response:
+                    await response.read()
+                    return response.status
+
+            await self.run(fetch, paths, endpoints, options)
+
+    async def run(self, fetch, paths, endpoints, options):
+        self.stdout.write(
+            f"{'endpoint':<10}{'clients':>8}{'view':>7}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+
+        for name in endpoints:
+            for concurrency in options["concurrency"]:
+                rps = {}
+                for view, path in zip(("sync", "async"), paths[name]):
+                    result = await run_level(
+                        fetch, path, concurrency, options["requests"]
+                    )
+                    rps[view] = result["rps"]
+                    line = (
+                        f"{name:<10}{concurrency:>8}{view:>7}"
+                        f"{result['rps']:>10.1f}{result['p50']:>10.1f}"
+                        f"{result['p95']:>10.1f}{result['p99']:>10.1f}"
+                        f"{result['errors']:>8}"
+                    )
+                    self.stdout.write(
+                        self.style.ERROR(line) if result["errors"] else line
+                    )
+
+                self.stdout.write(
+                    f"{'':<25}async/sync {rps['async'] / rps['sync']:.2f}x"
+                )
@@ -0,0 +1,97 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from airport.benchmark import PERCENTILES, percentile
+from airport.flight_graph import FlightGraph, Leg
+
+
+def synthetic_graph(options):
+    """Graph of random flights between numbered airports, built in memory
+    so timings don't depend on the database"""
+    rng = random.Random(options["seed"])
+    start = datetime(2030, 1, 1, tzinfo=timezone.utc).timestamp()
+    graph = FlightGraph()
+
+    for flight_id in range(1, options["flights"] + 1):
+        origin, destination = rng.sample(range(options["airports"]), 2)
+        departure = start + rng.randrange(options["days"] * 24 * 60) * 60
+        leg = Leg(
+            departure,
+            flight_id,
+            departure + rng.randint(60, 600) * 60,
+            origin,
+            destination,
+        )
+        graph.flights[flight_id] = leg
+        graph.legs[origin].append(leg)
+
+    for legs in graph.legs.values():
+        legs.sort()
+    return graph, start
+
+
+class Command(BaseCommand):
+    help = (
+        "Time connection searches on an in-memory graph of random flights "
+        "against the latency target"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flights", type=int, default=100000)
+        parser.add_argument("--airports", type=int, default=200)
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--searches", type=int, default=200)
+        parser.add_argument("--max-stops", type=int, default=2)
+        parser.add_argument("--target-ms", type=float, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        build_start = time.perf_counter()
+        graph, start = synthetic_graph(options)
+        self.stdout.write(
+            f"Built a graph of {options['flights']} flights in "
+            f"{(time.perf_counter() - build_start) * 1000:.0f} ms"
+        )
+
+        rng = random.Random(options["seed"])
+        timings = []
+        found = 0
+        for _ in range(options["searches"]):
+            origin, destination = rng.sample(range(options["airports"]), 2)
+            day_start = start + rng.randrange(options["days"]) * 24 * 60 * 60
+            search_start = time.perf_counter()
+            found += bool(
+                graph.search(
+                    {origin},
+                    {destination},
+                    day_start,
+                    day_start + timedelta(days=1).total_seconds(),
+                    max_stops=options["max_stops"],
+                    min_connection=45 * 60,
+                    max_connection=24 * 60 * 60,
+                )
+            )
+            timings.append((time.perf_counter() - search_start) * 1000)
+
+        timings.sort()
+        summary = ", ".join(
+            f"p{percent} {percentile(timings, percent):.2f} ms"
+            for percent in PERCENTILES
+        )
+        self.stdout.write(
+            f"{options['searches']} searches, {found} with connections: "
+            f"{summary}, max {timings[-1]:.2f} ms"
+        )
+
+        target = options["target_ms"]
+        if percentile(timings, 99) <= target:
+            self.stdout.write(
+                self.style.SUCCESS(f"p99 is within the {target:g} ms target")
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING(f"p99 exceeds the {target:g} ms target")
+            )
@@ -0,0 +1,95 @@
+import time
+
+from django.db import connection
+from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+
+from airport.models import Flight, Route
+
+
+def legacy_queryset(departure, destination):
+    """Flight search as it was before the place index"""
+    queryset = Flight.objects.all()
+
+    if departure:
+        queryset = queryset.filter(
+            Q(route__departure__name__icontains=departure)
+            | Q(route__departure__near_city__icontains=departure)
+            | Q(route__departure__country__name__icontains=departure)
+        )
+
+    if destination:
+        queryset = queryset.filter(
+            Q(route__destination__name__icontains=destination)
+            | Q(route__destination__near_city__icontains=destination)
+            | Q(route__destination__country__name__icontains=destination)
+        )
+
+    return queryset
+
+
+def indexed_queryset(departure, destination):
+    return Flight.objects.filter(
+        route_id__in=Route.ids_between(departure, destination)
+    )
+
+
+class Command(BaseCommand):
+    help = "Compare plans and timings of the legacy and indexed place search"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="departure")
+        parser.add_argument("--to", dest="destination")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--page-size", type=int, default=10)
+
+    def handle(self, *args, **options):
+        departure, destination = options["departure"], options["destination"]
+        if not departure and not destination:
+            raise CommandError("Provide --from and/or --to")
+
+        explain_options = {}
+        if connection.vendor == "postgresql":
+            explain_options = {"analyze": True, "buffers": True}
+
+        legacy_ids = set(
+            legacy_queryset(departure, destination).values_list(
+                "id", flat=True
+            )
+        )
+        indexed_ids = set(
+            indexed_queryset(departure, destination).values_list(
+                "id", flat=True
+            )
+        )
+        if legacy_ids != indexed_ids:
+            raise CommandError(
+                f"Results differ: {len(legacy_ids)} legacy flight(s), "
+                f"{len(indexed_ids)} indexed flight(s)"
+            )
+
+        for name, build in (
+            ("legacy", legacy_queryset),
+            ("indexed", indexed_queryset),
+        ):
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                queryset = build(departure, destination)
+                queryset.count()
+                list(queryset[: options["page_size"]])
+                timings.append((time.perf_counter() - start) * 1000)
+
+            timings.sort()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name}: {len(legacy_ids)} flight(s), "
+                    f"min {timings[0]:.2f} ms, "
+                    f"median {timings[len(timings) // 2]:.2f} ms, "
+                    f"max {timings[-1]:.2f} ms"
+                )
+            )
+            self.stdout.write(
+                build(departure, destination).explain(**explain_options)
+            )
+            self.stdout.write("")
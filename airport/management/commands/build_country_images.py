@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from airport.country_images import generate_image_variants
+from airport.models import Country
+
+
+class Command(BaseCommand):
+    help = (
+        "Build resized WebP and JPEG copies of country images which "
+        "don't have them yet"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild the copies of every country image",
+        )
+
+    def handle(self, *args, **options):
+        countries = Country.objects.exclude(image="").exclude(image=None)
+        built = 0
+
+        for country in countries.only("id", "image", "image_variants"):
+            if (
+                options["force"]
+                or country.image_variants.get("source") != country.image.name
+            ):
+                generate_image_variants(country.id)
+                built += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Built images of {built} countries")
+        )
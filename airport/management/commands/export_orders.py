@@ -0,0 +1,60 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from airport import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream orders or tickets created in a time window as NDJSON or "
+        "CSV, optionally gzipped, to a file or stdout"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=exports.KINDS, default="orders")
+        parser.add_argument(
+            "--format",
+            choices=list(exports.FORMATS),
+            default="ndjson",
+            dest="export_format",
+        )
+        parser.add_argument(
+            "--from",
+            dest="created_from",
+            help="Date or time orders are created at or after",
+        )
+        parser.add_argument(
+            "--to",
+            dest="created_to",
+            help="Time orders are created before, or date until which",
+        )
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument(
+            "--output", help="File to write to, stdout by default"
+        )
+
+    def handle(self, *args, **options):
+        window = {}
+        for name in ("created_from", "created_to"):
+            if options[name]:
+                try:
+                    window[name] = exports.parse_time_bound(
+                        options[name], end=name == "created_to"
+                    )
+                except ValueError as error:
+                    raise CommandError(error)
+
+        chunks = exports.export_stream(
+            options["kind"],
+            options["export_format"],
+            compress=options["gzip"],
+            **window,
+        )
+
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                output.writelines(chunks)
+        else:
+            sys.stdout.buffer.writelines(chunks)
+            sys.stdout.flush()
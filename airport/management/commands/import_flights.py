@@ -0,0 +1,47 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from airport.flight_import import FlightImporter, format_errors, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import flights with their crew from a CSV or JSON file. Routes are "
+        "matched by departure and destination airport names, airplanes by "
+        "name and crew by full name, CSV crew names are separated by ';'"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=("csv", "json"),
+            dest="file_format",
+            help="Format of the file, by default from its extension",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        file_format = options["file_format"] or (
+            "json" if options["path"].lower().endswith(".json") else "csv"
+        )
+        if not os.path.isfile(options["path"]):
+            raise CommandError(f"No file {options['path']}")
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as file:
+            try:
+                rows = read_rows(file, file_format)
+            except (ValueError, csv.Error) as error:
+                raise CommandError(f"Can't read {file_format}: {error}")
+
+        created, errors = FlightImporter(options["batch_size"]).run(rows)
+
+        for line in format_errors(errors):
+            self.stderr.write(line)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {created} flight(s), skipped {len(errors)} row(s)"
+            )
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from airport.schedules import materialize_schedules
+
+
+class Command(BaseCommand):
+    help = (
+        "Create flights of recurring schedules up to "
+        "FLIGHT_SCHEDULE_HORIZON_DAYS ahead, run daily to roll the horizon"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = materialize_schedules(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} flight(s)"))
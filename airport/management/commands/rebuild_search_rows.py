@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from airport.models import Flight, FlightSearchRow
+from airport.search_rows import refresh_search_rows
+
+
+class Command(BaseCommand):
+    help = "Rebuild flight search rows from flights and their routes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            refresh_search_rows(
+                Flight.objects.all(), batch_size=options["batch_size"]
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {FlightSearchRow.objects.count()} search row(s)"
+            )
+        )
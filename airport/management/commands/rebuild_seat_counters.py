@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from airport.models import Flight
+from airport.seat_counters import sync_seat_counters
+
+
+class Command(BaseCommand):
+    help = "Rebuild stored seat counters of flights from cabins and tickets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report flights with wrong counters, change nothing",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        verify = options["verify"]
+
+        with transaction.atomic():
+            mismatched = sync_seat_counters(
+                Flight.objects.all(),
+                recount=True,
+                dry_run=verify,
+                batch_size=options["batch_size"],
+            )
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS("Seat counters are correct"))
+            return
+
+        ids = ", ".join(str(flight_id) for flight_id in mismatched[:20])
+        if len(mismatched) > 20:
+            ids += ", ..."
+
+        if verify:
+            raise CommandError(
+                f"{len(mismatched)} flight(s) have wrong seat counters: {ids}"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt seat counters of {len(mismatched)} flight(s): {ids}"
+            )
+        )
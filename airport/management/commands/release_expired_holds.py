@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from airport.seat_holds import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release expired seat holds and return their seats to the flights"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep releasing expired holds every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds(batch_size=options["batch_size"])
+            if released or not options["interval"]:
+                self.stdout.write(
+                    self.style.SUCCESS(f"Released {released} expired hold(s)")
+                )
+
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,109 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:41
+
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_seat_counters(apps, schema_editor):
+    Airplane = apps.get_model("airport", "Airplane")
+    Flight = apps.get_model("airport", "Flight")
+    FlightCabin = apps.get_model("airport", "FlightCabin")
+    Ticket = apps.get_model("airport", "Ticket")
+
+    cabins = defaultdict(dict)
+    for (
+        airplane_id,
+        cabin_id,
+        seats,
+    ) in Airplane.cabins.through.objects.values_list(
+        "airplane_id", "cabin_id", "cabin__seats"
+    ):
+        cabins[airplane_id][cabin_id] = seats
+
+    sold = Counter()
+    flight_sold = Counter()
+    for flight_id, cabin_id, count in (
+        Ticket.objects.values("flight_id", "cabin_id")
+        .annotate(count=Count("id"))
+        .values_list("flight_id", "cabin_id", "count")
+    ):
+        sold[flight_id, cabin_id] = count
+        flight_sold[flight_id] += count
+
+    flights = list(Flight.objects.order_by().only("id", "airplane_id"))
+    counters = []
+    for flight in flights:
+        flight.seats_total = sum(cabins[flight.airplane_id].values())
+        flight.seats_sold = flight_sold[flight.id]
+        counters += [
+            FlightCabin(
+                flight_id=flight.id,
+                cabin_id=cabin_id,
+                seats_total=seats,
+                seats_sold=sold[flight.id, cabin_id],
+            )
+            for cabin_id, seats in cabins[flight.airplane_id].items()
+        ]
+
+    Flight.objects.bulk_update(
+        flights, ["seats_total", "seats_sold"], batch_size=1000
+    )
+    FlightCabin.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("airport", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="flight",
+            name="seats_sold",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="flight",
+            name="seats_total",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="FlightCabin",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("seats_total", models.IntegerField(default=0)),
+                ("seats_sold", models.IntegerField(default=0)),
+                (
+                    "cabin",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="flight_counters",
+                        to="airport.cabin",
+                    ),
+                ),
+                (
+                    "flight",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cabin_counters",
+                        to="airport.flight",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("flight", "cabin")},
+            },
+        ),
+        migrations.RunPython(fill_seat_counters, migrations.RunPython.noop),
+    ]
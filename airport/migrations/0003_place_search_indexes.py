@@ -0,0 +1,39 @@
+from django.db import migrations
+
+TRIGRAM_INDEXES = (
+    ("airport_airport_name_trgm", "airport_airport", "name"),
+    ("airport_airport_near_city_trgm", "airport_airport", "near_city"),
+    ("airport_country_name_trgm", "airport_country", "name"),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Index UPPER(column::text) the way Django compiles icontains lookups
+    on PostgreSQL, so place search can use the indexes"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} "
+            f"USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("airport", "0002_flight_seat_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("airport", "0006_seat_holds"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="country",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
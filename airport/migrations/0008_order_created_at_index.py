@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("airport", "0007_country_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["created_at"], name="airport_ord_created_ff47a7_idx"
+            ),
+        ),
+    ]
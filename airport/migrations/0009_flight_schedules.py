@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("airport", "0008_order_created_at_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FlightSchedule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("weekdays", models.JSONField(default=list)),
+                ("departure_time", models.TimeField()),
+                ("duration", models.DurationField()),
+                ("timezone", models.CharField(default="UTC", max_length=63)),
+                ("valid_from", models.DateField()),
+                ("valid_until", models.DateField(blank=True, null=True)),
+                ("materialized_until", models.DateField(editable=False, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="flightschedule",
+            name="airplane",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to="airport.airplane"
+            ),
+        ),
+        migrations.AddField(
+            model_name="flightschedule",
+            name="crew",
+            field=models.ManyToManyField(
+                blank=True, related_name="schedules", to="airport.crew"
+            ),
+        ),
+        migrations.AddField(
+            model_name="flightschedule",
+            name="route",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to="airport.route"
+            ),
+        ),
+        migrations.AddField(
+            model_name="flight",
+            name="schedule",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="flights",
+                to="airport.flightschedule",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="flight",
+            constraint=models.UniqueConstraint(
+                fields=("schedule", "departure_time"), name="unique_schedule_departure"
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:23
+
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+
+
+def fill_capacity(apps, schema_editor):
+    Airplane = apps.get_model("airport", "Airplane")
+    capacity = Counter()
+    by_class = defaultdict(Counter)
+
+    for airplane_id, seat_class, seats in Airplane.cabins.through.objects.values_list(
+        "airplane_id", "cabin__seat_class__name", "cabin__seats"
+    ):
+        capacity[airplane_id] += seats
+        by_class[airplane_id][seat_class] += seats
+
+    Airplane.objects.bulk_update(
+        [
+            Airplane(
+                id=airplane_id,
+                capacity=capacity[airplane_id],
+                seat_class_capacity=dict(by_class[airplane_id]),
+            )
+            for airplane_id in capacity
+        ],
+        ["capacity", "seat_class_capacity"],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("airport", "0009_flight_schedules"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="airplane",
+            name="capacity",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="airplane",
+            name="seat_class_capacity",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.RunPython(fill_capacity, migrations.RunPython.noop),
+    ]
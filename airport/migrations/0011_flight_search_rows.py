@@ -0,0 +1,181 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:37
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+TABLE = "airport_flightsearchrow"
+TRIGRAM_COLUMNS = (
+    "origin_name",
+    "origin_city",
+    "origin_country_name",
+    "destination_name",
+    "destination_city",
+    "destination_country_name",
+)
+SOURCES = {
+    "route_id": "route_id",
+    "origin_id": "route__departure_id",
+    "origin_name": "route__departure__name",
+    "origin_city": "route__departure__near_city",
+    "origin_country_id": "route__departure__country_id",
+    "origin_country_name": "route__departure__country__name",
+    "destination_id": "route__destination_id",
+    "destination_name": "route__destination__name",
+    "destination_city": "route__destination__near_city",
+    "destination_country_id": "route__destination__country_id",
+    "destination_country_name": "route__destination__country__name",
+    "airplane_id": "airplane_id",
+    "airplane_name": "airplane__name",
+    "departure_time": "departure_time",
+    "arrival_time": "arrival_time",
+}
+
+
+def fill_search_rows(apps, schema_editor):
+    Flight = apps.get_model("airport", "Flight")
+    FlightSearchRow = apps.get_model("airport", "FlightSearchRow")
+    rows = (
+        Flight.objects.order_by()
+        .annotate(
+            available=F("seats_total") - F("seats_sold") - F("seats_held")
+        )
+        .values_list("id", *SOURCES.values(), "available")
+    )
+    batch = []
+
+    for flight_id, *fields, tickets_available in rows.iterator(
+        chunk_size=1000
+    ):
+        batch.append(
+            FlightSearchRow(
+                flight_id=flight_id,
+                tickets_available=tickets_available,
+                **dict(zip(SOURCES, fields)),
+            )
+        )
+        if len(batch) == 1000:
+            FlightSearchRow.objects.bulk_create(batch)
+            batch = []
+
+    FlightSearchRow.objects.bulk_create(batch)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Trigram indexes for icontains place search, as in
+    0003_place_search_indexes"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in TRIGRAM_COLUMNS:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABLE}_{column}_trgm ON {TABLE} "
+            f"USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for column in TRIGRAM_COLUMNS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {TABLE}_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("airport", "0010_airplane_capacity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FlightSearchRow",
+            fields=[
+                (
+                    "flight",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_row",
+                        serialize=False,
+                        to="airport.flight",
+                    ),
+                ),
+                ("origin_name", models.CharField(max_length=63)),
+                ("origin_city", models.CharField(max_length=63)),
+                ("origin_country_name", models.CharField(max_length=63)),
+                ("destination_name", models.CharField(max_length=63)),
+                ("destination_city", models.CharField(max_length=63)),
+                ("destination_country_name", models.CharField(max_length=63)),
+                ("airplane_name", models.CharField(max_length=63)),
+                ("departure_time", models.DateTimeField()),
+                ("arrival_time", models.DateTimeField()),
+                ("tickets_available", models.IntegerField()),
+                (
+                    "airplane",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="airport.airplane",
+                    ),
+                ),
+                (
+                    "destination",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="airport.airport",
+                    ),
+                ),
+                (
+                    "destination_country",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="airport.country",
+                    ),
+                ),
+                (
+                    "origin",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="airport.airport",
+                    ),
+                ),
+                (
+                    "origin_country",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="airport.country",
+                    ),
+                ),
+                (
+                    "route",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="airport.route",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-departure_time"],
+                "indexes": [
+                    models.Index(
+                        fields=["departure_time"], name="airport_fli_departu_5503a1_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_search_rows, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,9 +1,13 @@
+import calendar
 import os
 import uuid
+from collections import defaultdict
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.text import slugify
 
 
@@ -37,14 +41,14 @@ class Airplane(models.Model):
     name = models.CharField(max_length=63)
     cabins = models.ManyToManyField(Cabin, related_name="airplanes")
     airplane_type = models.ForeignKey(AirplaneType, on_delete=models.CASCADE)
+    # Seats of the cabins in total and by seat class name, kept in sync by
+    # signals of cabins and seat classes
+    capacity = models.IntegerField(default=0, editable=False)
+    seat_class_capacity = models.JSONField(default=dict, editable=False)
 
     def __str__(self):
         return self.name
 
-    @property
-    def capacity(self):
-        return sum(cabin.seats for cabin in self.cabins.all())
-
 
 def country_image_file_path(instance, filename):
     _, extension = os.path.splitext(filename)
@@ -56,6 +60,8 @@ def country_image_file_path(instance, filename):
 class Country(models.Model):
     name = models.CharField(max_length=63)
     image = models.ImageField(null=True, upload_to=country_image_file_path)
+    # Resized copies of the image by format and width, built after upload
+    image_variants = models.JSONField(default=dict, blank=True)
 
     class Meta:
         verbose_name_plural = "Countries"
@@ -72,6 +78,16 @@ class Airport(models.Model):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def ids_matching(place):
+        """Ids of the airports which name, nearest city or country name
+        contain place, served by trigram indexes on PostgreSQL"""
+        return Airport.objects.filter(
+            Q(name__icontains=place)
+            | Q(near_city__icontains=place)
+            | Q(country__name__icontains=place)
+        ).values("id")
+
 
 class Route(models.Model):
     departure = models.ForeignKey(
@@ -85,6 +101,24 @@ class Route(models.Model):
     def __str__(self):
         return f"{str(self.departure)}-{str(self.destination)}"
 
+    @staticmethod
+    def ids_between(departure=None, destination=None):
+        """Ids of the routes between places matched by Airport.ids_matching,
+        as a queryset, so they are filtered on in a subquery"""
+        routes = Route.objects.all()
+
+        if departure:
+            routes = routes.filter(
+                departure_id__in=Airport.ids_matching(departure)
+            )
+
+        if destination:
+            routes = routes.filter(
+                destination_id__in=Airport.ids_matching(destination)
+            )
+
+        return routes.values("id")
+
     @property
     def name(self):
         return f"{self.departure.name}-{self.destination.name}"
@@ -105,15 +139,58 @@ class Crew(models.Model):
         return self.first_name + " " + self.last_name
 
 
+class FlightSchedule(models.Model):
+    """Flights of the route flown by the airplane at the same local time
+    on some days of every week, materialized for a rolling horizon"""
+
+    route = models.ForeignKey(Route, on_delete=models.CASCADE)
+    airplane = models.ForeignKey(Airplane, on_delete=models.CASCADE)
+    crew = models.ManyToManyField(Crew, related_name="schedules", blank=True)
+    # Days of the week as in date.weekday(), 0 is Monday
+    weekdays = models.JSONField(default=list)
+    departure_time = models.TimeField()
+    duration = models.DurationField()
+    timezone = models.CharField(max_length=63, default=settings.TIME_ZONE)
+    valid_from = models.DateField()
+    valid_until = models.DateField(null=True, blank=True)
+    materialized_until = models.DateField(null=True, editable=False)
+
+    def __str__(self):
+        days = ",".join(
+            calendar.day_abbr[weekday] for weekday in sorted(self.weekdays)
+        )
+        return f"{self.route} {days} {self.departure_time.strftime('%H:%M')}"
+
+
 class Flight(models.Model):
     route = models.ForeignKey(Route, on_delete=models.CASCADE)
     crew = models.ManyToManyField(Crew, related_name="flights")
     airplane = models.ForeignKey(Airplane, on_delete=models.CASCADE)
     departure_time = models.DateTimeField()
     arrival_time = models.DateTimeField()
+    seats_total = models.IntegerField(default=0, editable=False)
+    seats_sold = models.IntegerField(default=0, editable=False)
+    seats_held = models.IntegerField(default=0, editable=False)
+    schedule = models.ForeignKey(
+        FlightSchedule,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="flights",
+    )
 
     class Meta:
         ordering = ["-departure_time"]
+        indexes = [
+            models.Index(fields=["route", "departure_time"]),
+            models.Index(fields=["departure_time"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["schedule", "departure_time"],
+                name="unique_schedule_departure",
+            )
+        ]
 
     def __str__(self):
         return (
@@ -121,6 +198,103 @@ class Flight(models.Model):
             f"{self.departure_time.strftime('%Y-%m-%d %H:%M')}"
         )
 
+    @property
+    def tickets_available(self):
+        return self.seats_total - self.seats_sold - self.seats_held
+
+
+def _reference(model):
+    # ids copied from the flight, rows are deleted along with the flight
+    return models.ForeignKey(
+        model,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+
+
+class FlightSearchRow(models.Model):
+    """Flight with the names it is searched and listed by, so the flight
+    list is served from one table. Kept up to date by signals"""
+
+    flight = models.OneToOneField(
+        Flight,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="search_row",
+    )
+    route = _reference(Route)
+    origin = _reference(Airport)
+    origin_name = models.CharField(max_length=63)
+    origin_city = models.CharField(max_length=63)
+    origin_country = _reference(Country)
+    origin_country_name = models.CharField(max_length=63)
+    destination = _reference(Airport)
+    destination_name = models.CharField(max_length=63)
+    destination_city = models.CharField(max_length=63)
+    destination_country = _reference(Country)
+    destination_country_name = models.CharField(max_length=63)
+    airplane = _reference(Airplane)
+    airplane_name = models.CharField(max_length=63)
+    departure_time = models.DateTimeField()
+    arrival_time = models.DateTimeField()
+    tickets_available = models.IntegerField()
+
+    class Meta:
+        ordering = ["-departure_time"]
+        indexes = [models.Index(fields=["departure_time"])]
+
+    def __str__(self):
+        return (
+            f"{self.route_name} "
+            f"{self.departure_time.strftime('%Y-%m-%d %H:%M')}"
+        )
+
+    @property
+    def route_name(self):
+        return f"{self.origin_name}-{self.destination_name}"
+
+    @staticmethod
+    def matching(departure=None, destination=None):
+        """Rows of the flights between places matched by name, nearest
+        city or country name like Airport.ids_matching"""
+        rows = FlightSearchRow.objects.all()
+
+        for prefix, place in (
+            ("origin", departure),
+            ("destination", destination),
+        ):
+            if place:
+                rows = rows.filter(
+                    Q(**{f"{prefix}_name__icontains": place})
+                    | Q(**{f"{prefix}_city__icontains": place})
+                    | Q(**{f"{prefix}_country_name__icontains": place})
+                )
+
+        return rows
+
+
+class FlightCabin(models.Model):
+    flight = models.ForeignKey(
+        Flight, on_delete=models.CASCADE, related_name="cabin_counters"
+    )
+    cabin = models.ForeignKey(
+        Cabin, on_delete=models.CASCADE, related_name="flight_counters"
+    )
+    seats_total = models.IntegerField(default=0)
+    seats_sold = models.IntegerField(default=0)
+    seats_held = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("flight", "cabin")
+
+    @property
+    def tickets_available(self):
+        return self.seats_total - self.seats_sold - self.seats_held
+
+    def __str__(self):
+        return f"{str(self.flight)} ({self.cabin.name})"
+
 
 class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -130,6 +304,11 @@ class Order(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "created_at"]),
+            # exports of all orders by time window
+            models.Index(fields=["created_at"]),
+        ]
 
     def __str__(self):
         return self.created_at.strftime('%Y-%m-%d %H:%M')
@@ -159,6 +338,67 @@ class Ticket(models.Model):
                 f"Seat number must be in range (1, {cabin.seats})"
             )
 
+    @staticmethod
+    def validate_tickets(tickets, error_to_raise, hold=None):
+        """Validate many tickets at once: cabins of the airplanes, already
+        taken and held seats are loaded with a single query each. Seats of
+        the hold being converted into the tickets are not treated as held"""
+        flights = {ticket["flight"] for ticket in tickets}
+        airplane_cabins = defaultdict(set)
+        for airplane_id, cabin_id in Airplane.cabins.through.objects.filter(
+            airplane_id__in={flight.airplane_id for flight in flights}
+        ).values_list("airplane_id", "cabin_id"):
+            airplane_cabins[airplane_id].add(cabin_id)
+
+        requested = set()
+        for ticket in tickets:
+            cabin, seat, flight = (
+                ticket["cabin"],
+                ticket["seat"],
+                ticket["flight"],
+            )
+            if cabin.id not in airplane_cabins[flight.airplane_id]:
+                raise error_to_raise(f"Airplane has no cabin '{cabin.name}'")
+            if not 1 <= seat <= cabin.seats:
+                raise error_to_raise(
+                    f"Seat number must be in range (1, {cabin.seats})"
+                )
+            if (flight.id, cabin.id, seat) in requested:
+                raise error_to_raise(
+                    f"Seat {seat} in cabin '{cabin.name}' "
+                    f"is ordered more than once"
+                )
+            requested.add((flight.id, cabin.id, seat))
+
+        cabins = {ticket["cabin"].id: ticket["cabin"] for ticket in tickets}
+        seats = {
+            "flight__in": flights,
+            "cabin_id__in": cabins,
+            "seat__in": {ticket["seat"] for ticket in tickets},
+        }
+        for flight_id, cabin_id, seat in Ticket.objects.filter(
+            **seats
+        ).values_list("flight_id", "cabin_id", "seat"):
+            if (flight_id, cabin_id, seat) in requested:
+                raise error_to_raise(
+                    f"Seat {seat} in cabin '{cabins[cabin_id].name}' "
+                    f"is already taken"
+                )
+
+        held_seats = HeldSeat.objects.filter(
+            hold__expires_at__gt=timezone.now(), **seats
+        )
+        if hold is not None:
+            held_seats = held_seats.exclude(hold=hold)
+        for flight_id, cabin_id, seat in held_seats.values_list(
+            "flight_id", "cabin_id", "seat"
+        ):
+            if (flight_id, cabin_id, seat) in requested:
+                raise error_to_raise(
+                    f"Seat {seat} in cabin '{cabins[cabin_id].name}' "
+                    f"is held by another customer"
+                )
+
     def clean(self):
         Ticket.validate_ticket(
             self.cabin,
@@ -184,3 +424,60 @@ class Ticket(models.Model):
             f"{str(self.flight)} "
             f"(seat: {self.seat}, seat_class: {self.cabin.seat_class.name}"
         )
+
+
+class SeatHold(models.Model):
+    flight = models.ForeignKey(
+        Flight, on_delete=models.CASCADE, related_name="holds"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="seat_holds",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return (
+            f"{str(self.flight)} "
+            f"(until {self.expires_at.strftime('%Y-%m-%d %H:%M')})"
+        )
+
+
+class HeldSeat(models.Model):
+    hold = models.ForeignKey(
+        SeatHold, on_delete=models.CASCADE, related_name="seats"
+    )
+    flight = models.ForeignKey(
+        Flight, on_delete=models.CASCADE, related_name="held_seats"
+    )
+    cabin = models.ForeignKey(Cabin, on_delete=models.CASCADE)
+    seat = models.IntegerField()
+
+    class Meta:
+        unique_together = ("flight", "cabin", "seat")
+        ordering = ["cabin", "seat"]
+
+    def __str__(self):
+        return f"{str(self.flight)} (seat: {self.seat}, cabin: {self.cabin})"
+
+
+class ThrottleCounter(models.Model):
+    """Requests of a client in a window of its throttle rate, used instead
+    of the throttle cache without Redis. expires_at is in seconds of the
+    throttle timer"""
+
+    key = models.CharField(max_length=255)
+    window = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+    expires_at = models.FloatField(db_index=True)
+
+    class Meta:
+        unique_together = ("key", "window")
+
+    def __str__(self):
+        return f"{self.key} ({self.window}: {self.count})"
@@ -0,0 +1,194 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class BasePagination(PageNumberPagination):
+    page_size = 10
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """Page number pagination which switches to keyset (cursor) mode with
+    ?pagination=cursor. In that mode the next page starts after the ordering
+    key of the last row and total count is not calculated"""
+
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+    ordering = ()
+
+    def is_keyset_mode(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+
+    def order(self, queryset):
+        """Order rows of both modes by the key, so rows with equal times
+        keep their place and are not repeated or skipped between pages"""
+        return queryset.order_by(*self.ordering) if self.ordering else queryset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.is_keyset_mode(request)
+        queryset = self.order(queryset)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        queryset, page_size = self.get_keyset_queryset(queryset, request)
+        return self.get_keyset_page(list(queryset), page_size)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, which fetches the count and
+        the rows with async queries"""
+        self.keyset = self.is_keyset_mode(request)
+        queryset = self.order(queryset)
+        if self.keyset:
+            queryset, page_size = self.get_keyset_queryset(queryset, request)
+            return self.get_keyset_page(
+                [obj async for obj in queryset], page_size
+            )
+
+        self.request = request
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request)
+        )
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return list(self.page)
+
+    def get_keyset_queryset(self, queryset, request):
+        """Queryset of the requested page with one extra row, which tells
+        whether there is a next page"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        if position:
+            queryset = queryset.filter(self.get_after_filter(position))
+
+        return queryset[: page_size + 1], page_size
+
+    def get_keyset_page(self, page, page_size):
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], field.lstrip("-")) for field in self.ordering
+            ]
+
+        return page
+
+    def get_after_filter(self, position):
+        """(a, b) after (x, y) is a > x OR (a = x AND b > y), with the
+        comparison reversed for descending fields"""
+        condition = Q()
+        equal = {}
+
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+
+        return condition
+
+    @staticmethod
+    def get_field(model, field):
+        name = field.lstrip("-")
+        if name == "pk":
+            return model._meta.pk
+        return model._meta.get_field(name)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.get_field(model, field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in position
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+
+        if self.next_position is None:
+            return None
+
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": (
+                    "Set to 'cursor' for keyset pagination without total "
+                    "count, follow 'next' links for further pages"
+                ),
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Cursor of the page in keyset pagination",
+                "schema": {"type": "string"},
+            },
+        ]
+
+
+class FlightPagination(KeysetPagination):
+    # pk is the flight id of search rows as well
+    ordering = ("-departure_time", "-pk")
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
@@ -0,0 +1,149 @@
+import hashlib
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from airport_api.db_routing import primary_reads
+
+FLIGHTS_VERSION_KEY = "airport:version:flights"
+CATALOG_VERSION_KEY = "airport:version:catalog"
+HITS_KEY = "airport:response-cache:hits"
+MISSES_KEY = "airport:response-cache:misses"
+
+
+def flight_version_key(flight_id):
+    return f"airport:version:flight:{flight_id}"
+
+
+def get_version(*keys):
+    """Combined version stamp of the keys. Missing stamps are created with
+    a random value, so an evicted stamp can't bring stale entries back"""
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key, "")
+
+    return ":".join(str(versions[key]) for key in keys)
+
+
+def bump_versions(*keys):
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+def cache_timeout(timeout):
+    """Timeout of an entry expired by version stamps, bounded by
+    LOCAL_CACHE_TIMEOUT when the stamps bumped by other processes can't
+    be seen"""
+    if settings.SHARED_CACHE:
+        return timeout
+    return min(timeout, settings.LOCAL_CACHE_TIMEOUT)
+
+
+def invalidate_flights(flight_ids):
+    """Expire cached responses which include any of the flights once the
+    transaction is committed, so they are rebuilt from the committed rows"""
+    keys = [
+        FLIGHTS_VERSION_KEY,
+        *(flight_version_key(flight_id) for flight_id in set(flight_ids)),
+    ]
+    transaction.on_commit(lambda: bump_versions(*keys))
+
+
+def invalidate_catalog():
+    """Expire cached responses of all flights, used when routes, airports,
+    airplanes or cabins shared by many flights change"""
+    transaction.on_commit(
+        lambda: bump_versions(FLIGHTS_VERSION_KEY, CATALOG_VERSION_KEY)
+    )
+
+
+def _request_hash(request):
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    )
+    return hashlib.md5(
+        f"{request.get_host()}{request.path}{params}".encode()
+    ).hexdigest()
+
+
+def flight_list_cache_key(request):
+    version = get_version(FLIGHTS_VERSION_KEY, CATALOG_VERSION_KEY)
+    return f"airport:flights:list:{version}:{_request_hash(request)}"
+
+
+def flight_detail_cache_key(request, flight_id):
+    """Key of the flight detail response, the id of the URL is taken as a
+    number, so /flights/01/ is expired with /flights/1/. Raise ValueError
+    when it isn't one"""
+    flight_id = int(flight_id)
+    version = get_version(flight_version_key(flight_id), CATALOG_VERSION_KEY)
+    return (
+        f"airport:flights:detail:{flight_id}:{version}:"
+        f"{_request_hash(request)}"
+    )
+
+
+def _increment(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def cached_response(key, get_response):
+    """Serve response data from the cache, otherwise build the response
+    from the primary database and cache its data if it is successful"""
+    data = cache.get(key)
+
+    if data is not None:
+        _increment(HITS_KEY)
+        response = Response(data)
+        response["X-Cache"] = "HIT"
+        return response
+
+    _increment(MISSES_KEY)
+    with primary_reads():
+        response = get_response()
+
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(
+            key, response.data, cache_timeout(settings.FLIGHT_CACHE_TIMEOUT)
+        )
+
+    response["X-Cache"] = "MISS"
+    return response
+
+
+async def acached_data(key, get_data):
+    """cached_response for async views, get_data is a coroutine function
+    returning the response data. Return the data and whether it was cached"""
+    data = await cache.aget(key)
+
+    if data is not None:
+        await sync_to_async(_increment)(HITS_KEY)
+        return data, True
+
+    await sync_to_async(_increment)(MISSES_KEY)
+    with primary_reads():
+        data = await get_data()
+    await cache.aset(key, data, cache_timeout(settings.FLIGHT_CACHE_TIMEOUT))
+
+    return data, False
+
+
+def get_stats():
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {
+        "hits": stats.get(HITS_KEY, 0),
+        "misses": stats.get(MISSES_KEY, 0),
+    }
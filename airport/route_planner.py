@@ -0,0 +1,159 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+
+from airport_api.db_routing import primary_reads
+from airport.models import Route
+from airport.response_cache import bump_versions, get_version
+
+ROUTES_VERSION_KEY = "airport:version:routes"
+
+
+def invalidate_routes():
+    """Expire the route networks of every process once the transaction is
+    committed, so they are rebuilt from the committed rows"""
+    transaction.on_commit(lambda: bump_versions(ROUTES_VERSION_KEY))
+
+
+class RouteNetwork:
+    """Routes as a compressed sparse row graph: airports are numbered by
+    their sorted ids, the routes leaving airport i are the entries from
+    offsets[i] to offsets[i + 1] of targets, distances and route_ids"""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.built_at = time.monotonic()
+        rows = sorted(rows)
+        self.airport_ids = array(
+            "q", sorted({row[0] for row in rows} | {row[1] for row in rows})
+        )
+        self.offsets = array("l", [0] * (len(self.airport_ids) + 1))
+        self.targets = array("l")
+        self.distances = array("l")
+        self.route_ids = array("q")
+
+        for departure_id, destination_id, distance, route_id in rows:
+            self.offsets[self.node(departure_id) + 1] += 1
+            self.targets.append(self.node(destination_id))
+            self.distances.append(distance)
+            self.route_ids.append(route_id)
+
+        for node in range(len(self.airport_ids)):
+            self.offsets[node + 1] += self.offsets[node]
+
+    @classmethod
+    def build(cls):
+        # read the version first, a change made while loading bumps it again
+        version = get_version(ROUTES_VERSION_KEY)
+        with primary_reads():
+            return cls(
+                version,
+                Route.objects.order_by().values_list(
+                    "departure_id", "destination_id", "distance", "id"
+                ),
+            )
+
+    def is_current(self):
+        """Whether no routes changed since the network was built. Without
+        a shared cache changes of other processes can't be seen, so the
+        network is only used for GRAPH_LOCAL_MAX_AGE seconds"""
+        if not settings.SHARED_CACHE and (
+            time.monotonic() - self.built_at > settings.GRAPH_LOCAL_MAX_AGE
+        ):
+            return False
+        return self.version == get_version(ROUTES_VERSION_KEY)
+
+    def node(self, airport_id):
+        index = bisect_left(self.airport_ids, airport_id)
+        if (
+            index < len(self.airport_ids)
+            and self.airport_ids[index] == airport_id
+        ):
+            return index
+        return None
+
+    def shortest_path(self, origins, destinations, fewest_hops=False):
+        """Route ids of the shortest path by distance, or by the number of
+        routes and then distance with fewest_hops, from any of the origin
+        airports to any of the destination ones, with Dijkstra's algorithm.
+        Return None when there is no path"""
+        sources = {self.node(airport_id) for airport_id in origins}
+        targets = {self.node(airport_id) for airport_id in destinations}
+        sources.discard(None)
+        targets -= sources | {None}
+        if not sources or not targets:
+            return None
+
+        costs = {node: (0, 0) for node in sources}
+        # previous node and index of the edge the node was reached by
+        reached_by = {}
+        queue = [(0, 0, node) for node in sources]
+        heapq.heapify(queue)
+
+        while queue:
+            first, second, node = heapq.heappop(queue)
+            if (first, second) > costs[node]:
+                continue
+
+            if node in targets:
+                path = []
+                while node not in sources:
+                    node, edge = reached_by[node]
+                    path.append(self.route_ids[edge])
+                return path[::-1]
+
+            for edge in range(self.offsets[node], self.offsets[node + 1]):
+                target = self.targets[edge]
+                distance = self.distances[edge]
+                if fewest_hops:
+                    cost = (first + 1, second + distance)
+                else:
+                    cost = (first + distance, second + 1)
+
+                if target not in costs or cost < costs[target]:
+                    costs[target] = cost
+                    reached_by[target] = (node, edge)
+                    heapq.heappush(queue, (*cost, target))
+
+        return None
+
+
+_network = None
+_lock = threading.Lock()
+
+
+def get_network():
+    """Route network of the process, rebuilt when routes changed by one
+    thread at a time, while others keep using the previous network"""
+    global _network
+
+    network = _network
+    if network is not None and network.is_current():
+        return network
+
+    # only the first build is waited for
+    if not _lock.acquire(blocking=network is None):
+        return network
+    try:
+        if _network is None or not _network.is_current():
+            _network = RouteNetwork.build()
+        return _network
+    finally:
+        _lock.release()
+
+
+def plan_routes(origins, destinations):
+    """Route ids of the shortest and of the fewest hops paths"""
+    origins, destinations = set(origins), set(destinations)
+    network = get_network()
+    return {
+        "shortest": network.shortest_path(origins, destinations),
+        "fewest_hops": network.shortest_path(
+            origins, destinations, fewest_hops=True
+        ),
+    }
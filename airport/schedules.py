@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from airport.flight_graph import flights_changed
+from airport.flight_import import create_flights
+from airport.models import Flight, FlightSchedule
+from airport.response_cache import invalidate_flights
+from airport.search_rows import refresh_search_rows
+from airport.seat_counters import sync_seat_counters
+
+
+def occurrences(schedule, start, end):
+    """UTC departure and arrival times of the schedule on the dates of the
+    [start, end] range within its validity"""
+    tz = ZoneInfo(schedule.timezone)
+    weekdays = set(schedule.weekdays)
+    day = max(start, schedule.valid_from)
+    if schedule.valid_until:
+        end = min(end, schedule.valid_until)
+
+    while day <= end:
+        if day.weekday() in weekdays:
+            departure = datetime.combine(
+                day, schedule.departure_time, tzinfo=tz
+            ).astimezone(dt_timezone.utc)
+            yield departure, departure + schedule.duration
+        day += timedelta(days=1)
+
+
+def get_horizon(today=None):
+    today = today or timezone.localdate()
+    return today, today + timedelta(days=settings.FLIGHT_SCHEDULE_HORIZON_DAYS)
+
+
+def _future_unsold(schedule):
+    """Future flights of the schedule without sold or held seats, deletes
+    filter on it again, so a flight sold since it was listed is kept"""
+    return Flight.objects.filter(
+        schedule=schedule,
+        departure_time__gt=timezone.now(),
+        seats_sold=0,
+        seats_held=0,
+    )
+
+
+def _update_unsold(schedule, wanted, crew_ids):
+    """Bring future flights of the schedule without sold or held seats in
+    line with it, delete the ones it no longer has. Return ids of the
+    changed and of the deleted flights. The flights are locked, so seats
+    can't be sold on them meanwhile"""
+    flights = list(_future_unsold(schedule).select_for_update())
+    stale = [
+        flight.id for flight in flights if flight.departure_time not in wanted
+    ]
+    kept = [flight for flight in flights if flight.departure_time in wanted]
+
+    for flight in kept:
+        flight.route_id = schedule.route_id
+        flight.airplane_id = schedule.airplane_id
+        flight.arrival_time = wanted[flight.departure_time]
+
+    kept_ids = [flight.id for flight in kept]
+    _future_unsold(schedule).filter(id__in=stale).delete()
+    Flight.objects.bulk_update(kept, ["route", "airplane", "arrival_time"])
+    Flight.crew.through.objects.filter(flight_id__in=kept_ids).delete()
+    Flight.crew.through.objects.bulk_create(
+        [
+            Flight.crew.through(flight_id=flight_id, crew_id=crew_id)
+            for flight_id in kept_ids
+            for crew_id in crew_ids
+        ]
+    )
+    sync_seat_counters(Flight.objects.filter(id__in=kept_ids))
+    refresh_search_rows(Flight.objects.filter(id__in=kept_ids))
+    flights_changed(kept_ids)
+    return kept_ids, stale
+
+
+def materialize_schedule(schedule, today=None, update=False, batch_size=1000):
+    """Create the missing flights of the schedule up to the horizon, from
+    where it was materialized before unless update is set. With update,
+    future flights without sold or held seats are also changed to match
+    the schedule. Running it again creates nothing"""
+    start, end = get_horizon(today)
+    if not update and schedule.materialized_until:
+        start = max(start, schedule.materialized_until + timedelta(days=1))
+
+    now = timezone.now()
+    wanted = {
+        departure: arrival
+        for departure, arrival in occurrences(schedule, start, end)
+        if departure > now
+    }
+    crew_ids = list(schedule.crew.values_list("id", flat=True))
+    changed, deleted = [], []
+
+    with transaction.atomic():
+        if update:
+            changed, deleted = _update_unsold(schedule, wanted, crew_ids)
+
+        existing = set(
+            Flight.objects.filter(
+                schedule=schedule, departure_time__in=list(wanted)
+            ).values_list("departure_time", flat=True)
+        )
+        missing = [
+            (
+                Flight(
+                    schedule=schedule,
+                    route_id=schedule.route_id,
+                    airplane_id=schedule.airplane_id,
+                    departure_time=departure,
+                    arrival_time=arrival,
+                ),
+                crew_ids,
+            )
+            for departure, arrival in sorted(wanted.items())
+            if departure not in existing
+        ]
+
+        created = []
+        for batch_start in range(0, len(missing), batch_size):
+            created += create_flights(
+                missing[batch_start : batch_start + batch_size]
+            )
+
+        FlightSchedule.objects.filter(pk=schedule.pk).update(
+            materialized_until=end
+        )
+        schedule.materialized_until = end
+
+    if created or changed or deleted:
+        invalidate_flights(changed + deleted)
+
+    return {
+        "created": len(created),
+        "updated": len(changed),
+        "deleted": len(deleted),
+    }
+
+
+def materialize_schedules(today=None, batch_size=1000):
+    """Extend every active schedule which isn't materialized up to the
+    horizon yet, return the number of created flights"""
+    start, end = get_horizon(today)
+    schedules = FlightSchedule.objects.filter(
+        Q(valid_until__isnull=True) | Q(valid_until__gte=start),
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=end),
+    )
+
+    return sum(
+        materialize_schedule(schedule, today, batch_size=batch_size)["created"]
+        for schedule in schedules.iterator()
+    )
+
+
+def cancel_schedule(schedule):
+    """Delete the schedule with its future flights without sold or held
+    seats, the other flights are kept without a schedule"""
+    with transaction.atomic():
+        deleted = list(
+            _future_unsold(schedule)
+            .select_for_update()
+            .values_list("id", flat=True)
+        )
+        _future_unsold(schedule).filter(id__in=deleted).delete()
+        schedule.delete()
+
+    invalidate_flights(deleted)
@@ -0,0 +1,124 @@
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+
+from airport.models import Flight, FlightSearchRow
+
+# Row fields by the lookups of the flight they are copied from
+SOURCES = {
+    "route_id": "route_id",
+    "origin_id": "route__departure_id",
+    "origin_name": "route__departure__name",
+    "origin_city": "route__departure__near_city",
+    "origin_country_id": "route__departure__country_id",
+    "origin_country_name": "route__departure__country__name",
+    "destination_id": "route__destination_id",
+    "destination_name": "route__destination__name",
+    "destination_city": "route__destination__near_city",
+    "destination_country_id": "route__destination__country_id",
+    "destination_country_name": "route__destination__country__name",
+    "airplane_id": "airplane_id",
+    "airplane_name": "airplane__name",
+    "departure_time": "departure_time",
+    "arrival_time": "arrival_time",
+}
+UPDATE_FIELDS = [field.removesuffix("_id") for field in SOURCES] + [
+    "tickets_available"
+]
+
+
+def _tickets_available():
+    return F("seats_total") - F("seats_sold") - F("seats_held")
+
+
+def refresh_search_rows(flights, batch_size=1000):
+    """Create or update the rows of the flights queryset"""
+    values = (
+        flights.order_by()
+        .annotate(available=_tickets_available())
+        .values_list("id", *SOURCES.values(), "available")
+    )
+    batch = []
+
+    for flight_id, *fields, tickets_available in values.iterator(
+        chunk_size=batch_size
+    ):
+        batch.append(
+            FlightSearchRow(
+                flight_id=flight_id,
+                tickets_available=tickets_available,
+                **dict(zip(SOURCES, fields)),
+            )
+        )
+
+        if len(batch) == batch_size:
+            _save_rows(batch)
+            batch = []
+
+    if batch:
+        _save_rows(batch)
+
+
+def _save_rows(rows):
+    FlightSearchRow.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["flight"],
+        update_fields=UPDATE_FIELDS,
+    )
+
+
+def sync_tickets_available(flight_ids):
+    """Copy tickets available from the seat counters of the flights"""
+    FlightSearchRow.objects.filter(flight_id__in=flight_ids).update(
+        tickets_available=Subquery(
+            Flight.objects.filter(pk=OuterRef("flight_id"))
+            .annotate(available=_tickets_available())
+            .values("available")
+        )
+    )
+
+
+def _rename(reference, obj, names):
+    """Copy fields of the object referenced as origin, destination or both
+    in one statement, names maps row field suffixes to the new values"""
+    origin = Q(**{f"origin{reference}": obj})
+    destination = Q(**{f"destination{reference}": obj})
+    FlightSearchRow.objects.filter(origin | destination).update(
+        **{
+            f"{prefix}{suffix}": Case(
+                When(condition, then=Value(value)),
+                default=F(f"{prefix}{suffix}"),
+                output_field=FlightSearchRow._meta.get_field(
+                    f"{prefix}{suffix}"
+                ),
+            )
+            for prefix, condition in (
+                ("origin", origin),
+                ("destination", destination),
+            )
+            for suffix, value in names.items()
+        }
+    )
+
+
+def rename_airport(airport):
+    # the airport may have been moved to another country
+    _rename(
+        "",
+        airport,
+        {
+            "_name": airport.name,
+            "_city": airport.near_city,
+            "_country_id": airport.country_id,
+            "_country_name": airport.country.name,
+        },
+    )
+
+
+def rename_country(country):
+    _rename("_country", country, {"_country_name": country.name})
+
+
+def rename_airplane(airplane):
+    FlightSearchRow.objects.filter(airplane=airplane).update(
+        airplane_name=airplane.name
+    )
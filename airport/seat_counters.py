@@ -0,0 +1,197 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F
+
+from airport.models import Airplane, Flight, FlightCabin, HeldSeat, Ticket
+from airport.search_rows import sync_tickets_available
+
+COUNTER_FIELDS = ("seats_total", "seats_sold", "seats_held")
+
+
+def _add_to_counters(field, counts):
+    """Apply {(flight_id, cabin_id): delta} to the counter field of flights
+    and their cabins. Rows are updated in a fixed order to avoid deadlocks
+    between concurrent orders"""
+    flight_deltas = Counter()
+
+    for (flight_id, cabin_id), delta in sorted(counts.items()):
+        if not delta:
+            continue
+
+        flight_deltas[flight_id] += delta
+        FlightCabin.objects.filter(
+            flight_id=flight_id, cabin_id=cabin_id
+        ).update(**{field: F(field) + delta})
+
+    for flight_id, delta in sorted(flight_deltas.items()):
+        if delta:
+            Flight.objects.filter(pk=flight_id).update(
+                **{field: F(field) + delta}
+            )
+
+    sync_tickets_available(
+        [flight_id for flight_id, delta in flight_deltas.items() if delta]
+    )
+
+
+def add_seats_sold(counts):
+    _add_to_counters("seats_sold", counts)
+
+
+def add_seats_held(counts):
+    _add_to_counters("seats_held", counts)
+
+
+def get_airplane_cabins(airplane_ids):
+    """Map airplane id to {cabin_id: seats} of its cabins"""
+    cabins = defaultdict(dict)
+
+    for airplane_id, cabin_id, seats in Airplane.cabins.through.objects.filter(
+        airplane_id__in=airplane_ids
+    ).values_list("airplane_id", "cabin_id", "cabin__seats"):
+        cabins[airplane_id][cabin_id] = seats
+
+    return cabins
+
+
+def sync_airplane_capacity(airplane_ids):
+    """Store capacity and capacity by seat class of the airplanes"""
+    airplanes = {
+        airplane_id: Airplane(id=airplane_id, capacity=0)
+        for airplane_id in airplane_ids
+    }
+    by_class = defaultdict(Counter)
+
+    cabins = Airplane.cabins.through.objects.filter(airplane_id__in=airplanes)
+    for airplane_id, seat_class, seats in cabins.values_list(
+        "airplane_id", "cabin__seat_class__name", "cabin__seats"
+    ):
+        airplanes[airplane_id].capacity += seats
+        by_class[airplane_id][seat_class] += seats
+
+    for airplane_id, airplane in airplanes.items():
+        airplane.seat_class_capacity = dict(by_class[airplane_id])
+
+    Airplane.objects.bulk_update(
+        airplanes.values(), ["capacity", "seat_class_capacity"]
+    )
+
+
+def _count_seats(model, flight_ids):
+    """Count rows of model by flight and by flight cabin"""
+    by_cabin = Counter()
+    by_flight = Counter()
+
+    for flight_id, cabin_id, count in (
+        model.objects.filter(flight_id__in=flight_ids)
+        .values("flight_id", "cabin_id")
+        .annotate(count=Count("id"))
+        .values_list("flight_id", "cabin_id", "count")
+    ):
+        by_cabin[flight_id, cabin_id] = count
+        by_flight[flight_id] += count
+
+    return by_cabin, by_flight
+
+
+def _sync_batch(flights, recount, dry_run):
+    flight_ids = [flight_id for flight_id, *_ in flights]
+    cabins = get_airplane_cabins(
+        {airplane_id for _, airplane_id, *_ in flights}
+    )
+
+    counters = {
+        (counter.flight_id, counter.cabin_id): counter
+        for counter in FlightCabin.objects.filter(flight_id__in=flight_ids)
+    }
+
+    if recount:
+        sold, flight_sold = _count_seats(Ticket, flight_ids)
+        held, flight_held = _count_seats(HeldSeat, flight_ids)
+    else:
+        sold = Counter(
+            {key: counter.seats_sold for key, counter in counters.items()}
+        )
+        held = Counter(
+            {key: counter.seats_held for key, counter in counters.items()}
+        )
+
+    mismatched = []
+    flights_to_update = []
+    counters_to_create = []
+    counters_to_update = []
+    counters_to_delete = []
+
+    for flight_id, airplane_id, *values in flights:
+        airplane_cabins = cabins[airplane_id]
+        expected = [
+            sum(airplane_cabins.values()),
+            flight_sold[flight_id] if recount else values[1],
+            flight_held[flight_id] if recount else values[2],
+        ]
+        changed = values != expected
+
+        for cabin_id, seats in airplane_cabins.items():
+            counter = counters.pop((flight_id, cabin_id), None)
+            cabin_expected = [
+                seats,
+                sold[flight_id, cabin_id],
+                held[flight_id, cabin_id],
+            ]
+
+            if counter is None:
+                changed = True
+                counter = FlightCabin(flight_id=flight_id, cabin_id=cabin_id)
+                counters_to_create.append(counter)
+            elif [
+                getattr(counter, field) for field in COUNTER_FIELDS
+            ] != cabin_expected:
+                changed = True
+                counters_to_update.append(counter)
+
+            for field, value in zip(COUNTER_FIELDS, cabin_expected):
+                setattr(counter, field, value)
+
+        if changed:
+            mismatched.append(flight_id)
+            flights_to_update.append(
+                Flight(id=flight_id, **dict(zip(COUNTER_FIELDS, expected)))
+            )
+
+    for (flight_id, _), counter in counters.items():
+        if flight_id not in mismatched:
+            mismatched.append(flight_id)
+        counters_to_delete.append(counter.id)
+
+    if not dry_run:
+        FlightCabin.objects.bulk_create(counters_to_create)
+        FlightCabin.objects.bulk_update(counters_to_update, COUNTER_FIELDS)
+        FlightCabin.objects.filter(id__in=counters_to_delete).delete()
+        Flight.objects.bulk_update(flights_to_update, COUNTER_FIELDS)
+        sync_tickets_available([flight.id for flight in flights_to_update])
+
+    return mismatched
+
+
+def sync_seat_counters(flights, recount=False, dry_run=False, batch_size=1000):
+    """Bring stored seat counters of the flights in line with the cabins of
+    their airplanes, and with their tickets and held seats if recount is set.
+    Return ids of the flights which counters were out of date"""
+    mismatched = []
+    batch = []
+
+    for row in (
+        flights.order_by()
+        .values_list("id", "airplane_id", *COUNTER_FIELDS)
+        .iterator(chunk_size=batch_size)
+    ):
+        batch.append(list(row))
+
+        if len(batch) == batch_size:
+            mismatched += _sync_batch(batch, recount, dry_run)
+            batch = []
+
+    if batch:
+        mismatched += _sync_batch(batch, recount, dry_run)
+
+    return mismatched
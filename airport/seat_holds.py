@@ -0,0 +1,89 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from airport.models import Flight, HeldSeat, SeatHold, Ticket
+from airport.response_cache import invalidate_flights
+from airport.seat_counters import add_seats_held
+
+
+def release_holds(holds):
+    """Delete the holds and return their seats to the counters. Holds locked
+    by a concurrent release are skipped, so seats are never returned twice"""
+    with transaction.atomic():
+        hold_ids = list(
+            holds.order_by()
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)
+        )
+        if not hold_ids:
+            return 0
+
+        counts = Counter()
+        for flight_id, cabin_id in HeldSeat.objects.filter(
+            hold_id__in=hold_ids
+        ).values_list("flight_id", "cabin_id"):
+            counts[flight_id, cabin_id] -= 1
+
+        SeatHold.objects.filter(id__in=hold_ids).delete()
+        add_seats_held(counts)
+
+        invalidate_flights(flight_id for flight_id, _ in counts.keys())
+
+    return len(hold_ids)
+
+
+def release_expired_holds(flight_ids=None, batch_size=1000):
+    """Release expired holds in batches, of the given flights only if
+    flight_ids are passed. Return number of released holds"""
+    expired = SeatHold.objects.filter(expires_at__lte=timezone.now())
+    if flight_ids is not None:
+        expired = expired.filter(flight_id__in=flight_ids)
+
+    released = 0
+    while True:
+        batch = release_holds(
+            SeatHold.objects.filter(
+                id__in=list(expired.values_list("id", flat=True)[:batch_size])
+            )
+        )
+        released += batch
+        if batch < batch_size:
+            return released
+
+
+def lock_flights(flight_ids):
+    """Lock the flights till the end of the transaction. Seats are held and
+    sold under the lock, so a seat checked as free in the other table
+    can't be claimed there meanwhile"""
+    list(
+        Flight.objects.filter(id__in=set(flight_ids))
+        .order_by("id")
+        .select_for_update()
+        .values_list("id", flat=True)
+    )
+
+
+def _seats_filter(seats):
+    query = Q()
+    for flight_id, cabin_id, seat in seats:
+        query |= Q(flight_id=flight_id, cabin_id=cabin_id, seat=seat)
+    return query
+
+
+def taken_seats_exist(seats):
+    """Whether any of the (flight_id, cabin_id, seat) seats is sold"""
+    return Ticket.objects.filter(_seats_filter(seats)).exists()
+
+
+def held_seats_exist(seats, hold=None):
+    """Whether any of the seats is held by an active hold other than the
+    given one"""
+    held_seats = HeldSeat.objects.filter(
+        _seats_filter(seats), hold__expires_at__gt=timezone.now()
+    )
+    if hold is not None:
+        held_seats = held_seats.exclude(hold=hold)
+    return held_seats.exists()
@@ -0,0 +1,90 @@
+import base64
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from airport_api.db_routing import primary_reads
+from airport.models import HeldSeat, Ticket
+from airport.response_cache import (
+    CATALOG_VERSION_KEY,
+    cache_timeout,
+    flight_version_key,
+    get_version,
+)
+
+SEAT_MAP_CACHE_TIMEOUT = 60 * 60
+
+
+def seat_map_cache_key(flight_id):
+    version = get_version(flight_version_key(flight_id), CATALOG_VERSION_KEY)
+    return f"airport:seat-map:{flight_id}:{version}"
+
+
+def encode_seats(seats, size):
+    """Pack seat numbers into base64 bitmap, seat N is bit (N - 1) % 8
+    of byte (N - 1) // 8"""
+    bitmap = bytearray((size + 7) // 8)
+    for seat in seats:
+        if 1 <= seat <= size:
+            bitmap[(seat - 1) // 8] |= 1 << ((seat - 1) % 8)
+
+    return base64.b64encode(bytes(bitmap)).decode()
+
+
+def build_seat_map(flight):
+    """Build seat map of the flight from a single scan of its tickets and
+    a single scan of its active holds. Return the map with the time the
+    earliest hold shown on it expires"""
+    taken = defaultdict(list)
+    for cabin_id, seat in Ticket.objects.filter(flight=flight).values_list(
+        "cabin_id", "seat"
+    ):
+        taken[cabin_id].append(seat)
+
+    held = defaultdict(list)
+    expires_at = None
+    for cabin_id, seat, hold_expires_at in HeldSeat.objects.filter(
+        flight=flight, hold__expires_at__gt=timezone.now()
+    ).values_list("cabin_id", "seat", "hold__expires_at"):
+        held[cabin_id].append(seat)
+        expires_at = min(expires_at or hold_expires_at, hold_expires_at)
+
+    cabins = flight.airplane.cabins.select_related("seat_class")
+
+    seat_map = {
+        "flight": flight.id,
+        "cabins": [
+            {
+                "id": cabin.id,
+                "name": cabin.name,
+                "seat_class": cabin.seat_class.name,
+                "seats": cabin.seats,
+                "taken": len(taken[cabin.id]),
+                "held": len(held[cabin.id]),
+                "bitmap": encode_seats(
+                    taken[cabin.id] + held[cabin.id], cabin.seats
+                ),
+            }
+            for cabin in cabins
+        ],
+    }
+
+    return seat_map, expires_at
+
+
+def get_seat_map(flight):
+    key = seat_map_cache_key(flight.id)
+    seat_map = cache.get(key)
+
+    if seat_map is None:
+        with primary_reads():
+            seat_map, expires_at = build_seat_map(flight)
+        timeout = cache_timeout(SEAT_MAP_CACHE_TIMEOUT)
+        if expires_at:
+            timeout = min(
+                timeout, (expires_at - timezone.now()).total_seconds()
+            )
+        cache.set(key, seat_map, max(int(timeout), 1))
+
+    return seat_map
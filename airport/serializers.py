@@ -1,7 +1,15 @@
-from django.db import transaction
+from collections import Counter
+from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from airport.country_images import image_srcset
 from airport.models import (
     AirplaneType,
     SeatClass,
@@ -11,10 +19,39 @@ from airport.models import (
     Route,
     Crew,
     Flight,
+    FlightSchedule,
+    FlightSearchRow,
     Ticket,
     Order,
     Cabin,
+    SeatHold,
+    HeldSeat,
 )
+from airport.response_cache import invalidate_flights
+from airport.seat_counters import add_seats_held, add_seats_sold
+from airport.seat_holds import (
+    held_seats_exist,
+    lock_flights,
+    release_expired_holds,
+    release_holds,
+    taken_seats_exist,
+)
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Look up every distinct primary key only once, so nested lists
+    referencing the same objects don't query them for each item"""
+
+    def to_internal_value(self, data):
+        if not isinstance(data, (str, int)):
+            return super().to_internal_value(data)
+
+        if not hasattr(self, "_objects"):
+            self._objects = {}
+        if data not in self._objects:
+            self._objects[data] = super().to_internal_value(data)
+
+        return self._objects[data]
 
 
 class AirplaneTypeSerializer(serializers.ModelSerializer):
@@ -63,6 +100,11 @@ class AirplaneListSerializer(AirplaneSerializer):
     airplane_capacity = serializers.IntegerField(
         source="capacity", read_only=True
     )
+    seat_class_capacity = serializers.DictField(
+        child=serializers.IntegerField(),
+        read_only=True,
+        help_text="Seats by seat class name",
+    )
     airplane_type = serializers.StringRelatedField()
 
     class Meta:
@@ -72,6 +114,7 @@ class AirplaneListSerializer(AirplaneSerializer):
             "name",
             "cabins",
             "airplane_capacity",
+            "seat_class_capacity",
             "airplane_type",
         )
 
@@ -88,6 +131,23 @@ class CountryImageSerializer(serializers.ModelSerializer):
         fields = ("id", "image")
 
 
+class CountryImageSrcsetSerializer(serializers.Serializer):
+    src = serializers.URLField(help_text="Largest JPEG or the original image")
+    srcset = serializers.DictField(
+        child=serializers.CharField(),
+        help_text="srcset of the resized images by content type",
+    )
+
+    def to_representation(self, country):
+        request = self.context.get("request")
+
+        def url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        return image_srcset(country, url)
+
+
 class AirportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Airport
@@ -116,6 +176,22 @@ class RouteDetailSerializer(RouteSerializer):
     distance = serializers.CharField(source="distance_km", read_only=True)
 
 
+class RoutePathSerializer(serializers.Serializer):
+    distance = serializers.IntegerField()
+    hops = serializers.IntegerField()
+    routes = RouteListSerializer(many=True)
+
+
+class RoutePlanSerializer(serializers.Serializer):
+    shortest = RoutePathSerializer(
+        allow_null=True, help_text="Path of the shortest total distance"
+    )
+    fewest_hops = RoutePathSerializer(
+        allow_null=True,
+        help_text="Path of the fewest routes, the shortest of such paths",
+    )
+
+
 class CrewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Crew
@@ -135,6 +211,57 @@ class FlightSerializer(serializers.ModelSerializer):
         )
 
 
+class FlightScheduleSerializer(serializers.ModelSerializer):
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        allow_empty=False,
+        help_text="Days of the week, 0 is Monday",
+    )
+
+    class Meta:
+        model = FlightSchedule
+        fields = (
+            "id",
+            "route",
+            "airplane",
+            "crew",
+            "weekdays",
+            "departure_time",
+            "duration",
+            "timezone",
+            "valid_from",
+            "valid_until",
+            "materialized_until",
+        )
+        read_only_fields = ("materialized_until",)
+
+    def validate_weekdays(self, weekdays):
+        return sorted(set(weekdays))
+
+    def validate_timezone(self, name):
+        try:
+            ZoneInfo(name)
+        except (ValueError, ZoneInfoNotFoundError):
+            raise ValidationError(f"Unknown time zone '{name}'")
+        return name
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        valid_from = data.get(
+            "valid_from", getattr(self.instance, "valid_from", None)
+        )
+        valid_until = data.get(
+            "valid_until", getattr(self.instance, "valid_until", None)
+        )
+        if valid_until and valid_from and valid_until < valid_from:
+            raise ValidationError(
+                {"valid_until": "Must not be before valid_from"}
+            )
+        if "duration" in data and data["duration"] <= timedelta(0):
+            raise ValidationError({"duration": "Must be positive"})
+        return data
+
+
 class FlightListSerializer(FlightSerializer):
     airplane = serializers.StringRelatedField(many=False)
     route = serializers.StringRelatedField(many=False)
@@ -152,13 +279,25 @@ class FlightListSerializer(FlightSerializer):
         )
 
 
+class FlightSearchRowSerializer(serializers.ModelSerializer):
+    """FlightListSerializer output of a search row"""
+
+    id = serializers.IntegerField(source="flight_id", read_only=True)
+    route = serializers.CharField(source="route_name", read_only=True)
+    airplane = serializers.CharField(source="airplane_name", read_only=True)
+
+    class Meta:
+        model = FlightSearchRow
+        fields = FlightListSerializer.Meta.fields
+
+
 class FlightDetailSerializer(FlightSerializer):
     airplane = AirplaneListSerializer()
     route = RouteDetailSerializer()
     crew = serializers.StringRelatedField(many=True)
     tickets_available = serializers.IntegerField(read_only=True)
-    image = serializers.ImageField(
-        source="route.destination.country.image", read_only=True
+    image = CountryImageSrcsetSerializer(
+        source="route.destination.country", read_only=True, allow_null=True
     )
 
     class Meta:
@@ -175,20 +314,158 @@ class FlightDetailSerializer(FlightSerializer):
         )
 
 
-class TicketSerializer(serializers.ModelSerializer):
+class CabinSeatMapSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    seat_class = serializers.CharField()
+    seats = serializers.IntegerField()
+    taken = serializers.IntegerField()
+    held = serializers.IntegerField()
+    bitmap = serializers.CharField(
+        help_text=(
+            "Base64 bitmap of taken or held seats, "
+            "seat N is bit (N - 1) % 8 of byte (N - 1) // 8"
+        )
+    )
+
+
+class FlightSeatMapSerializer(serializers.Serializer):
+    flight = serializers.IntegerField()
+    cabins = CabinSeatMapSerializer(many=True)
+
+
+class HeldSeatSerializer(serializers.ModelSerializer):
+    cabin = CachedPrimaryKeyRelatedField(queryset=Cabin.objects.all())
+
+    class Meta:
+        model = HeldSeat
+        fields = ("cabin", "seat")
+        # seats are validated for the whole hold in SeatHoldSerializer
+        validators = []
+
+
+class SeatHoldSerializer(serializers.ModelSerializer):
+    seats = HeldSeatSerializer(
+        many=True, allow_empty=False, max_length=settings.SEAT_HOLD_MAX_SEATS
+    )
+    minutes = serializers.IntegerField(
+        write_only=True,
+        required=False,
+        min_value=1,
+        max_value=settings.SEAT_HOLD_MAX_MINUTES,
+    )
+
+    class Meta:
+        model = SeatHold
+        fields = ("id", "flight", "seats", "minutes", "expires_at")
+        read_only_fields = ("flight", "expires_at")
+
     def validate(self, attrs):
-        data = super(TicketSerializer, self).validate(attrs=attrs)
-        Ticket.validate_ticket(
-            attrs["cabin"],
-            attrs["seat"],
-            attrs["flight"].airplane,
+        data = super(SeatHoldSerializer, self).validate(attrs=attrs)
+        flight = self.context["flight"]
+        Ticket.validate_tickets(
+            [{"flight": flight, **seat} for seat in data["seats"]],
             ValidationError,
         )
         return data
 
+    def create(self, validated_data):
+        seats_data = validated_data.pop("seats")
+        minutes = validated_data.pop("minutes", settings.SEAT_HOLD_MINUTES)
+        flight = validated_data["flight"]
+
+        # expired holds of the flight may still own the requested seats
+        release_expired_holds(flight_ids=[flight.id])
+
+        with transaction.atomic():
+            lock_flights([flight.id])
+            active_holds = SeatHold.objects.filter(
+                flight=flight,
+                user_id=validated_data["user_id"],
+                expires_at__gt=timezone.now(),
+            )
+            if active_holds.count() >= settings.SEAT_HOLD_MAX_ACTIVE:
+                error = (
+                    "You already hold seats of this flight, order them or "
+                    "wait until the hold expires"
+                )
+                raise ValidationError({"non_field_errors": [error]})
+            if taken_seats_exist(
+                (flight.id, seat_data["cabin"].id, seat_data["seat"])
+                for seat_data in seats_data
+            ):
+                raise ValidationError(
+                    {"seats": ["Some of the seats are already taken"]}
+                )
+
+            hold = SeatHold.objects.create(
+                expires_at=timezone.now() + timedelta(minutes=minutes),
+                **validated_data,
+            )
+            held_seats = [
+                HeldSeat(hold=hold, flight=flight, **seat_data)
+                for seat_data in seats_data
+            ]
+            try:
+                HeldSeat.objects.bulk_create(held_seats)
+            except IntegrityError:
+                raise ValidationError(
+                    {"seats": ["Some of the seats are already held"]}
+                )
+
+            add_seats_held(
+                Counter((flight.id, seat.cabin_id) for seat in held_seats)
+            )
+            invalidate_flights([flight.id])
+
+            return hold
+
+
+class CacheStatsSerializer(serializers.Serializer):
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+
+
+class FlightImportSerializer(serializers.Serializer):
+    file = serializers.FileField(
+        write_only=True,
+        help_text=(
+            "CSV or JSON file of flights with departure, destination, "
+            "airplane, departure_time, arrival_time and crew columns"
+        ),
+    )
+    created = serializers.IntegerField(read_only=True)
+    errors = serializers.DictField(
+        child=serializers.DictField(child=serializers.CharField()),
+        read_only=True,
+        help_text="Errors of the skipped rows by row number",
+    )
+
+
+class ConnectionSerializer(serializers.Serializer):
+    departure_time = serializers.DateTimeField()
+    arrival_time = serializers.DateTimeField()
+    duration = serializers.DurationField()
+    stops = serializers.IntegerField()
+    flights = FlightListSerializer(many=True)
+
+
+class CalendarDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    flights = serializers.IntegerField()
+    first_departure = serializers.DateTimeField(allow_null=True)
+    max_tickets_available = serializers.IntegerField(allow_null=True)
+
+
+class TicketSerializer(serializers.ModelSerializer):
+    cabin = CachedPrimaryKeyRelatedField(queryset=Cabin.objects.all())
+    flight = CachedPrimaryKeyRelatedField(queryset=Flight.objects.all())
+
     class Meta:
         model = Ticket
         fields = ("id", "cabin", "seat", "flight")
+        # seats are validated for the whole order in OrderSerializer
+        validators = []
 
 
 class TicketListSerializer(TicketSerializer):
@@ -199,18 +476,80 @@ class TicketListSerializer(TicketSerializer):
 
 
 class OrderSerializer(serializers.ModelSerializer):
-    tickets = TicketSerializer(many=True, read_only=False, allow_empty=False)
+    tickets = TicketSerializer(
+        many=True, read_only=False, allow_empty=False, required=False
+    )
+    hold = serializers.PrimaryKeyRelatedField(
+        queryset=SeatHold.objects.select_related("flight"),
+        write_only=True,
+        required=False,
+        help_text="Seat hold to turn into tickets instead of passing them",
+    )
 
     class Meta:
         model = Order
-        fields = ("id", "tickets", "created_at")
+        fields = ("id", "tickets", "hold", "created_at")
+
+    def validate(self, attrs):
+        data = super(OrderSerializer, self).validate(attrs=attrs)
+        hold = data.get("hold")
+
+        if hold is None and "tickets" not in data:
+            raise ValidationError({"tickets": ["This field is required."]})
+
+        if hold is not None:
+            if "tickets" in data:
+                raise ValidationError("Pass either tickets or hold")
+            if hold.user_id != self.context["request"].user.id:
+                raise ValidationError(
+                    {"hold": ["Hold belongs to another user"]}
+                )
+            if hold.expires_at <= timezone.now():
+                raise ValidationError({"hold": ["Hold has expired"]})
+
+            data["tickets"] = [
+                {"flight": hold.flight, "cabin": held.cabin, "seat": held.seat}
+                for held in hold.seats.select_related("cabin")
+            ]
+
+        Ticket.validate_tickets(data["tickets"], ValidationError, hold=hold)
+        return data
 
     def create(self, validated_data):
         with transaction.atomic():
             tickets_data = validated_data.pop("tickets")
+            hold = validated_data.pop("hold", None)
+            seats = [
+                (ticket["flight"].id, ticket["cabin"].id, ticket["seat"])
+                for ticket in tickets_data
+            ]
+            lock_flights(flight_id for flight_id, _, _ in seats)
+            if held_seats_exist(seats, hold=hold):
+                error = "Some of the seats are held by another customer"
+                raise ValidationError({"tickets": [error]})
+
             order = Order.objects.create(**validated_data)
-            for ticket_data in tickets_data:
-                Ticket.objects.create(order=order, **ticket_data)
+            tickets = [
+                Ticket(order=order, **ticket_data)
+                for ticket_data in tickets_data
+            ]
+            try:
+                Ticket.objects.bulk_create(tickets)
+            except IntegrityError:
+                raise ValidationError(
+                    {"tickets": ["Some of the seats are already taken"]}
+                )
+
+            add_seats_sold(
+                Counter(
+                    (ticket.flight_id, ticket.cabin_id) for ticket in tickets
+                )
+            )
+            if hold is not None:
+                release_holds(SeatHold.objects.filter(pk=hold.pk))
+
+            invalidate_flights(ticket.flight_id for ticket in tickets)
+
             return order
 
 
@@ -0,0 +1,196 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from airport.country_images import schedule_image_variants
+from airport.flight_graph import flights_changed, routes_changed
+from airport.models import (
+    Airplane,
+    Airport,
+    Cabin,
+    Country,
+    Crew,
+    Flight,
+    Route,
+    SeatClass,
+    Ticket,
+)
+from airport.response_cache import invalidate_catalog, invalidate_flights
+from airport.route_planner import invalidate_routes
+from airport.search_rows import (
+    refresh_search_rows,
+    rename_airplane,
+    rename_airport,
+    rename_country,
+)
+from airport.seat_counters import (
+    add_seats_sold,
+    sync_airplane_capacity,
+    sync_seat_counters,
+)
+
+
+@receiver(pre_save, sender=Ticket)
+def ticket_pre_save(sender, instance, **kwargs):
+    instance._previous_seat = None
+    if not instance._state.adding:
+        instance._previous_seat = (
+            Ticket.objects.filter(pk=instance.pk)
+            .values_list("flight_id", "cabin_id")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_saved(sender, instance, created, **kwargs):
+    current_seat = (instance.flight_id, instance.cabin_id)
+    previous_seat = getattr(instance, "_previous_seat", None)
+
+    if created:
+        add_seats_sold({current_seat: 1})
+    elif previous_seat and previous_seat != current_seat:
+        add_seats_sold({previous_seat: -1, current_seat: 1})
+        invalidate_flights([previous_seat[0]])
+
+    invalidate_flights([instance.flight_id])
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_deleted(sender, instance, origin=None, **kwargs):
+    # counters of a deleted flight are deleted along with it
+    if not isinstance(origin, Flight):
+        add_seats_sold({(instance.flight_id, instance.cabin_id): -1})
+
+    invalidate_flights([instance.flight_id])
+
+
+@receiver(post_save, sender=Flight)
+def flight_saved(sender, instance, **kwargs):
+    sync_seat_counters(Flight.objects.filter(pk=instance.pk))
+    refresh_search_rows(Flight.objects.filter(pk=instance.pk))
+    invalidate_flights([instance.id])
+    flights_changed([instance.id])
+
+
+@receiver(post_delete, sender=Flight)
+def flight_deleted(sender, instance, **kwargs):
+    invalidate_flights([instance.id])
+    flights_changed([instance.id])
+
+
+@receiver(post_save, sender=Route)
+def route_saved(sender, instance, created, **kwargs):
+    invalidate_routes()
+    if not created:
+        refresh_search_rows(Flight.objects.filter(route=instance))
+        routes_changed([instance.id])
+
+
+@receiver(post_delete, sender=Route)
+def route_deleted(sender, instance, **kwargs):
+    invalidate_routes()
+
+
+@receiver(m2m_changed, sender=Flight.crew.through)
+def flight_crew_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if isinstance(instance, Flight):
+        invalidate_flights([instance.id])
+    else:
+        invalidate_flights(pk_set or [])
+
+
+@receiver(post_save, sender=Cabin)
+def cabin_saved(sender, instance, created, **kwargs):
+    if not created:
+        sync_airplane_capacity(instance.airplanes.values_list("id", flat=True))
+        sync_seat_counters(Flight.objects.filter(airplane__cabins=instance))
+        invalidate_catalog()
+
+
+@receiver(pre_delete, sender=Cabin)
+def cabin_pre_delete(sender, instance, **kwargs):
+    # links to airplanes are deleted without m2m_changed
+    instance._airplane_ids = list(
+        instance.airplanes.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Cabin)
+def cabin_deleted(sender, instance, **kwargs):
+    airplane_ids = getattr(instance, "_airplane_ids", [])
+    sync_airplane_capacity(airplane_ids)
+    sync_seat_counters(Flight.objects.filter(airplane_id__in=airplane_ids))
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=SeatClass)
+def seat_class_saved(sender, instance, created, **kwargs):
+    if not created:
+        sync_airplane_capacity(
+            Airplane.objects.filter(cabins__seat_class=instance)
+            .distinct()
+            .values_list("id", flat=True)
+        )
+        invalidate_catalog()
+
+
+@receiver(post_save, sender=Airport)
+def airport_saved(sender, instance, created, **kwargs):
+    if not created:
+        rename_airport(instance)
+
+
+@receiver(post_save, sender=Airplane)
+def airplane_saved(sender, instance, created, **kwargs):
+    if not created:
+        rename_airplane(instance)
+
+
+@receiver(m2m_changed, sender=Airplane.cabins.through)
+def airplane_cabins_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if isinstance(instance, Airplane):
+        airplane_ids = [instance.id]
+    else:
+        airplane_ids = pk_set or []
+
+    sync_airplane_capacity(airplane_ids)
+    sync_seat_counters(Flight.objects.filter(airplane_id__in=airplane_ids))
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Airplane)
+@receiver(post_delete, sender=Airplane)
+@receiver(post_delete, sender=Cabin)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=Crew)
+@receiver(post_delete, sender=Crew)
+def catalog_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Country)
+def country_saved(sender, instance, created, **kwargs):
+    if not created:
+        rename_country(instance)
+
+    if (
+        instance.image
+        and instance.image_variants.get("source") != instance.image.name
+    ):
+        schedule_image_variants(instance)
@@ -1,3 +1,2335 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APITestCase
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.tokens import AccessToken
+
+from airport_api.db_routing import ReadYourWritesMiddleware, primary_reads
+from airport_api.pooled_postgresql.pool import ConnectionPool, PoolTimeout
+from airport_api.throttling import SlidingWindowRateThrottle
+from airport import flight_graph, route_planner, schedules
+from airport.country_images import generate_image_variants
+from airport.management.commands.bench_place_search import legacy_queryset
+from airport.models import (
+    AirplaneType,
+    SeatClass,
+    Airplane,
+    Country,
+    Airport,
+    Route,
+    Crew,
+    Flight,
+    FlightCabin,
+    FlightSchedule,
+    FlightSearchRow,
+    Order,
+    SeatHold,
+    Ticket,
+    ThrottleCounter,
+    Cabin,
+)
+from airport.pagination import FlightPagination
+from airport.response_cache import cache_timeout
+from airport.schedules import materialize_schedule, materialize_schedules
+from airport.seat_holds import release_expired_holds
+from airport.seat_map import encode_seats
+from airport.views import FlightViewSet
+
+DEPARTURE_TIME = datetime(2030, 5, 1, 10, tzinfo=timezone.utc)
+
+
+def sample_airplane(**params):
+    seat_class = SeatClass.objects.create(name="Economy")
+    cabins = [
+        Cabin.objects.create(
+            name=f"Cabin {i}", seat_class=seat_class, seats=30
+        )
+        for i in range(3)
+    ]
+    defaults = {
+        "name": "Boeing 737",
+        "airplane_type": AirplaneType.objects.create(name="Narrow-body"),
+    }
+    defaults.update(params)
+
+    airplane = Airplane.objects.create(**defaults)
+    airplane.cabins.set(cabins)
+    return airplane
+
+
+def sample_route(**params):
+    country = Country.objects.create(name="Ukraine")
+    defaults = {
+        "departure": Airport.objects.create(
+            name="Boryspil", near_city="Kyiv", country=country
+        ),
+        "destination": Airport.objects.create(
+            name="Lviv", near_city="Lviv", country=country
+        ),
+        "distance": 470,
+    }
+    defaults.update(params)
+
+    return Route.objects.create(**defaults)
+
+
+def sample_flight(**params):
+    defaults = {
+        "departure_time": DEPARTURE_TIME,
+        "arrival_time": DEPARTURE_TIME + timedelta(hours=1),
+    }
+    defaults.update(params)
+
+    if "route" not in defaults:
+        defaults["route"] = sample_route()
+    if "airplane" not in defaults:
+        defaults["airplane"] = sample_airplane()
+
+    flight = Flight.objects.create(**defaults)
+    flight.crew.add(Crew.objects.create(first_name="John", last_name="Doe"))
+    return flight
+
+
+def sample_order(user, flight, seats):
+    order = Order.objects.create(user=user)
+    cabin = flight.airplane.cabins.first()
+    for seat in seats:
+        Ticket.objects.create(
+            order=order, flight=flight, cabin=cabin, seat=seat
+        )
+    return order
+
+
+@override_settings(THROTTLE_STORE="cache")
+class QueryCountTestCase(APITestCase):
+    """Query counts of the viewset actions, so that N+1 regressions fail
+    the build. Counts must not depend on the number of listed objects.
+    Throttle counters are kept in the cache, so they aren't counted"""
+
+    def setUp(self):
+        cache.clear()
+        caches["throttle"].clear()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.admin = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.client.force_authenticate(self.admin)
+
+    def assertQueries(self, num, method, url, data=None, **kwargs):
+        with self.assertNumQueries(num):
+            response = getattr(self.client, method)(
+                url, data, format="json", **kwargs
+            )
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+
+class AdminViewSetQueryCountTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(3):
+            sample_airplane()
+            sample_route()
+            Crew.objects.create(first_name="Jane", last_name="Doe")
+
+    def test_airplane_types(self):
+        url = reverse("airport:airplanetype-list")
+        self.assertQueries(1, "get", url)
+        self.assertQueries(1, "post", url, {"name": "Wide-body"})
+
+    def test_seat_classes(self):
+        url = reverse("airport:seatclass-list")
+        self.assertQueries(1, "get", url)
+        self.assertQueries(1, "post", url, {"name": "Business"})
+
+    def test_cabins(self):
+        url = reverse("airport:cabin-list")
+        seat_class = SeatClass.objects.first()
+        self.assertQueries(1, "get", url)
+        self.assertQueries(
+            2,
+            "post",
+            url,
+            {"name": "First", "seat_class": seat_class.id, "seats": 8},
+        )
+
+    def test_airplanes(self):
+        url = reverse("airport:airplane-list")
+        self.assertQueries(3, "get", url)
+        self.assertQueries(
+            18,
+            "post",
+            url,
+            {
+                "name": "Airbus A320",
+                "airplane_type": AirplaneType.objects.first().id,
+                "cabins": list(Cabin.objects.values_list("id", flat=True)),
+            },
+        )
+
+    def test_countries(self):
+        url = reverse("airport:country-list")
+        self.assertQueries(1, "get", url)
+        self.assertQueries(1, "post", url, {"name": "Poland"})
+
+    def test_country_upload_image(self):
+        country = Country.objects.first()
+        url = reverse("airport:country-upload-image", args=[country.id])
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                with tempfile.NamedTemporaryFile(suffix=".jpg") as image:
+                    Image.new("RGB", (10, 10)).save(image, format="JPEG")
+                    image.seek(0)
+                    with self.assertNumQueries(3):
+                        response = self.client.post(
+                            url, {"image": image}, format="multipart"
+                        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_airports(self):
+        url = reverse("airport:airport-list")
+        self.assertQueries(1, "get", url)
+        self.assertQueries(
+            2,
+            "post",
+            url,
+            {
+                "name": "Chopin",
+                "near_city": "Warsaw",
+                "country": Country.objects.first().id,
+            },
+        )
+
+    def test_routes(self):
+        url = reverse("airport:route-list")
+        route = Route.objects.first()
+        self.assertQueries(1, "get", url)
+        self.assertQueries(
+            1, "get", reverse("airport:route-detail", args=[route.id])
+        )
+        self.assertQueries(
+            3,
+            "post",
+            url,
+            {
+                "departure": route.destination_id,
+                "destination": route.departure_id,
+                "distance": 470,
+            },
+        )
+
+    def test_crew(self):
+        url = reverse("airport:crew-list")
+        self.assertQueries(1, "get", url)
+        self.assertQueries(
+            1, "post", url, {"first_name": "Max", "last_name": "Payne"}
+        )
+
+
+class CountryImageTests(QueryCountTestCase):
+    def test_country_image_variants(self):
+        flight = sample_flight()
+        country = flight.route.destination.country
+        upload_url = reverse("airport:country-upload-image", args=[country.id])
+        flight_url = reverse("airport:flight-detail", args=[flight.id])
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                with tempfile.NamedTemporaryFile(suffix=".jpg") as image:
+                    Image.new("RGB", (800, 400)).save(image, format="JPEG")
+                    image.seek(0)
+                    with self.captureOnCommitCallbacks() as callbacks:
+                        self.client.post(
+                            upload_url, {"image": image}, format="multipart"
+                        )
+                # the cache is expired and the variants are scheduled
+                self.assertEqual(len(callbacks), 2)
+
+                # original image is served until the variants are built
+                image = self.client.get(flight_url).data["image"]
+                self.assertIn("uploads/countries/", image["src"])
+                self.assertEqual(image["srcset"], {})
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    generate_image_variants(country.id)
+                response = self.client.get(flight_url)
+
+        image = response.data["image"]
+        self.assertRegex(image["src"], r"derived/[0-9a-f]{16}-800w\.jpeg$")
+        self.assertEqual(
+            [
+                candidate.rsplit(" ", 1)[1]
+                for candidate in image["srcset"]["image/webp"].split(", ")
+            ],
+            ["320w", "640w", "800w"],
+        )
+        self.assertIn("image/jpeg", image["srcset"])
+
+
+class AirplaneCapacityTests(QueryCountTestCase):
+    def test_airplane_capacity_follows_cabins(self):
+        airplane = sample_airplane()
+        first, second, third = airplane.cabins.all()
+
+        def assertCapacity(capacity, by_class):
+            airplane.refresh_from_db()
+            self.assertEqual(airplane.capacity, capacity)
+            self.assertEqual(airplane.seat_class_capacity, by_class)
+
+        assertCapacity(90, {"Economy": 90})
+
+        first.seat_class = SeatClass.objects.create(name="Business")
+        first.seats = 12
+        first.save()
+        assertCapacity(72, {"Economy": 60, "Business": 12})
+
+        SeatClass.objects.filter(name="Business").get().save()
+        first.seat_class.name = "First"
+        first.seat_class.save()
+        assertCapacity(72, {"Economy": 60, "First": 12})
+
+        airplane.cabins.remove(second)
+        assertCapacity(42, {"Economy": 30, "First": 12})
+
+        third.delete()
+        assertCapacity(12, {"First": 12})
+
+
+class SeatCounterTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        self.first, self.second, self.third = self.flight.airplane.cabins.all()
+
+    def assertCounters(self, total, sold, by_cabin):
+        self.flight.refresh_from_db()
+        self.assertEqual(
+            (self.flight.seats_total, self.flight.seats_sold), (total, sold)
+        )
+        self.assertEqual(
+            dict(
+                FlightCabin.objects.filter(flight=self.flight).values_list(
+                    "cabin_id", "seats_sold"
+                )
+            ),
+            by_cabin,
+        )
+
+    def test_counters_follow_tickets(self):
+        order = sample_order(self.user, self.flight, [1, 2])
+        self.assertCounters(
+            90, 2, {self.first.id: 2, self.second.id: 0, self.third.id: 0}
+        )
+
+        ticket = order.tickets.first()
+        ticket.cabin = self.second
+        ticket.save()
+        self.assertCounters(
+            90, 2, {self.first.id: 1, self.second.id: 1, self.third.id: 0}
+        )
+
+        ticket.delete()
+        self.assertCounters(
+            90, 1, {self.first.id: 1, self.second.id: 0, self.third.id: 0}
+        )
+
+    def test_deleted_cabin_is_removed_from_counters(self):
+        sample_order(self.user, self.flight, [1])
+
+        self.third.delete()
+        self.assertCounters(60, 1, {self.first.id: 1, self.second.id: 0})
+
+    def test_rebuild_seat_counters(self):
+        sample_order(self.user, self.flight, [1, 2])
+        Flight.objects.update(seats_total=10, seats_sold=0)
+        FlightCabin.objects.filter(cabin=self.third).delete()
+
+        with self.assertRaisesMessage(
+            CommandError,
+            f"1 flight(s) have wrong seat counters: {self.flight.id}",
+        ):
+            call_command("rebuild_seat_counters", "--verify")
+        self.assertCounters(10, 0, {self.first.id: 2, self.second.id: 0})
+
+        out = io.StringIO()
+        call_command("rebuild_seat_counters", stdout=out)
+        self.assertIn("Rebuilt seat counters of 1 flight(s)", out.getvalue())
+        self.assertCounters(
+            90, 2, {self.first.id: 2, self.second.id: 0, self.third.id: 0}
+        )
+
+        out = io.StringIO()
+        call_command("rebuild_seat_counters", "--verify", stdout=out)
+        self.assertIn("Seat counters are correct", out.getvalue())
+
+
+class FlightViewSetQueryCountTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        for _ in range(5):
+            sample_flight(
+                route=self.flight.route, airplane=self.flight.airplane
+            )
+        sample_order(self.user, self.flight, range(1, 6))
+
+    def test_list(self):
+        url = reverse("airport:flight-list")
+        self.assertQueries(2, "get", url)
+        self.assertQueries(0, "get", url)
+
+        # places are matched on search rows, without a query of routes
+        cache.clear()
+        self.assertQueries(2, "get", url, {"from": "Kyiv", "to": "Lviv"})
+        self.assertQueries(
+            1, "get", url, {"pagination": "cursor", "date": "2030-05-01"}
+        )
+
+    def test_calendar(self):
+        flight = sample_flight(
+            route=self.flight.route,
+            airplane=self.flight.airplane,
+            departure_time=DEPARTURE_TIME + timedelta(days=2, hours=-2),
+            arrival_time=DEPARTURE_TIME + timedelta(days=2),
+        )
+        sample_order(self.user, flight, range(1, 11))
+        url = reverse("airport:flight-calendar")
+        params = {"from": "Kyiv", "to": "Lviv", "month": "2030-05"}
+
+        response = self.assertQueries(1, "get", url, params)
+        self.assertQueries(0, "get", url, params)
+        self.assertEqual(len(response.data), 31)
+        self.assertEqual(
+            response.data[:3],
+            [
+                {
+                    "date": "2030-05-01",
+                    "flights": 6,
+                    "first_departure": "2030-05-01T10:00:00Z",
+                    "max_tickets_available": 90,
+                },
+                {
+                    "date": "2030-05-02",
+                    "flights": 0,
+                    "first_departure": None,
+                    "max_tickets_available": None,
+                },
+                {
+                    "date": "2030-05-03",
+                    "flights": 1,
+                    "first_departure": "2030-05-03T08:00:00Z",
+                    "max_tickets_available": 80,
+                },
+            ],
+        )
+
+        for month in ("", "May"):
+            response = self.client.get(url, {"month": month})
+            self.assertEqual(response.status_code, 400)
+
+    def test_retrieve(self):
+        url = reverse("airport:flight-detail", args=[self.flight.id])
+        self.assertQueries(4, "get", url)
+        self.assertQueries(0, "get", url)
+
+    def test_seats(self):
+        url = reverse("airport:flight-seats", args=[self.flight.id])
+        self.assertQueries(4, "get", url)
+        self.assertQueries(1, "get", url)
+
+    def test_holds(self):
+        url = reverse("airport:flight-holds", args=[self.flight.id])
+        cabin = self.flight.airplane.cabins.first()
+
+        # one active hold of a user on the flight
+        for user, seats in ((self.admin, [10]), (self.user, range(11, 20))):
+            self.client.force_authenticate(user)
+            self.assertQueries(
+                19,
+                "post",
+                url,
+                {
+                    "seats": [
+                        {"cabin": cabin.id, "seat": seat} for seat in seats
+                    ]
+                },
+            )
+
+    def test_cache_stats(self):
+        self.assertQueries(0, "get", reverse("airport:flight-cache-stats"))
+
+    def test_create(self):
+        self.assertQueries(
+            16,
+            "post",
+            reverse("airport:flight-list"),
+            {
+                "route": self.flight.route_id,
+                "airplane": self.flight.airplane_id,
+                "crew": list(self.flight.crew.values_list("id", flat=True)),
+                "departure_time": DEPARTURE_TIME,
+                "arrival_time": DEPARTURE_TIME + timedelta(hours=1),
+            },
+        )
+
+    def test_update(self):
+        url = reverse("airport:flight-detail", args=[self.flight.id])
+        self.assertQueries(
+            12,
+            "put",
+            url,
+            {
+                "route": self.flight.route_id,
+                "airplane": self.flight.airplane_id,
+                "crew": list(self.flight.crew.values_list("id", flat=True)),
+                "departure_time": DEPARTURE_TIME,
+                "arrival_time": DEPARTURE_TIME + timedelta(hours=2),
+            },
+        )
+        self.assertQueries(
+            8,
+            "patch",
+            url,
+            {"arrival_time": DEPARTURE_TIME + timedelta(hours=3)},
+        )
+
+    def test_destroy(self):
+        self.assertQueries(
+            9,
+            "delete",
+            reverse("airport:flight-detail", args=[self.flight.id]),
+        )
+
+
+class ResponseCacheTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        self.urls = [
+            reverse("airport:flight-list"),
+            reverse("airport:flight-detail", args=[self.flight.id]),
+            reverse("airport:flight-detail", args=[f"0{self.flight.id}"]),
+        ]
+
+    def assertCache(self, result):
+        for url in self.urls:
+            self.assertEqual(self.client.get(url)["X-Cache"], result, url)
+
+    def assertExpiredBy(self, change):
+        self.assertCache("MISS")
+        self.assertCache("HIT")
+
+        # readers of the uncommitted rows don't cache them as current
+        with self.captureOnCommitCallbacks() as callbacks:
+            change()
+        self.assertCache("HIT")
+
+        for callback in callbacks:
+            callback()
+        self.assertCache("MISS")
+
+    def test_ticket_change_expires_responses(self):
+        self.assertExpiredBy(lambda: sample_order(self.user, self.flight, [1]))
+
+    def test_flight_change_expires_responses(self):
+        def change():
+            self.flight.arrival_time += timedelta(hours=1)
+            self.flight.save()
+
+        self.assertExpiredBy(change)
+
+    def test_catalog_change_expires_responses(self):
+        def change():
+            airport = self.flight.route.departure
+            airport.name = "Kyiv Boryspil"
+            airport.save()
+
+        self.assertExpiredBy(change)
+
+    def test_detail_of_invalid_id(self):
+        response = self.client.get(
+            reverse("airport:flight-detail", args=["first"])
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_local_cache_timeout(self):
+        with override_settings(SHARED_CACHE=False, LOCAL_CACHE_TIMEOUT=5):
+            self.assertEqual(cache_timeout(300), 5)
+        with override_settings(SHARED_CACHE=True):
+            self.assertEqual(cache_timeout(300), 300)
+
+
+class SeatMapTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        self.cabin = self.flight.airplane.cabins.first()
+        self.url = reverse("airport:flight-seats", args=[self.flight.id])
+
+    def test_encode_seats(self):
+        # seat N is bit (N - 1) % 8 of byte (N - 1) // 8
+        self.assertEqual(
+            base64.b64decode(encode_seats([1, 8, 9, 17], 17)),
+            bytes([0b10000001, 0b00000001, 0b00000001]),
+        )
+        self.assertEqual(base64.b64decode(encode_seats([0, 18], 17)), bytes(3))
+        self.assertEqual(encode_seats([], 0), "")
+
+    def cabin_map(self):
+        response = self.client.get(self.url)
+        for cabin in response.data["cabins"]:
+            if cabin["id"] == self.cabin.id:
+                return cabin
+
+    def test_map_follows_tickets_and_holds(self):
+        self.assertEqual(self.cabin_map()["bitmap"], "AAAAAA==")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sample_order(self.user, self.flight, [2])
+        cabin = self.cabin_map()
+        self.assertEqual((cabin["taken"], cabin["held"]), (1, 0))
+        self.assertEqual(base64.b64decode(cabin["bitmap"])[0], 0b10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("airport:flight-holds", args=[self.flight.id]),
+                {"seats": [{"cabin": self.cabin.id, "seat": 3}]},
+                format="json",
+            )
+        cabin = self.cabin_map()
+        self.assertEqual((cabin["taken"], cabin["held"]), (1, 1))
+        self.assertEqual(base64.b64decode(cabin["bitmap"])[0], 0b110)
+
+        SeatHold.objects.update(
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired_holds()
+        cabin = self.cabin_map()
+        self.assertEqual((cabin["taken"], cabin["held"]), (1, 0))
+        self.assertEqual(base64.b64decode(cabin["bitmap"])[0], 0b10)
+
+
+class SeatHoldTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        self.cabin = self.flight.airplane.cabins.first()
+        self.client.force_authenticate(self.user)
+
+    def hold(self, *seats):
+        return self.client.post(
+            reverse("airport:flight-holds", args=[self.flight.id]),
+            {
+                "seats": [
+                    {"cabin": self.cabin.id, "seat": seat} for seat in seats
+                ]
+            },
+            format="json",
+        )
+
+    def order(self, **data):
+        return self.client.post(
+            reverse("airport:order-list"), data, format="json"
+        )
+
+    def ticket(self, seat):
+        return {"flight": self.flight.id, "cabin": self.cabin.id, "seat": seat}
+
+    def assertCounters(self, sold, held):
+        self.flight.refresh_from_db()
+        self.assertEqual(
+            (self.flight.seats_sold, self.flight.seats_held), (sold, held)
+        )
+
+    def test_hold_is_converted_into_tickets(self):
+        hold = self.hold(5, 6)
+        self.assertEqual(hold.status_code, status.HTTP_201_CREATED)
+        self.assertCounters(0, 2)
+
+        response = self.order(hold=hold.data["id"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [ticket["seat"] for ticket in response.data["tickets"]], [5, 6]
+        )
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertCounters(2, 0)
+
+    def test_hold_of_another_user_or_expired(self):
+        hold = self.hold(5).data["id"]
+
+        self.client.force_authenticate(self.admin)
+        response = self.order(hold=hold)
+        self.assertEqual(
+            response.data["hold"], ["Hold belongs to another user"]
+        )
+
+        self.client.force_authenticate(self.user)
+        SeatHold.objects.update(
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        response = self.order(hold=hold)
+        self.assertEqual(response.data["hold"], ["Hold has expired"])
+
+    def test_expired_hold_is_released_on_new_hold(self):
+        self.hold(5, 6)
+        SeatHold.objects.update(
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        # expired holds count until released
+        self.assertCounters(0, 2)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.hold(5).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(SeatHold.objects.count(), 1)
+        self.assertCounters(0, 1)
+
+    def test_seats_are_claimed_once(self):
+        self.hold(5)
+        self.order(tickets=[self.ticket(6)])
+
+        self.client.force_authenticate(self.admin)
+        for response in (
+            self.hold(5),
+            self.hold(6),
+            self.hold(7, 7),
+            self.order(tickets=[self.ticket(5)]),
+            self.order(tickets=[self.ticket(6)]),
+        ):
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertCounters(1, 1)
+
+    def test_holds_are_limited(self):
+        response = self.hold(*range(1, 11))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["seats"]["non_field_errors"],
+            ["Ensure this field has no more than 9 elements."],
+        )
+
+        self.assertEqual(self.hold(1, 2).status_code, status.HTTP_201_CREATED)
+        response = self.hold(3)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(
+            "You already hold seats", response.data["non_field_errors"][0]
+        )
+
+        # other users and expired holds don't count
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.hold(3).status_code, status.HTTP_201_CREATED)
+        self.client.force_authenticate(self.user)
+        SeatHold.objects.update(
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        self.assertEqual(self.hold(3).status_code, status.HTTP_201_CREATED)
+        self.assertCounters(0, 1)
+
+    def test_claims_made_after_validation_are_rejected(self):
+        # a hold or an order committed between validation and create
+        # passes validation, the check under the flight lock rejects it
+        hold = self.hold(5).data["id"]
+        with mock.patch.object(Ticket, "validate_tickets"):
+            response = self.order(tickets=[self.ticket(5)])
+        self.assertEqual(
+            response.data["tickets"],
+            ["Some of the seats are held by another customer"],
+        )
+
+        SeatHold.objects.filter(pk=hold).delete()
+        self.order(tickets=[self.ticket(6)])
+        with mock.patch.object(Ticket, "validate_tickets"):
+            response = self.hold(6)
+        self.assertEqual(
+            response.data["seats"], ["Some of the seats are already taken"]
+        )
+
+
+class DepartureRangeTests(QueryCountTestCase):
+    def departure_range(self, **params):
+        view = FlightViewSet()
+        view.request = Request(RequestFactory().get("/", params))
+        return view.get_departure_range()
+
+    def test_dates_and_times_give_half_open_ranges(self):
+        def utc(day, hour=0, minute=0):
+            return datetime(2030, 5, day, hour, minute, tzinfo=timezone.utc)
+
+        for params, expected in (
+            ({}, (None, None)),
+            ({"date": "2030-05-01"}, (utc(1), utc(2))),
+            (
+                {"date_from": "2030-05-01", "date_to": "2030-05-03"},
+                (utc(1), utc(4)),
+            ),
+            ({"date_from": "2030-05-01"}, (utc(1), None)),
+            ({"date_to": "2030-05-03"}, (None, utc(4))),
+            (
+                {"date": "2030-05-01", "date_to": "2030-05-03"},
+                (utc(1), utc(4)),
+            ),
+            (
+                {
+                    "date": "2030-05-01",
+                    "time_from": "08:30",
+                    "time_to": "12:00",
+                },
+                (utc(1, 8, 30), utc(1, 12)),
+            ),
+            (
+                {
+                    "date_from": "2030-05-01",
+                    "date_to": "2030-05-03",
+                    "time_from": "22:00",
+                    "time_to": "06:00",
+                },
+                (utc(1, 22), utc(3, 6)),
+            ),
+        ):
+            self.assertEqual(self.departure_range(**params), expected, params)
+
+    def test_last_date_leaves_the_range_open(self):
+        self.assertEqual(
+            self.departure_range(date="9999-12-31"),
+            (datetime(9999, 12, 31, tzinfo=timezone.utc), None),
+        )
+        sample_flight()
+        for name, params in (
+            ("flight-list", {"date": "9999-12-31"}),
+            (
+                "flight-connections",
+                {"from": "Kyiv", "to": "Lviv", "date": "9999-12-31"},
+            ),
+            ("flight-calendar", {"month": "9999-12"}),
+        ):
+            response = self.client.get(reverse(f"airport:{name}"), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, name)
+        self.assertEqual(len(response.data), 31)
+
+    @override_settings(TIME_ZONE="Europe/Kyiv")
+    def test_dates_are_in_the_current_time_zone(self):
+        start, end = self.departure_range(date="2030-05-01", time_to="12:00")
+        self.assertEqual(
+            (start, end),
+            (
+                datetime(2030, 4, 30, 21, tzinfo=timezone.utc),
+                datetime(2030, 5, 1, 9, tzinfo=timezone.utc),
+            ),
+        )
+        self.assertEqual(start.tzinfo, ZoneInfo("Europe/Kyiv"))
+
+    def test_end_of_range_is_excluded(self):
+        flight = sample_flight()
+        for departure_time in (
+            datetime(2030, 5, 1, 23, 59, tzinfo=timezone.utc),
+            datetime(2030, 5, 2, tzinfo=timezone.utc),
+        ):
+            sample_flight(
+                route=flight.route,
+                airplane=flight.airplane,
+                departure_time=departure_time,
+                arrival_time=departure_time + timedelta(hours=1),
+            )
+
+        def departures(**params):
+            response = self.client.get(reverse("airport:flight-list"), params)
+            return [
+                flight["departure_time"] for flight in response.data["results"]
+            ]
+
+        self.assertEqual(
+            departures(date="2030-05-01"),
+            ["2030-05-01T23:59:00Z", "2030-05-01T10:00:00Z"],
+        )
+        self.assertEqual(
+            departures(date="2030-05-01", time_from="10:00", time_to="23:59"),
+            ["2030-05-01T10:00:00Z"],
+        )
+
+    def test_invalid_params(self):
+        url = reverse("airport:flight-list")
+        for params, error in (
+            ({"date": "May"}, {"date": "Must be in format YYYY-MM-DD"}),
+            (
+                {"date_to": "2030-05-32"},
+                {"date_to": "Must be in format YYYY-MM-DD"},
+            ),
+            (
+                {"date": "2030-05-01", "time_from": "8am"},
+                {"time_from": "Must be in format HH:MM"},
+            ),
+            (
+                {"time_to": "12:00"},
+                ["time_from and time_to require date, date_from or date_to"],
+            ),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, params
+            )
+            self.assertEqual(response.data, error)
+
+
+class PlaceSearchTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        ukraine = Country.objects.create(name="Ukraine")
+        poland = Country.objects.create(name="Poland")
+        airports = [
+            Airport.objects.create(name=name, near_city=city, country=country)
+            for name, city, country in (
+                ("Boryspil", "Kyiv", ukraine),
+                ("Zhuliany", "Kyiv", ukraine),
+                ("Lviv", "Lviv", ukraine),
+                ("Chopin", "Warsaw", poland),
+                ("Balice", "Krakow", poland),
+            )
+        ]
+        airplane = sample_airplane()
+        pairs = ((0, 2), (1, 2), (0, 3), (2, 4), (3, 0), (4, 3))
+        for hours, (departure, destination) in enumerate(pairs):
+            sample_flight(
+                route=sample_route(
+                    departure=airports[departure],
+                    destination=airports[destination],
+                ),
+                airplane=airplane,
+                departure_time=DEPARTURE_TIME + timedelta(hours=hours),
+                arrival_time=DEPARTURE_TIME + timedelta(hours=hours + 1),
+            )
+
+    def test_search_matches_name_city_and_country(self):
+        for departure, destination in (
+            ("kyiv", None),
+            ("Boryspil", "lviv"),
+            (None, "POL"),
+            ("pol", "ukraine"),
+            ("war", "kra"),
+            ("Kyiv", "nowhere"),
+        ):
+            expected = set(
+                legacy_queryset(departure, destination).values_list(
+                    "id", flat=True
+                )
+            )
+            params = {}
+            if departure:
+                params["from"] = departure
+            if destination:
+                params["to"] = destination
+
+            response = self.client.get(reverse("airport:flight-list"), params)
+            self.assertEqual(
+                {flight["id"] for flight in response.data["results"]},
+                expected,
+                params,
+            )
+            self.assertEqual(
+                set(
+                    Flight.objects.filter(
+                        route_id__in=Route.ids_between(departure, destination)
+                    ).values_list("id", flat=True)
+                ),
+                expected,
+                params,
+            )
+
+
+class FlightSearchRowTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        self.other = sample_flight(
+            departure_time=DEPARTURE_TIME + timedelta(days=1),
+            arrival_time=DEPARTURE_TIME + timedelta(days=1, hours=2),
+        )
+        self.url = reverse("airport:flight-list")
+
+    def row(self, flight):
+        return FlightSearchRow.objects.values(
+            "origin_name",
+            "origin_city",
+            "origin_country_name",
+            "destination_name",
+            "destination_country_name",
+            "airplane_name",
+            "departure_time",
+            "tickets_available",
+        ).get(flight=flight)
+
+    def test_list_matches_flights(self):
+        self.flight.route.destination.country.name = "Poland"
+        self.flight.route.destination.country.save()
+        sample_order(self.user, self.flight, [1, 2])
+
+        for params in (
+            {},
+            {"from": "Kyiv", "to": "Poland"},
+            {"date": "2030-05-02"},
+            {"pagination": "cursor"},
+        ):
+            cache.clear()
+            rows = self.client.get(self.url, params).data
+            with override_settings(FLIGHT_LIST_FROM_SEARCH_ROWS=False):
+                cache.clear()
+                flights = self.client.get(self.url, params).data
+            self.assertEqual(rows, flights, params)
+
+        # cursors of rows and flights are interchangeable
+        cache.clear()
+        with mock.patch.object(FlightPagination, "page_size", 1):
+            rows = self.client.get(self.url, {"pagination": "cursor"}).data
+            with override_settings(FLIGHT_LIST_FROM_SEARCH_ROWS=False):
+                next_page = self.client.get(rows["next"]).data
+        self.assertEqual(
+            [flight["id"] for flight in rows["results"]], [self.other.id]
+        )
+        self.assertEqual(
+            [flight["id"] for flight in next_page["results"]],
+            [self.flight.id],
+        )
+
+    def test_rows_follow_changes(self):
+        route = self.flight.route
+        route.departure.name = "Zhuliany"
+        route.departure.save()
+        route.destination.country.name = "Poland"
+        route.destination.country.save()
+        self.flight.airplane.name = "Airbus A320"
+        self.flight.airplane.save()
+        self.flight.departure_time -= timedelta(hours=1)
+        self.flight.save()
+        sample_order(self.user, self.flight, [1, 2, 3])
+
+        self.assertEqual(
+            self.row(self.flight),
+            {
+                "origin_name": "Zhuliany",
+                "origin_city": "Kyiv",
+                "origin_country_name": "Poland",
+                "destination_name": "Lviv",
+                "destination_country_name": "Poland",
+                "airplane_name": "Airbus A320",
+                "departure_time": DEPARTURE_TIME - timedelta(hours=1),
+                "tickets_available": 87,
+            },
+        )
+        self.assertEqual(self.row(self.other)["origin_name"], "Boryspil")
+
+        route.destination = self.other.route.departure
+        route.save()
+        self.assertEqual(self.row(self.flight)["destination_name"], "Boryspil")
+
+        # an airport moved to another country
+        destination = route.destination
+        destination.country = Country.objects.create(name="Moldova")
+        destination.save()
+        row = self.row(self.flight)
+        self.assertEqual(
+            (row["destination_name"], row["destination_country_name"]),
+            ("Boryspil", "Moldova"),
+        )
+        self.assertEqual(
+            self.row(self.other)["origin_country_name"], "Moldova"
+        )
+        self.assertEqual(
+            set(
+                FlightSearchRow.matching(None, "Moldova").values_list(
+                    "flight_id", flat=True
+                )
+            ),
+            set(
+                Flight.objects.filter(
+                    route_id__in=Route.ids_between(None, "Moldova")
+                ).values_list("id", flat=True)
+            ),
+        )
+
+        Order.objects.get().delete()
+        self.assertEqual(self.row(self.flight)["tickets_available"], 90)
+
+        self.flight.delete()
+        self.assertFalse(
+            FlightSearchRow.objects.filter(flight=self.flight).exists()
+        )
+
+    def test_rebuild_command(self):
+        FlightSearchRow.objects.all().delete()
+        call_command("rebuild_search_rows", stdout=io.StringIO())
+        self.assertEqual(self.row(self.flight)["tickets_available"], 90)
+        self.assertEqual(FlightSearchRow.objects.count(), 2)
+
+
+class FlightImportTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        Crew.objects.create(first_name="Jane", last_name="Doe")
+        Crew.objects.create(first_name="John", last_name="Roe")
+        self.url = reverse("airport:flight-bulk-import")
+
+    def row(self, day, **params):
+        row = {
+            "departure": "Boryspil",
+            "destination": "Lviv",
+            "airplane": "Boeing 737",
+            "departure_time": f"2030-06-{day:02}T08:00:00Z",
+            "arrival_time": f"2030-06-{day:02}T09:10:00Z",
+            "crew": ["Jane Doe", "John Roe"],
+        }
+        row.update(params)
+        return row
+
+    def test_import_reports_invalid_rows(self):
+        self.client.get(reverse("airport:flight-list"))
+        rows = [
+            self.row(1),
+            self.row(2, crew=[]),
+            self.row(3, airplane="Airbus A320"),
+            self.row(4, arrival_time="2030-06-04T07:00:00Z"),
+            self.row(5, crew=["Max Moe", "Jane Doe", "Ann Poe"]),
+            self.row(1),
+            self.row(1, departure_time=self.flight.departure_time.isoformat()),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, rows, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(
+            {
+                number: set(errors)
+                for number, errors in response.data["errors"].items()
+            },
+            {
+                "3": {"airplane"},
+                "4": {"arrival_time"},
+                "5": {"crew"},
+                "6": {"row"},
+                "7": {"row"},
+            },
+        )
+        self.assertEqual(
+            response.data["errors"]["5"]["crew"],
+            "No crew 'Max Moe'; No crew 'Ann Poe'",
+        )
+
+        flight = Flight.objects.get(
+            departure_time=datetime(2030, 6, 1, 8, tzinfo=timezone.utc)
+        )
+        self.assertEqual(flight.crew.count(), 2)
+        self.assertEqual(flight.seats_total, 90)
+        self.assertEqual(flight.cabin_counters.count(), 3)
+        response = self.client.get(reverse("airport:flight-list"))
+        self.assertEqual(response.data["count"], 3)
+
+    def test_queries_do_not_depend_on_number_of_rows(self):
+        self.assertQueries(16, "post", self.url, [self.row(1)])
+        self.assertQueries(
+            16, "post", self.url, [self.row(day) for day in range(2, 29)]
+        )
+
+    def test_csv_file_and_command(self):
+        content = (
+            "departure,destination,airplane,departure_time,arrival_time,crew\n"
+            "Boryspil,Lviv,Boeing 737,2030-06-01 08:00,2030-06-01 09:10,"
+            "Jane Doe;John Roe\n"
+            "Boryspil,Lviv,Boeing 737,2030-06-02 08:00,2030-06-02 09:10,\n"
+        )
+        response = self.client.post(
+            self.url,
+            {"file": SimpleUploadedFile("flights.csv", content.encode())},
+            format="multipart",
+        )
+        self.assertEqual(response.data, {"created": 2, "errors": {}})
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(content.replace("06-0", "07-0"))
+            file.flush()
+            out = io.StringIO()
+            call_command("import_flights", file.name, stdout=out)
+
+        self.assertIn("Imported 2 flight(s)", out.getvalue())
+        self.assertEqual(Flight.objects.count(), 5)
+
+
+@override_settings(FLIGHT_SCHEDULE_HORIZON_DAYS=14)
+class FlightScheduleTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        flight = sample_flight()
+        self.crew = Crew.objects.create(first_name="Jane", last_name="Doe")
+        self.start = date.today() + timedelta(days=1)
+        self.response = self.client.post(
+            reverse("airport:flightschedule-list"),
+            {
+                "route": flight.route_id,
+                "airplane": flight.airplane_id,
+                "crew": [self.crew.id],
+                "weekdays": [4, 0, 2, 2],
+                "departure_time": "08:30",
+                "duration": "01:10:00",
+                "timezone": "Europe/Kyiv",
+                "valid_from": self.start.isoformat(),
+            },
+            format="json",
+        )
+        self.schedule = FlightSchedule.objects.get()
+        self.url = reverse(
+            "airport:flightschedule-detail", args=[self.schedule.id]
+        )
+
+    def test_flights_are_created_up_to_horizon_once(self):
+        self.assertEqual(self.response.data["weekdays"], [0, 2, 4])
+        flights = self.schedule.flights.all()
+        self.assertEqual(len(flights), 6)
+
+        kyiv = ZoneInfo("Europe/Kyiv")
+        for flight in flights:
+            departure = flight.departure_time.astimezone(kyiv)
+            self.assertIn(departure.weekday(), (0, 2, 4))
+            self.assertEqual((departure.hour, departure.minute), (8, 30))
+            self.assertEqual(
+                flight.arrival_time - flight.departure_time,
+                timedelta(hours=1, minutes=10),
+            )
+            self.assertEqual(flight.seats_total, 90)
+            self.assertEqual(list(flight.crew.all()), [self.crew])
+
+        self.assertEqual(
+            materialize_schedule(self.schedule, update=True),
+            {"created": 0, "updated": 6, "deleted": 0},
+        )
+        # a week later the horizon moves by 8 days past the last run
+        later = self.start + timedelta(days=7)
+        self.assertEqual(
+            materialize_schedules(today=later),
+            sum(
+                (later + timedelta(days=days)).weekday() in (0, 2, 4)
+                for days in range(7, 15)
+            ),
+        )
+        self.assertEqual(materialize_schedules(), 0)
+
+    def test_change_updates_only_future_unsold_flights(self):
+        sold = self.schedule.flights.earliest("departure_time")
+        sample_order(self.user, sold, [1])
+        other_crew = Crew.objects.create(first_name="John", last_name="Roe")
+
+        response = self.client.patch(
+            self.url, {"crew": [other_crew.id]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(sold.crew.all()), [self.crew])
+        self.assertEqual(Flight.objects.filter(crew=other_crew).count(), 5)
+
+        self.client.patch(self.url, {"departure_time": "09:00"})
+        self.assertEqual(self.schedule.flights.count(), 7)
+        self.assertTrue(self.schedule.flights.filter(pk=sold.pk).exists())
+
+        response = self.client.delete(self.url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            list(Flight.objects.exclude(departure_time=DEPARTURE_TIME)),
+            [sold],
+        )
+
+    def test_flight_sold_while_cancelling_is_kept(self):
+        flight = self.schedule.flights.earliest("departure_time")
+        listed = []
+
+        def future_unsold(schedule):
+            # the seat is sold after the flights were listed
+            if listed:
+                sample_order(self.user, flight, [1])
+            listed.append(schedule)
+            return future_unsold.original(schedule)
+
+        future_unsold.original = schedules._future_unsold
+        with mock.patch.object(schedules, "_future_unsold", future_unsold):
+            schedules.cancel_schedule(self.schedule)
+
+        self.assertEqual(len(listed), 2)
+        flight.refresh_from_db()
+        self.assertIsNone(flight.schedule)
+        self.assertEqual(flight.tickets.count(), 1)
+
+    def test_query_counts(self):
+        list_url = reverse("airport:flightschedule-list")
+        data = {
+            "route": self.schedule.route_id,
+            "airplane": self.schedule.airplane_id,
+            "crew": [self.crew.id],
+            "weekdays": [0, 1, 2, 3, 4, 5, 6],
+            "departure_time": "18:00",
+            "duration": "02:00:00",
+            "timezone": "UTC",
+            "valid_from": self.start.isoformat(),
+        }
+        self.assertQueries(2, "get", list_url)
+        self.assertQueries(24, "post", list_url, data)
+        self.assertQueries(2, "get", list_url)
+        self.assertQueries(2, "get", self.url)
+        self.assertQueries(34, "put", self.url, data)
+        self.assertQueries(30, "patch", self.url, {"departure_time": "19:00"})
+        self.assertQueries(16, "delete", self.url)
+
+    def test_admin_bulk_delete_cancels_schedules(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            reverse("admin:airport_flightschedule_changelist"),
+            {
+                "action": "delete_selected",
+                "_selected_action": [self.schedule.id],
+                "post": "yes",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertFalse(FlightSchedule.objects.exists())
+        self.assertFalse(
+            Flight.objects.filter(schedule=None)
+            .exclude(departure_time=DEPARTURE_TIME)
+            .exists()
+        )
+
+    def test_invalid_schedule(self):
+        response = self.client.patch(
+            self.url,
+            {
+                "weekdays": [7],
+                "timezone": "Mars/Olympus",
+                "valid_until": "2000-01-01",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"weekdays", "timezone"})
+
+
+class ConnectionSearchTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        country = Country.objects.create(name="Europe")
+        airports = {
+            code: Airport.objects.create(
+                name=name, near_city=city, country=country
+            )
+            for code, name, city in (
+                ("KBP", "Boryspil", "Kyiv"),
+                ("LWO", "Lviv", "Lviv"),
+                ("WAW", "Chopin", "Warsaw"),
+                ("KRK", "Balice", "Krakow"),
+            )
+        }
+        airplane = sample_airplane()
+        self.flights = {}
+        for legs, departure, arrival in (
+            ("KBP-WAW", "10:00", "12:30"),
+            ("KBP-LWO", "08:00", "09:00"),
+            ("LWO-WAW", "09:20", "10:20"),
+            ("LWO-WAW", "10:00", "11:00"),
+            ("WAW-KRK", "12:00", "13:00"),
+            ("WAW-KRK", "13:30", "14:30"),
+        ):
+            origin, destination = legs.split("-")
+            route, _ = Route.objects.get_or_create(
+                departure=airports[origin],
+                destination=airports[destination],
+                defaults={"distance": 500},
+            )
+            self.flights[f"{legs} {departure}"] = Flight.objects.create(
+                route=route,
+                airplane=airplane,
+                departure_time=datetime.fromisoformat(
+                    f"2030-05-01T{departure}+00:00"
+                ),
+                arrival_time=datetime.fromisoformat(
+                    f"2030-05-01T{arrival}+00:00"
+                ),
+            )
+        self.url = reverse("airport:flight-connections")
+
+    def search(self, **params):
+        response = self.client.get(
+            self.url, {"from": "Kyiv", "date": "2030-05-01", **params}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return [
+            (
+                [flight["id"] for flight in connection["flights"]],
+                connection["duration"],
+                connection["stops"],
+            )
+            for connection in response.data
+        ]
+
+    def ids(self, *names):
+        return [self.flights[name].id for name in names]
+
+    def test_connections_sorted_by_duration(self):
+        self.assertEqual(
+            self.search(to="Warsaw"),
+            [
+                (self.ids("KBP-WAW 10:00"), "02:30:00", 0),
+                (self.ids("KBP-LWO 08:00", "LWO-WAW 10:00"), "03:00:00", 1),
+            ],
+        )
+        self.assertEqual(
+            self.search(to="Warsaw", max_stops=0),
+            [(self.ids("KBP-WAW 10:00"), "02:30:00", 0)],
+        )
+        self.assertEqual(
+            self.search(to="Krakow", max_stops=2),
+            [
+                (
+                    self.ids("KBP-WAW 10:00", "WAW-KRK 13:30"),
+                    "04:30:00",
+                    1,
+                ),
+                (
+                    self.ids(
+                        "KBP-LWO 08:00", "LWO-WAW 10:00", "WAW-KRK 12:00"
+                    ),
+                    "05:00:00",
+                    2,
+                ),
+                (
+                    self.ids(
+                        "KBP-LWO 08:00", "LWO-WAW 10:00", "WAW-KRK 13:30"
+                    ),
+                    "06:30:00",
+                    2,
+                ),
+            ],
+        )
+        self.assertEqual(
+            self.search(to="Krakow", max_stops=2, limit=1),
+            [(self.ids("KBP-WAW 10:00", "WAW-KRK 13:30"), "04:30:00", 1)],
+        )
+        self.assertEqual(self.search(to="Krakow", date="2030-05-02"), [])
+
+    def test_graph_follows_flight_and_route_changes(self):
+        self.search(to="Warsaw")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flights["KBP-WAW 10:00"].delete()
+            flight = self.flights["LWO-WAW 09:20"]
+            flight.departure_time += timedelta(minutes=40)
+            flight.arrival_time += timedelta(minutes=30)
+            flight.save()
+
+        self.assertEqual(
+            self.search(to="Warsaw"),
+            [
+                (self.ids("KBP-LWO 08:00", "LWO-WAW 09:20"), "02:50:00", 1),
+                (self.ids("KBP-LWO 08:00", "LWO-WAW 10:00"), "03:00:00", 1),
+            ],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            route = flight.route
+            route.destination = Airport.objects.get(name="Balice")
+            route.save()
+
+        # both flights of the route now land in Krakow
+        self.assertEqual(
+            self.search(to="Krakow"),
+            [
+                (self.ids("KBP-LWO 08:00", "LWO-WAW 09:20"), "02:50:00", 1),
+                (self.ids("KBP-LWO 08:00", "LWO-WAW 10:00"), "03:00:00", 1),
+            ],
+        )
+
+    def test_changes_give_a_new_graph(self):
+        graph = flight_graph.FlightGraph.build()
+        flight = self.flights["KBP-WAW 10:00"]
+        flight_id, origin_id = flight.id, flight.route.departure_id
+        legs = list(graph.legs[origin_id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.delete()
+        refreshed = graph.refresh()
+
+        # searches still running on the previous graph are not disturbed
+        self.assertIsNot(refreshed, graph)
+        self.assertIn(flight_id, graph.flights)
+        self.assertEqual(graph.legs[origin_id], legs)
+        self.assertNotIn(flight_id, refreshed.flights)
+        self.assertEqual(len(refreshed.legs[origin_id]), len(legs) - 1)
+        self.assertIs(refreshed.refresh(), refreshed)
+
+    def test_searches_do_not_wait_for_update(self):
+        graph = flight_graph.get_graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flights["KBP-WAW 10:00"].delete()
+
+        with flight_graph._lock:
+            self.assertIs(flight_graph.get_graph(), graph)
+        self.assertIsNot(flight_graph.get_graph(), graph)
+
+    @override_settings(SHARED_CACHE=False, GRAPH_LOCAL_MAX_AGE=60)
+    def test_graph_is_rebuilt_without_shared_cache(self):
+        graph = flight_graph.FlightGraph.build()
+        self.assertIs(graph.refresh(), graph)
+
+        # changes of other processes aren't logged in the local cache
+        flight = self.flights["KBP-WAW 10:00"]
+        Flight.objects.filter(pk=flight.pk).delete()
+        graph.built_at -= 61
+        rebuilt = graph.refresh()
+
+        self.assertIsNot(rebuilt, graph)
+        self.assertNotIn(flight.pk, rebuilt.flights)
+
+    def test_connections_query_count(self):
+        self.search(to="Warsaw")
+        self.assertQueries(
+            3,
+            "get",
+            self.url,
+            {"from": "Kyiv", "to": "Krakow", "date": "2030-05-01"},
+        )
+
+    def test_connections_validate_params(self):
+        for params in (
+            {"to": "Warsaw", "date": ""},
+            {"to": "", "date": "2030-05-01"},
+            {"to": "Warsaw", "max_stops": 3},
+            {"to": "Warsaw", "limit": "all"},
+        ):
+            response = self.client.get(
+                self.url,
+                {"from": "Kyiv", "date": "2030-05-01", **params},
+            )
+            self.assertEqual(response.status_code, 400, params)
+
+
+class RoutePlanTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        country = Country.objects.create(name="Europe")
+        airports = [
+            Airport.objects.create(name=name, near_city=name, country=country)
+            for name in ("Kyiv", "Lviv", "Krakow", "Warsaw", "Vienna")
+        ]
+        kyiv, lviv, krakow, warsaw, _ = airports
+        self.routes = [
+            Route.objects.create(
+                departure=departure, destination=destination, distance=distance
+            )
+            for departure, destination, distance in (
+                (kyiv, warsaw, 900),
+                (kyiv, lviv, 300),
+                (lviv, krakow, 200),
+                (krakow, warsaw, 250),
+                (warsaw, kyiv, 100),
+            )
+        ]
+        self.url = reverse("airport:route-plan")
+
+    def plan(self, destination="Warsaw"):
+        response = self.client.get(
+            self.url, {"from": "Kyiv", "to": destination}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return {
+            name: path
+            and (
+                path["distance"],
+                path["hops"],
+                [route["id"] for route in path["routes"]],
+            )
+            for name, path in response.data.items()
+        }
+
+    def test_plan_shortest_and_fewest_hops_paths(self):
+        direct, *via_lviv, _ = (route.id for route in self.routes)
+        self.assertEqual(
+            self.plan(),
+            {
+                "shortest": (750, 3, via_lviv),
+                "fewest_hops": (900, 1, [direct]),
+            },
+        )
+        self.assertEqual(
+            self.plan("Vienna"), {"shortest": None, "fewest_hops": None}
+        )
+
+    def test_plan_follows_route_changes(self):
+        self.plan()
+        direct = self.routes[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            direct.distance = 700
+            direct.save()
+
+        self.assertEqual(
+            self.plan(),
+            {
+                "shortest": (700, 1, [direct.id]),
+                "fewest_hops": (700, 1, [direct.id]),
+            },
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.routes[2].delete()
+
+        self.assertEqual(
+            self.plan("Krakow"), {"shortest": None, "fewest_hops": None}
+        )
+
+    @override_settings(SHARED_CACHE=False, GRAPH_LOCAL_MAX_AGE=60)
+    def test_network_is_rebuilt_without_shared_cache(self):
+        network = route_planner.get_network()
+        self.assertIs(route_planner.get_network(), network)
+
+        network.built_at -= 61
+        self.assertIsNot(route_planner.get_network(), network)
+
+    def test_plan_query_count(self):
+        self.plan()
+        self.assertQueries(
+            3, "get", self.url, {"from": "Kyiv", "to": "Warsaw"}
+        )
+
+
+class KeysetPaginationTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("airport:flight-list")
+        flight = sample_flight()
+        # twelve flights at three departure times, two pages of ten
+        for index in range(11):
+            sample_flight(
+                route=flight.route,
+                airplane=flight.airplane,
+                departure_time=DEPARTURE_TIME + timedelta(hours=index % 3),
+                arrival_time=DEPARTURE_TIME + timedelta(hours=5),
+            )
+
+    def expected_ids(self):
+        return list(
+            Flight.objects.order_by("-departure_time", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def walk(self, url, params=None):
+        """Ids of the rows of the pages following next links"""
+        ids = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [row["id"] for row in response.data["results"]]
+            url, params = response.data["next"], None
+        return ids
+
+    def test_pages_with_equal_departure_times(self):
+        for mode in ("cursor", "page"):
+            ids = self.walk(self.url, {"pagination": mode})
+            self.assertEqual(ids, self.expected_ids(), mode)
+
+        # as well on search rows and on flights
+        with override_settings(FLIGHT_LIST_FROM_SEARCH_ROWS=False):
+            ids = self.walk(self.url, {"pagination": "cursor"})
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_cursor_pages_are_stable_on_insert(self):
+        expected = self.expected_ids()
+        response = self.client.get(self.url, {"pagination": "cursor"})
+        first = [row["id"] for row in response.data["results"]]
+        self.assertEqual(first, expected[:10])
+
+        # a later flight and one tied with the last row of the page both
+        # sort before the cursor, an earlier one after it
+        flight = Flight.objects.get(pk=first[-1])
+        for departure_time in (
+            DEPARTURE_TIME + timedelta(hours=10),
+            flight.departure_time,
+            DEPARTURE_TIME - timedelta(hours=1),
+        ):
+            sample_flight(
+                route=flight.route,
+                airplane=flight.airplane,
+                departure_time=departure_time,
+                arrival_time=DEPARTURE_TIME + timedelta(hours=11),
+            )
+        cache.clear()
+
+        self.assertEqual(
+            self.walk(response.data["next"]),
+            expected[10:] + [self.expected_ids()[-1]],
+        )
+
+    def test_order_pages_with_equal_creation_times(self):
+        flight = Flight.objects.first()
+        self.client.force_authenticate(self.user)
+        for seat in range(1, 13):
+            sample_order(self.user, flight, [seat])
+        Order.objects.update(created_at=DEPARTURE_TIME)
+
+        self.assertEqual(
+            self.walk(reverse("airport:order-list"), {"pagination": "cursor"}),
+            list(Order.objects.order_by("-id").values_list("id", flat=True)),
+        )
+
+    def test_invalid_cursor(self):
+        def encode(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode())
+
+        for cursor in (
+            "not a cursor",
+            encode({"departure_time": "2030-05-01"}),
+            encode(["2030-05-01T10:00:00+00:00"]),
+            encode(["May", 1]),
+            encode(["2030-05-01T10:00:00+00:00", "one"]),
+        ):
+            response = self.client.get(self.url, {"cursor": cursor})
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND, cursor
+            )
+            self.assertEqual(response.data["detail"], "Invalid cursor")
+
+
+class OrderViewSetQueryCountTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.flight = sample_flight()
+
+    def test_list_does_not_depend_on_number_of_tickets(self):
+        url = reverse("airport:order-list")
+        sample_order(self.user, self.flight, [1])
+        self.assertQueries(3, "get", url)
+
+        for seat in range(2, 12, 2):
+            sample_order(self.user, self.flight, [seat, seat + 1])
+        self.assertQueries(3, "get", url)
+        self.assertQueries(2, "get", url, {"pagination": "cursor"})
+
+    def test_create_does_not_depend_on_number_of_tickets(self):
+        url = reverse("airport:order-list")
+        cabin = self.flight.airplane.cabins.first()
+
+        for seats in ([1], range(2, 11)):
+            self.assertQueries(
+                15,
+                "post",
+                url,
+                {
+                    "tickets": [
+                        {
+                            "flight": self.flight.id,
+                            "cabin": cabin.id,
+                            "seat": seat,
+                        }
+                        for seat in seats
+                    ]
+                },
+            )
+
+
+class OrderTicketValidationTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.flight = sample_flight()
+        self.cabin = self.flight.airplane.cabins.first()
+        sample_order(self.user, self.flight, [6])
+
+    def order(self, *seats, cabin=None):
+        cabin = cabin or self.cabin
+        return self.client.post(
+            reverse("airport:order-list"),
+            {
+                "tickets": [
+                    {"flight": self.flight.id, "cabin": cabin.id, "seat": seat}
+                    for seat in seats
+                ]
+            },
+            format="json",
+        )
+
+    def assertRejected(self, response, error, field="non_field_errors"):
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[field], [error])
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.seats_sold, 1)
+
+    def test_seats_are_checked_for_the_whole_order(self):
+        self.assertRejected(
+            self.order(4, 5, 4),
+            "Seat 4 in cabin 'Cabin 0' is ordered more than once",
+        )
+        self.assertRejected(
+            self.order(5, 6), "Seat 6 in cabin 'Cabin 0' is already taken"
+        )
+        for seat in (0, 31):
+            self.assertRejected(
+                self.order(5, seat), "Seat number must be in range (1, 30)"
+            )
+
+        other_cabin = sample_airplane().cabins.first()
+        self.assertRejected(
+            self.order(5, cabin=other_cabin), "Airplane has no cabin 'Cabin 0'"
+        )
+
+        response = self.order(4, 5)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Ticket.objects.count(), 3)
+
+    def test_seat_taken_after_validation(self):
+        # a ticket committed between validation and insert hits the unique
+        # constraint, which is reported as a validation error
+        with mock.patch.object(Ticket, "validate_tickets"):
+            response = self.order(5, 6)
+        self.assertRejected(
+            response, "Some of the seats are already taken", field="tickets"
+        )
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class OrderExportTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        flight = sample_flight()
+        for seat in range(1, 10, 3):
+            sample_order(self.user, flight, [seat, seat + 1])
+        self.url = reverse("airport:order-export")
+
+    def export(self, num, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(num):
+            return b"".join(response.streaming_content)
+
+    def test_ndjson(self):
+        orders = [
+            json.loads(line) for line in self.export(1).decode().splitlines()
+        ]
+        self.assertEqual(len(orders), 3)
+        self.assertEqual(orders[0]["user_email"], "user@test.com")
+        self.assertEqual(orders[0]["ticket_count"], 2)
+
+        tickets = self.export(1, kind="tickets").decode().splitlines()
+        self.assertEqual(len(tickets), 6)
+        self.assertEqual(json.loads(tickets[0])["destination"], "Lviv")
+
+    def test_gzipped_csv_in_time_window(self):
+        content = self.export(
+            1,
+            kind="tickets",
+            export_format="csv",
+            gzip="true",
+            created_from=datetime.now(timezone.utc).date().isoformat(),
+        )
+        rows = list(
+            csv.DictReader(gzip.decompress(content).decode().splitlines())
+        )
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]["seat_class"], "Economy")
+
+        content = self.export(1, export_format="csv", created_to="2000-01-01")
+        self.assertEqual(content, b"id,created_at,user_email,ticket_count\r\n")
+
+    def test_end_date_includes_the_whole_day(self):
+        first, second, third = Order.objects.order_by("id")
+        for order, created_at in (
+            (first, datetime(2024, 4, 29, 23, tzinfo=timezone.utc)),
+            (second, datetime(2024, 4, 30, 15, tzinfo=timezone.utc)),
+            (third, datetime(2024, 5, 1, tzinfo=timezone.utc)),
+        ):
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+
+        def exported(**params):
+            lines = self.export(1, **params).decode().splitlines()
+            return [json.loads(line)["id"] for line in lines]
+
+        self.assertEqual(
+            exported(created_to="2024-04-30"), [first.id, second.id]
+        )
+        self.assertEqual(
+            exported(created_from="2024-04-30", created_to="2024-04-30"),
+            [second.id],
+        )
+        self.assertEqual(
+            exported(created_to="2024-04-30T15:00:00Z"), [first.id]
+        )
+
+        with tempfile.NamedTemporaryFile() as output:
+            call_command(
+                "export_orders",
+                "--from=2024-04-30",
+                "--to=2024-04-30",
+                f"--output={output.name}",
+            )
+            lines = output.read().decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)["id"] for line in lines], [second.id]
+        )
+
+    def test_invalid_params_and_permissions(self):
+        response = self.client.get(
+            self.url, {"export_format": "xml", "created_to": "May"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"export_format", "created_to"})
+
+        response = self.client.get(self.url, {"created_to": "9999-12-31"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data, {"created_to": "Date '9999-12-31' is out of range"}
+        )
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AsyncViewTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}"
+        )
+        self.flight = sample_flight()
+        for _ in range(12):
+            sample_flight(
+                route=self.flight.route, airplane=self.flight.airplane
+            )
+        sample_order(self.user, self.flight, range(1, 6))
+
+    def assertSameResponse(self, name, args=None, num=None, data=None):
+        """Async view returns the body of the sync view, up to the prefix
+        of page links, with the same number of queries"""
+        response = self.client.get(reverse(f"airport:{name}", args=args), data)
+        cache.clear()
+
+        with self.assertNumQueries(num):
+            async_response = self.client.get(
+                reverse(f"airport-async:{name}", args=args), data
+            )
+
+        self.assertEqual(async_response.status_code, response.status_code)
+        self.assertEqual(
+            async_response.content.replace(b"/async/", b"/"),
+            response.content,
+        )
+
+    def test_flights(self):
+        self.assertSameResponse("flight-list", num=3)
+        self.assertSameResponse("flight-list", num=3, data={"page": 2})
+        self.assertSameResponse(
+            "flight-list", num=3, data={"from": "Kyiv", "to": "Lviv"}
+        )
+        self.assertSameResponse(
+            "flight-list",
+            num=2,
+            data={"pagination": "cursor", "date": "2030-05-01"},
+        )
+        self.assertSameResponse("flight-list", num=1, data={"date": "May"})
+        self.assertSameResponse("flight-detail", args=[self.flight.id], num=5)
+        self.assertSameResponse("flight-detail", args=[0], num=2)
+
+    def test_airports_and_routes(self):
+        self.assertSameResponse("airport-list", num=2)
+        self.assertSameResponse("route-list", num=2)
+        self.assertSameResponse(
+            "route-detail", args=[self.flight.route_id], num=2
+        )
+
+    def test_authentication(self):
+        url = reverse("airport-async:flight-list")
+        self.client.credentials()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.client.get(reverse("airport-async:route-list")).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}"
+        )
+        self.assertEqual(
+            self.client.post(url).status_code,
+            status.HTTP_405_METHOD_NOT_ALLOWED,
+        )
+
+
+@override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+class ServerTimingTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        sample_flight()
+
+    def assertTimed(self, url, view_name, queries, rendered=True):
+        with self.assertLogs("airport_api.telemetry") as logs:
+            response = self.client.get(url)
+
+        timing = response["Server-Timing"]
+        self.assertIn("db;dur=", timing)
+        self.assertIn(f'desc="{queries} queries"', timing)
+        self.assertIn(f'app;desc="{view_name}"', timing)
+        for metric in ("serializer", "total"):
+            self.assertIn(f"{metric};dur=", timing)
+        for metric in ("view", "render"):
+            self.assertEqual(f"{metric};dur=" in timing, rendered)
+            self.assertEqual(f'"{metric}_ms"' in logs.output[0], rendered)
+
+        self.assertIn(f'"view": "{view_name}"', logs.output[0])
+        self.assertIn(f'"queries": {queries}', logs.output[0])
+
+    def test_viewset_actions(self):
+        self.assertTimed(
+            reverse("airport:flight-list"), "FlightViewSet.list", 2
+        )
+        self.assertTimed(
+            reverse("airport:flight-seats", args=[Flight.objects.first().id]),
+            "FlightViewSet.seats",
+            4,
+        )
+
+    def test_async_views(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}"
+        )
+        # the response is rendered inside the view, so view and render
+        # time can't be told apart
+        self.assertTimed(
+            reverse("airport-async:flight-list"),
+            "FlightListView.get",
+            3,
+            rendered=False,
+        )
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_disabled(self):
+        response = self.client.get(reverse("airport:flight-list"))
+        self.assertNotIn("Server-Timing", response)
+
+
+@override_settings(THROTTLE_STORE="database")
+class ThrottleTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flight = sample_flight()
+        self.client.force_authenticate(None)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.now = 6000.0
+        patches = (
+            mock.patch.dict(
+                SimpleRateThrottle.THROTTLE_RATES, {"flights": "3/minute"}
+            ),
+            mock.patch.object(
+                SlidingWindowRateThrottle, "timer", lambda _: self.now
+            ),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_scoped_rate_shared_by_sync_and_async_views(self):
+        urls = (
+            reverse("airport:flight-list"),
+            reverse("airport-async:flight-list"),
+            reverse("airport:flight-detail", args=[self.flight.id]),
+        )
+        for url in urls:
+            self.assertEqual(
+                self.client.get(url).status_code, status.HTTP_200_OK
+            )
+
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(
+                response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+            )
+            self.assertEqual(response["Retry-After"], "80")
+
+        response = self.client.get(reverse("airport:order-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        url = reverse("airport:flight-list")
+        for _ in range(3):
+            self.client.get(url)
+
+        # Half of the previous window counts, so 1 more request fits
+        self.now += 90
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.get(url)
+        self.assertEqual(
+            response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(response["Retry-After"], "10")
+
+    def test_expired_counters_are_deleted(self):
+        url = reverse("airport:flight-list")
+        self.client.get(url)
+        self.client.force_authenticate(self.admin)
+        self.client.get(url)
+        self.assertEqual(ThrottleCounter.objects.count(), 2)
+
+        # kept through the next window, where they are the previous one
+        self.now += 60
+        self.client.get(url)
+        self.assertEqual(ThrottleCounter.objects.count(), 3)
+
+        # counters of both clients in window 100 have expired
+        self.now += 60
+        self.client.get(url)
+        self.assertEqual(
+            list(
+                ThrottleCounter.objects.order_by("window").values_list(
+                    "window", "count"
+                )
+            ),
+            [(101, 1), (102, 1)],
+        )
+
+
+@override_settings(THROTTLE_STORE="cache")
+class CacheThrottleTests(ThrottleTests):
+    """ThrottleTests with counters in the throttle cache, as with Redis"""
+
+    test_expired_counters_are_deleted = None
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica"],
+    READ_YOUR_WRITES_SECONDS=10,
+    SHARED_CACHE=True,
+)
+class ReadYourWritesTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.cookies = {}
+
+    def database(self, method, token=None, response_status=None):
+        """Alias the orders of a request would be read from"""
+
+        def get_response(request):
+            response = HttpResponse(
+                status=response_status or (200 if method == "get" else 201)
+            )
+            response["X-Database"] = router.db_for_read(Order)
+            with primary_reads():
+                self.assertEqual(router.db_for_read(Order), "default")
+            return response
+
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        request = getattr(RequestFactory(), method)(
+            reverse("airport:order-list"), **headers
+        )
+        request.COOKIES.update(self.cookies)
+        response = ReadYourWritesMiddleware(get_response)(request)
+        self.cookies.update(
+            (name, cookie.value) for name, cookie in response.cookies.items()
+        )
+        return response["X-Database"]
+
+    def test_reads_stick_to_primary_after_write(self):
+        self.assertEqual(self.database("get", "first"), "replica")
+        self.assertEqual(self.database("post", "first"), "default")
+        self.assertEqual(self.database("get", "first"), "default")
+
+        # the same client without the cookie is known by its token
+        self.cookies.clear()
+        self.assertEqual(self.database("get", "first"), "default")
+        self.assertEqual(self.database("get", "second"), "replica")
+        self.assertEqual(self.database("post", "second", 400), "default")
+        self.assertEqual(self.database("get", "second"), "replica")
+
+        self.cookies.clear()
+        self.assertEqual(self.database("post"), "default")
+        self.assertEqual(self.database("get"), "default")
+        self.assertEqual(self.database("get", "second"), "default")
+
+    @override_settings(SHARED_CACHE=False)
+    def test_only_cookie_is_kept_without_shared_cache(self):
+        self.assertEqual(self.database("post", "first"), "default")
+        self.assertEqual(self.database("get", "first"), "default")
+
+        self.cookies.clear()
+        self.assertEqual(self.database("get", "first"), "replica")
+
+    def test_primary_outside_requests(self):
+        self.assertEqual(router.db_for_read(Order), "default")
+        self.assertEqual(router.db_for_write(Order), "default")
+        self.assertFalse(router.allow_migrate("replica", "airport"))
+        self.assertTrue(router.allow_migrate("default", "airport"))
+
+
+class FakeConnection:
+    """Connection with the attributes the pool uses, broken ones fail the
+    health check"""
+
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.queries = 0
+        self.rollbacks = 0
+        self.info = mock.Mock(transaction_status=0)
+
+    def cursor(self):
+        if self.broken:
+            raise ConnectionError("server closed the connection")
+        self.queries += 1
+        return mock.MagicMock()
+
+    def rollback(self):
+        if self.broken:
+            raise ConnectionError("server closed the connection")
+        self.rollbacks += 1
+        self.info.transaction_status = 0
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.connections.append(connection)
+        return connection
+
+    def assertStats(self, pool, **expected):
+        stats = pool.stats()
+        self.assertEqual({name: stats[name] for name in expected}, expected)
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(max_size=2)
+        first = pool.getconn(self.connect)
+        second = pool.getconn(self.connect)
+        self.assertIsNot(first, second)
+
+        pool.putconn(first)
+        self.assertIs(pool.getconn(self.connect), first)
+        # returned recently, so not checked
+        self.assertEqual(first.queries, 0)
+        self.assertStats(
+            pool, created=2, reused=1, acquired=3, size=2, in_use=2
+        )
+
+        pool.putconn(first)
+        pool.putconn(second)
+        pool.close()
+        self.assertTrue(
+            all(connection.closed for connection in (first, second))
+        )
+        self.assertStats(pool, size=0, idle=0)
+
+    def test_checkout_waits_for_a_free_connection(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        connection = pool.getconn(self.connect)
+
+        with self.assertRaises(PoolTimeout), self.assertLogs(
+            "airport_api.pooled_postgresql.pool", "WARNING"
+        ):
+            pool.getconn(self.connect)
+        self.assertStats(pool, timeouts=1, size=1)
+
+        pool.timeout = 5
+        taken = []
+        thread = threading.Thread(
+            target=lambda: taken.append(pool.getconn(self.connect))
+        )
+        thread.start()
+        pool.putconn(connection)
+        thread.join()
+
+        self.assertEqual(taken, [connection])
+        self.assertEqual(len(self.connections), 1)
+
+    def test_idle_connections_are_checked(self):
+        pool = ConnectionPool(max_size=1, check_after=0)
+        connection = pool.getconn(self.connect)
+        pool.putconn(connection)
+
+        self.assertIs(pool.getconn(self.connect), connection)
+        self.assertEqual(connection.queries, 1)
+        pool.putconn(connection)
+
+        connection.broken = True
+        replacement = pool.getconn(self.connect)
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertStats(pool, created=2, discarded=1, size=1)
+
+    def test_returned_connections(self):
+        pool = ConnectionPool(max_size=1)
+
+        # an unfinished transaction is rolled back
+        connection = pool.getconn(self.connect)
+        connection.info.transaction_status = 2
+        pool.putconn(connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertStats(pool, idle=1, size=1)
+
+        # broken and closed connections free their slot
+        connection = pool.getconn(self.connect)
+        connection.info.transaction_status = 3
+        connection.broken = True
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        self.assertStats(pool, idle=0, size=0, discarded=1)
+
+        connection = pool.getconn(self.connect)
+        connection.close()
+        pool.putconn(connection)
+        self.assertStats(pool, idle=0, size=0, discarded=2)
+
+        # and so do connections past their lifetime
+        pool.max_lifetime = 0
+        connection = pool.getconn(self.connect)
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        self.assertStats(pool, idle=0, size=0, discarded=3)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+
+        def fail():
+            raise ConnectionError("could not connect")
+
+        with self.assertRaises(ConnectionError):
+            pool.getconn(fail)
+        self.assertStats(pool, size=0)
+        self.assertIsNotNone(pool.getconn(self.connect))
@@ -10,6 +10,7 @@ from airport.views import (
     RouteViewSet,
     CrewViewSet,
     FlightViewSet,
+    FlightScheduleViewSet,
     OrderViewSet,
     CabinViewSet,
 )
@@ -24,6 +25,7 @@ viewset_dict = {
     "routes": RouteViewSet,
     "crew": CrewViewSet,
     "flights": FlightViewSet,
+    "flight-schedules": FlightScheduleViewSet,
     "orders": OrderViewSet,
 }
 
@@ -1,15 +1,25 @@
-from datetime import datetime
-
-from django.db.models import Count, Q, Sum
+import calendar
+import csv
+import io
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Min, Prefetch
+from django.db.models.functions import TruncDate
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from airport import exports
+from airport.flight_graph import search_connections
+from airport.flight_import import FlightImporter, read_rows
 from airport.models import (
     AirplaneType,
     SeatClass,
@@ -19,8 +29,11 @@ from airport.models import (
     Route,
     Crew,
     Flight,
+    FlightSchedule,
+    FlightSearchRow,
     Order,
     Cabin,
+    Ticket,
 )
 from airport.serializers import (
     AirplaneTypeSerializer,
@@ -42,7 +55,26 @@ from airport.serializers import (
     CountryImageSerializer,
     CabinSerializer,
     CabinListSerializer,
+    FlightSeatMapSerializer,
+    CacheStatsSerializer,
+    SeatHoldSerializer,
+    FlightImportSerializer,
+    FlightScheduleSerializer,
+    ConnectionSerializer,
+    RoutePlanSerializer,
+    CalendarDaySerializer,
+    FlightSearchRowSerializer,
+)
+from airport.pagination import FlightPagination, OrderPagination
+from airport.response_cache import (
+    cached_response,
+    flight_detail_cache_key,
+    flight_list_cache_key,
+    get_stats,
 )
+from airport.route_planner import plan_routes
+from airport.schedules import cancel_schedule, materialize_schedule
+from airport.seat_map import get_seat_map
 
 
 class AirplaneTypeViewSet(
@@ -70,7 +102,7 @@ class CabinViewSet(
     mixins.ListModelMixin,
     GenericViewSet,
 ):
-    queryset = Cabin.objects.all()
+    queryset = Cabin.objects.select_related("seat_class")
     permission_classes = (IsAdminUser,)
 
     def get_serializer_class(self):
@@ -87,7 +119,7 @@ class AirplaneViewSet(
 ):
     queryset = Airplane.objects.select_related(
         "airplane_type"
-    ).prefetch_related("cabins")
+    ).prefetch_related("cabins__seat_class")
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -160,8 +192,57 @@ class RouteViewSet(
         if self.action == "retrieve":
             return RouteDetailSerializer
 
+        if self.action == "plan":
+            return RoutePlanSerializer
+
         return RouteSerializer
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "from",
+                type=OpenApiTypes.STR,
+                required=True,
+                description="Departure city, country or airport name",
+            ),
+            OpenApiParameter(
+                "to",
+                type=OpenApiTypes.STR,
+                required=True,
+                description="Destination city, country or airport name",
+            ),
+        ]
+    )
+    @action(methods=["GET"], detail=False, url_path="plan")
+    def plan(self, request):
+        """Endpoint for the shortest and the fewest hops paths of routes
+        between places, null when there is no path"""
+        departure = request.query_params.get("from")
+        destination = request.query_params.get("to")
+        if not departure or not destination:
+            raise ValidationError("from and to are required")
+
+        paths = plan_routes(
+            Airport.ids_matching(departure).values_list("id", flat=True),
+            Airport.ids_matching(destination).values_list("id", flat=True),
+        )
+        routes = self.queryset.in_bulk(
+            {route_id for path in paths.values() for route_id in path or ()}
+        )
+
+        plan = dict.fromkeys(paths)
+        for name, path in paths.items():
+            # a route may be deleted since the network was checked
+            if path and all(pk in routes for pk in path):
+                plan[name] = {
+                    "distance": sum(routes[pk].distance for pk in path),
+                    "hops": len(path),
+                    "routes": [routes[pk] for pk in path],
+                }
+
+        serializer = self.get_serializer(plan)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
 
 class CrewViewSet(
     mixins.CreateModelMixin,
@@ -173,66 +254,440 @@ class CrewViewSet(
     permission_classes = (IsAdminUser,)
 
 
-class BasePagination(PageNumberPagination):
-    page_size = 10
-    max_page_size = 100
+class FlightScheduleViewSet(viewsets.ModelViewSet):
+    queryset = FlightSchedule.objects.select_related(
+        "route", "airplane"
+    ).prefetch_related("crew")
+    serializer_class = FlightScheduleSerializer
+    permission_classes = (IsAdminUser,)
+
+    def perform_create(self, serializer):
+        """Create the schedule with its flights up to the horizon"""
+        materialize_schedule(serializer.save())
+
+    def perform_update(self, serializer):
+        """Update the schedule and its future flights without sold or
+        held seats"""
+        materialize_schedule(serializer.save(), update=True)
+
+    def perform_destroy(self, instance):
+        cancel_schedule(instance)
 
 
-class FlightViewSet(viewsets.ModelViewSet):
-    queryset = (
-        Flight.objects.prefetch_related("crew")
-        .select_related(
-            "route__departure__country",
-            "route__destination__country",
-            "airplane",
+def start_of_next_day(day):
+    """Aware start of the day after day, None after the last day datetime
+    can hold, where ranges are left open"""
+    if day == date.max:
+        return None
+    return timezone.make_aware(
+        datetime.combine(day + timedelta(days=1), time.min)
+    )
+
+
+class FlightSearchMixin:
+    """Query param filters shared by the sync and async flight views"""
+
+    def _parse_query_param(self, name, format_, example):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+
+        try:
+            return datetime.strptime(value, format_)
+        except ValueError:
+            raise ValidationError({name: f"Must be in format {example}"})
+
+    def get_departure_range(self):
+        """Turn date and time filters into half-open [start, end) range of
+        departure time, so filtering doesn't wrap the indexed column"""
+        departure_date = self._parse_query_param(
+            "date", "%Y-%m-%d", "YYYY-MM-DD"
         )
-        .annotate(
-            tickets_available=(
-                Sum("airplane__cabins__seats", distinct=True)
-                - Count("tickets")
-            )
+        date_from = (
+            self._parse_query_param("date_from", "%Y-%m-%d", "YYYY-MM-DD")
+            or departure_date
+        )
+        date_to = (
+            self._parse_query_param("date_to", "%Y-%m-%d", "YYYY-MM-DD")
+            or departure_date
         )
+        time_from = self._parse_query_param("time_from", "%H:%M", "HH:MM")
+        time_to = self._parse_query_param("time_to", "%H:%M", "HH:MM")
+
+        if (time_from and not date_from) or (time_to and not date_to):
+            raise ValidationError(
+                "time_from and time_to require date, date_from or date_to"
+            )
+
+        start = end = None
+        if date_from:
+            start = timezone.make_aware(
+                datetime.combine(
+                    date_from.date(),
+                    time_from.time() if time_from else time.min,
+                )
+            )
+        if date_to and time_to:
+            end = timezone.make_aware(
+                datetime.combine(date_to.date(), time_to.time())
+            )
+        elif date_to:
+            end = start_of_next_day(date_to.date())
+
+        return start, end
+
+    def filter_flights(self, queryset, route_ids=None):
+        if route_ids is not None:
+            queryset = queryset.filter(route_id__in=route_ids)
+
+        departure_from, departure_to = self.get_departure_range()
+
+        if departure_from:
+            queryset = queryset.filter(departure_time__gte=departure_from)
+
+        if departure_to:
+            queryset = queryset.filter(departure_time__lt=departure_to)
+
+        return queryset
+
+
+class FlightViewSet(FlightSearchMixin, viewsets.ModelViewSet):
+    queryset = Flight.objects.select_related(
+        "route__departure__country",
+        "route__destination__country",
+        "airplane",
     )
-    pagination_class = BasePagination
+    pagination_class = FlightPagination
+    throttle_scope = "flights"
 
     def get_queryset(self):
         departure = self.request.query_params.get("from")
         destination = self.request.query_params.get("to")
-        departure_date = self.request.query_params.get("date")
 
-        queryset = self.queryset
+        if self.action in ("seats", "holds"):
+            return Flight.objects.select_related("airplane")
 
-        if departure:
-            queryset = queryset.filter(
-                Q(route__departure__name__icontains=departure)
-                | Q(route__departure__near_city__icontains=departure)
-                | Q(route__departure__country__name__icontains=departure)
+        if self.action == "list" and settings.FLIGHT_LIST_FROM_SEARCH_ROWS:
+            return self.filter_flights(
+                FlightSearchRow.matching(departure, destination)
             )
 
-        if destination:
-            queryset = queryset.filter(
-                Q(route__destination__name__icontains=destination)
-                | Q(route__destination__near_city__icontains=destination)
-                | Q(route__destination__country__name__icontains=destination)
-            )
+        queryset = self.queryset
 
-        if departure_date:
-            departure_date = datetime.strptime(
-                departure_date, "%Y-%m-%d"
-            ).date()
-            queryset = queryset.filter(departure_time__date=departure_date)
+        if self.action == "retrieve":
+            queryset = queryset.select_related(
+                "airplane__airplane_type"
+            ).prefetch_related("crew", "airplane__cabins__seat_class")
 
-        return queryset
+        route_ids = None
+        if departure or destination:
+            route_ids = Route.ids_between(departure, destination)
+
+        return self.filter_flights(queryset, route_ids)
 
     def get_serializer_class(self):
+        if self.action == "list" and settings.FLIGHT_LIST_FROM_SEARCH_ROWS:
+            return FlightSearchRowSerializer
+
         if self.action == "list":
             return FlightListSerializer
 
         if self.action == "retrieve":
             return FlightDetailSerializer
 
+        if self.action == "seats":
+            return FlightSeatMapSerializer
+
+        if self.action == "cache_stats":
+            return CacheStatsSerializer
+
+        if self.action == "holds":
+            return SeatHoldSerializer
+
+        if self.action == "bulk_import":
+            return FlightImportSerializer
+
+        if self.action == "connections":
+            return ConnectionSerializer
+
+        if self.action == "calendar":
+            return CalendarDaySerializer
+
         return FlightSerializer
 
+    @action(methods=["GET"], detail=True, url_path="seats")
+    def seats(self, request, pk=None):
+        """Endpoint for retrieving taken seats of each cabin of the flight"""
+        flight = self.get_object()
+        serializer = self.get_serializer(get_seat_map(flight))
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        methods=["POST"],
+        detail=True,
+        url_path="holds",
+        permission_classes=[IsAuthenticated],
+    )
+    def holds(self, request, pk=None):
+        """Endpoint for holding seats of the flight for a few minutes,
+        the hold can be turned into tickets by passing it to the order"""
+        flight = self.get_object()
+        context = self.get_serializer_context()
+        context["flight"] = flight
+        serializer = self.get_serializer(data=request.data, context=context)
+
+        if serializer.is_valid():
+            serializer.save(flight=flight, user_id=request.user.pk)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="cache-stats",
+        permission_classes=[IsAdminUser],
+    )
+    def cache_stats(self, request):
+        """Endpoint for retrieving hits and misses of flight response cache"""
+        serializer = self.get_serializer(get_stats())
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="import",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_import(self, request):
+        """Endpoint for importing flights from an uploaded CSV or JSON file
+        or a JSON list, invalid rows are skipped and reported"""
+        if isinstance(request.data, list):
+            rows = request.data
+        else:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            file = serializer.validated_data["file"]
+            file_format = (
+                "json" if file.name.lower().endswith(".json") else "csv"
+            )
+            try:
+                rows = read_rows(
+                    io.TextIOWrapper(file, encoding="utf-8-sig", newline=""),
+                    file_format,
+                )
+            except (ValueError, csv.Error) as error:
+                raise ValidationError({"file": str(error)})
+
+        created, errors = FlightImporter().run(rows)
+        serializer = self.get_serializer(
+            {"created": created, "errors": errors}
+        )
+
+        if created:
+            response_status = status.HTTP_201_CREATED
+        elif errors:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+
+        return Response(serializer.data, status=response_status)
+
+    def _parse_int_param(self, name, default, minimum, maximum):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+
+        try:
+            number = int(value)
+        except ValueError:
+            number = None
+
+        if number is None or not minimum <= number <= maximum:
+            raise ValidationError(
+                {name: f"Must be an integer from {minimum} to {maximum}"}
+            )
+        return number
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "from",
+                type=OpenApiTypes.STR,
+                required=True,
+                description="Departure city, country or airport name",
+            ),
+            OpenApiParameter(
+                "to",
+                type=OpenApiTypes.STR,
+                required=True,
+                description="Destination city, country or airport name",
+            ),
+            OpenApiParameter(
+                "date",
+                type=OpenApiTypes.DATE,
+                description=(
+                    "Date of DEPARTURE of the first flight, date_from, "
+                    "date_to, time_from and time_to work as in the list"
+                ),
+            ),
+            OpenApiParameter(
+                "max_stops",
+                type=OpenApiTypes.INT,
+                description="Connections between flights, 0 to 2 (1)",
+            ),
+            OpenApiParameter(
+                "limit",
+                type=OpenApiTypes.INT,
+                description="Number of itineraries, 1 to 100 (20)",
+            ),
+        ]
+    )
+    @action(methods=["GET"], detail=False, url_path="connections")
+    def connections(self, request):
+        """Endpoint for itineraries of up to three flights between places,
+        each connection leaving CONNECTION_MIN_MINUTES to
+        CONNECTION_MAX_HOURS after the arrival, sorted by total duration"""
+        departure = request.query_params.get("from")
+        destination = request.query_params.get("to")
+        if not departure or not destination:
+            raise ValidationError("from and to are required")
+
+        start, end = self.get_departure_range()
+        if not start:
+            raise ValidationError("date or date_from is required")
+        if not end:
+            try:
+                end = start + timedelta(days=1)
+            except OverflowError:
+                end = timezone.make_aware(datetime.max)
+
+        itineraries = search_connections(
+            Airport.ids_matching(departure).values_list("id", flat=True),
+            Airport.ids_matching(destination).values_list("id", flat=True),
+            start,
+            end,
+            max_stops=self._parse_int_param("max_stops", 1, 0, 2),
+            limit=self._parse_int_param("limit", 20, 1, 100),
+        )
+
+        flights = self.queryset.in_bulk(
+            {leg.flight_id for legs in itineraries for leg in legs}
+        )
+        connections = []
+        for legs in itineraries:
+            # a flight deleted since the graph was refreshed
+            if any(leg.flight_id not in flights for leg in legs):
+                continue
+
+            connection_flights = [flights[leg.flight_id] for leg in legs]
+            departure_time = connection_flights[0].departure_time
+            arrival_time = connection_flights[-1].arrival_time
+            connections.append(
+                {
+                    "departure_time": departure_time,
+                    "arrival_time": arrival_time,
+                    "duration": arrival_time - departure_time,
+                    "stops": len(legs) - 1,
+                    "flights": connection_flights,
+                }
+            )
+
+        serializer = self.get_serializer(connections, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "from",
+                type=OpenApiTypes.STR,
+                description="Departure city, country or airport name",
+            ),
+            OpenApiParameter(
+                "to",
+                type=OpenApiTypes.STR,
+                description="Destination city, country or airport name",
+            ),
+            OpenApiParameter(
+                "month",
+                type=OpenApiTypes.STR,
+                required=True,
+                description="Month of DEPARTURE (ex. ?month=2024-04)",
+            ),
+        ]
+    )
+    @action(methods=["GET"], detail=False, url_path="calendar")
+    def calendar(self, request):
+        """Endpoint for the number of flights, the earliest departure and
+        the most tickets available on a flight for every day of the month,
+        counted in one grouped query and cached like the flight list"""
+        month = self._parse_query_param("month", "%Y-%m", "YYYY-MM")
+        if not month:
+            raise ValidationError({"month": "This field is required."})
+
+        return cached_response(
+            flight_list_cache_key(request),
+            lambda: self.get_calendar(month.date()),
+        )
+
+    def get_calendar(self, first_day):
+        days = calendar.monthrange(first_day.year, first_day.month)[1]
+        start = timezone.make_aware(datetime.combine(first_day, time.min))
+        end = start_of_next_day(first_day + timedelta(days=days - 1))
+
+        flights = self.get_queryset().filter(departure_time__gte=start)
+        if end:
+            flights = flights.filter(departure_time__lt=end)
+
+        rows = {
+            row["date"]: row
+            for row in flights.annotate(date=TruncDate("departure_time"))
+            .values("date")
+            .annotate(
+                flights=Count("id"),
+                first_departure=Min("departure_time"),
+                max_tickets_available=Max(
+                    F("seats_total") - F("seats_sold") - F("seats_held")
+                ),
+            )
+            .order_by("date")
+        }
+
+        serializer = self.get_serializer(
+            [
+                rows.get(
+                    day,
+                    {
+                        "date": day,
+                        "flights": 0,
+                        "first_departure": None,
+                        "max_tickets_available": None,
+                    },
+                )
+                for day in (
+                    first_day + timedelta(days=offset)
+                    for offset in range(days)
+                )
+            ],
+            many=True,
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            key = flight_detail_cache_key(request, kwargs["pk"])
+        except ValueError:
+            raise NotFound()
+
+        return cached_response(
+            key,
+            lambda: super(FlightViewSet, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -258,10 +713,45 @@ class FlightViewSet(viewsets.ModelViewSet):
                     "Filter by date of DEPARTURE " "(ex. ?date=2024-04-19)"
                 ),
             ),
+            OpenApiParameter(
+                "date_from",
+                type=OpenApiTypes.DATE,
+                description=(
+                    "Filter by DEPARTURE on or after the date "
+                    "(ex. ?date_from=2024-04-19)"
+                ),
+            ),
+            OpenApiParameter(
+                "date_to",
+                type=OpenApiTypes.DATE,
+                description=(
+                    "Filter by DEPARTURE on or before the date "
+                    "(ex. ?date_to=2024-04-21)"
+                ),
+            ),
+            OpenApiParameter(
+                "time_from",
+                type=OpenApiTypes.STR,
+                description=(
+                    "Filter by DEPARTURE at or after the time of the first "
+                    "day, requires date or date_from (ex. ?time_from=08:00)"
+                ),
+            ),
+            OpenApiParameter(
+                "time_to",
+                type=OpenApiTypes.STR,
+                description=(
+                    "Filter by DEPARTURE before the time of the last day, "
+                    "requires date or date_to (ex. ?time_to=14:30)"
+                ),
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        return cached_response(
+            flight_list_cache_key(request),
+            lambda: super(FlightViewSet, self).list(request, *args, **kwargs),
+        )
 
 
 class OrderViewSet(
@@ -270,12 +760,28 @@ class OrderViewSet(
     GenericViewSet,
 ):
     queryset = Order.objects.all()
-    pagination_class = BasePagination
+    pagination_class = OrderPagination
     permission_classes = (IsAuthenticated,)
+    throttle_scope = "orders"
 
     def get_queryset(self):
         """Retrieve the orders with currently authenticated user"""
-        return Order.objects.filter(user=self.request.user)
+        queryset = Order.objects.filter(user_id=self.request.user.pk)
+
+        if self.action == "list":
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "tickets",
+                    queryset=Ticket.objects.select_related(
+                        "cabin__seat_class",
+                        "flight__route__departure",
+                        "flight__route__destination",
+                        "flight__airplane",
+                    ),
+                )
+            )
+
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -285,4 +791,91 @@ class OrderViewSet(
 
     def perform_create(self, serializer):
         """Create the orders with currently authenticated user"""
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.pk)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "kind",
+                type=OpenApiTypes.STR,
+                enum=exports.KINDS,
+                description="Export orders or their tickets (default orders)",
+            ),
+            OpenApiParameter(
+                "export_format",
+                type=OpenApiTypes.STR,
+                enum=list(exports.FORMATS),
+                description="Export as NDJSON or CSV (default ndjson)",
+            ),
+            OpenApiParameter(
+                "created_from",
+                type=OpenApiTypes.DATETIME,
+                description=(
+                    "Export orders created at or after the date or time "
+                    "(ex. ?created_from=2024-04-01)"
+                ),
+            ),
+            OpenApiParameter(
+                "created_to",
+                type=OpenApiTypes.DATETIME,
+                description=(
+                    "Export orders created before the time or on or before "
+                    "the date (ex. ?created_to=2024-04-30)"
+                ),
+            ),
+            OpenApiParameter(
+                "gzip",
+                type=OpenApiTypes.BOOL,
+                description="Compress the export with gzip",
+            ),
+        ],
+        responses={(200, "application/x-ndjson"): OpenApiTypes.STR},
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=[IsAdminUser],
+    )
+    def export(self, request):
+        """Endpoint for streaming orders or tickets of all users created in
+        a time window, memory use doesn't depend on the size of export"""
+        params = request.query_params
+        kind = params.get("kind", "orders")
+        export_format = params.get("export_format", "ndjson")
+        compress = params.get("gzip", "").lower() in ("1", "true")
+
+        errors = {}
+        if kind not in exports.KINDS:
+            errors["kind"] = f"Must be one of {', '.join(exports.KINDS)}"
+        if export_format not in exports.FORMATS:
+            formats = ", ".join(exports.FORMATS)
+            errors["export_format"] = f"Must be one of {formats}"
+
+        window = {}
+        for name in ("created_from", "created_to"):
+            if params.get(name):
+                try:
+                    window[name] = exports.parse_time_bound(
+                        params[name], end=name == "created_to"
+                    )
+                except ValueError as error:
+                    errors[name] = str(error)
+
+        if errors:
+            raise ValidationError(errors)
+
+        response = StreamingHttpResponse(
+            exports.export_stream(
+                kind, export_format, compress=compress, **window
+            ),
+            content_type=(
+                "application/gzip"
+                if compress
+                else exports.FORMATS[export_format]
+            ),
+        )
+        response["Content-Disposition"] = (
+            "attachment; filename="
+            f'"{exports.export_filename(kind, export_format, compress)}"'
+        )
+        return response
@@ -0,0 +1,133 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+PRIMARY_COOKIE = "db_primary"
+
+# Set only while a request that may read from replicas is handled, so
+# management commands and background threads keep using the primary
+_read_replica = ContextVar("read_replica", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the default database inside the block. Used where rows
+    are cached or kept by the process under a version bumped when they
+    were written, which a lagging replica may not have caught up with"""
+    token = _read_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Send reads of safe requests to a random DATABASE_REPLICAS alias,
+    everything else to the default database"""
+
+    def db_for_read(self, model, **hints):
+        if _read_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def sticky_key(request):
+    """Cache key of the client by its Authorization header, None for
+    clients without one or when the cache isn't shared by the worker
+    processes, as other processes wouldn't see the key"""
+    authorization = request.headers.get("Authorization")
+    if not authorization or not settings.SHARED_CACHE:
+        return None
+
+    digest = hashlib.md5(authorization.encode()).hexdigest()
+    return f"db:primary:{digest}"
+
+
+class ReadYourWritesMiddleware:
+    """Let GET, HEAD and OPTIONS requests read from replicas, unless the
+    client made a successful write in the last READ_YOUR_WRITES_SECONDS.
+    Writers are remembered by a cookie and, with a shared cache, by their
+    Authorization header for clients which don't keep cookies. Disabled
+    without replicas"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def is_safe(request):
+        return request.method in ("GET", "HEAD", "OPTIONS")
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        key = sticky_key(request)
+        read_replica = self.is_safe(request) and not (
+            PRIMARY_COOKIE in request.COOKIES or (key and cache.get(key))
+        )
+
+        token = _read_replica.set(read_replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+
+        if self.pins_primary(request, response, key):
+            cache.set(key, True, settings.READ_YOUR_WRITES_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        key = sticky_key(request)
+        read_replica = self.is_safe(request) and not (
+            PRIMARY_COOKIE in request.COOKIES
+            or (key and await cache.aget(key))
+        )
+
+        token = _read_replica.set(read_replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+
+        if self.pins_primary(request, response, key):
+            await cache.aset(key, True, settings.READ_YOUR_WRITES_SECONDS)
+        return response
+
+    def pins_primary(self, request, response, key):
+        """Set the cookie after a successful write, return whether the
+        client should also be remembered by key"""
+        if self.is_safe(request) or response.status_code >= 400:
+            return False
+
+        response.set_cookie(
+            PRIMARY_COOKIE,
+            "1",
+            max_age=settings.READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
+        return key is not None
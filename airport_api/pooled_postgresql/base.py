@@ -0,0 +1,49 @@
+from django.db.backends.postgresql.base import (
+    DatabaseWrapper as PostgreSQLDatabaseWrapper,
+)
+
+from airport_api.pooled_postgresql.creation import DatabaseCreation
+from airport_api.pooled_postgresql.pool import PoolTimeout, get_pool
+
+
+class DatabaseWrapper(PostgreSQLDatabaseWrapper):
+    """PostgreSQL backend which takes connections from a per-process pool
+    configured with OPTIONS["pool"], and returns them to the pool instead
+    of closing them"""
+
+    creation_class = DatabaseCreation
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_pool(self, conn_params):
+        key = (
+            self.alias,
+            *(
+                (name, value)
+                for name, value in sorted(conn_params.items())
+                if isinstance(value, (str, int))
+            ),
+        )
+        return get_pool(key, **self.settings_dict["OPTIONS"].get("pool", {}))
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        try:
+            connection = pool.getconn(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params
+                )
+            )
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
@@ -0,0 +1,12 @@
+from django.db.backends.postgresql.creation import (
+    DatabaseCreation as PostgreSQLDatabaseCreation,
+)
+
+from airport_api.pooled_postgresql.pool import close_pools
+
+
+class DatabaseCreation(PostgreSQLDatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the test database in use
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,222 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# psycopg2 TRANSACTION_STATUS_IDLE and psycopg3 TransactionStatus.IDLE
+TRANSACTION_STATUS_IDLE = 0
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of open connections shared by the threads of a process.
+
+    Connections are created lazily up to max_size, checked before reuse if
+    they were idle longer than check_after seconds and recycled after
+    max_lifetime seconds. Waiting longer than timeout for a free connection
+    raises PoolTimeout"""
+
+    def __init__(
+        self,
+        max_size=10,
+        timeout=5.0,
+        max_lifetime=1800.0,
+        check_after=30.0,
+    ):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self._condition = threading.Condition()
+        # (connection, created_at, returned_at) of free connections
+        self._idle = []
+        self._created_at = {}
+        self._size = 0
+        self._stats = {
+            "acquired": 0,
+            "created": 0,
+            "reused": 0,
+            "discarded": 0,
+            "waited": 0,
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    def getconn(self, connect):
+        """Take a free connection or open a new one with connect()"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    logger.warning(
+                        "Database pool exhausted: %s connections in use, "
+                        "waited %.1f s",
+                        self._size,
+                        self.timeout,
+                    )
+                    raise PoolTimeout(
+                        f"No free database connection in {self.timeout} s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._condition.wait(remaining)
+
+            wait_ms = (time.monotonic() - start) * 1000
+            self._stats["acquired"] += 1
+            self._stats["wait_ms_total"] += wait_ms
+            self._stats["wait_ms_max"] = max(
+                self._stats["wait_ms_max"], wait_ms
+            )
+            if waited:
+                self._stats["waited"] += 1
+
+            idle = self._idle.pop() if self._idle else None
+            if idle is None:
+                # Reserve the slot before connecting outside of the lock
+                self._size += 1
+
+        if idle is not None:
+            connection, created_at, returned_at = idle
+            if self._is_usable(connection, created_at, returned_at):
+                with self._condition:
+                    self._stats["reused"] += 1
+                return connection
+            self._discard(connection, release_slot=False)
+
+        try:
+            connection = connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._created_at[id(connection)] = time.monotonic()
+            self._stats["created"] += 1
+        return connection
+
+    def putconn(self, connection):
+        """Return connection to the pool, rolling back an unfinished
+        transaction. Broken or expired connections are closed"""
+        created_at = self._created_at.get(id(connection), 0)
+        try:
+            usable = not connection.closed and (
+                time.monotonic() - created_at < self.max_lifetime
+            )
+            if (
+                usable
+                and connection.info.transaction_status
+                != TRANSACTION_STATUS_IDLE
+            ):
+                connection.rollback()
+        except Exception:
+            usable = False
+
+        if not usable:
+            self._discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, created_at, time.monotonic()))
+            self._condition.notify()
+
+    def _is_usable(self, connection, created_at, returned_at):
+        now = time.monotonic()
+        if connection.closed or now - created_at >= self.max_lifetime:
+            return False
+        if now - returned_at < self.check_after:
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, connection, release_slot=True):
+        """Close connection, release_slot=False keeps its slot for the
+        connection which replaces it"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+        with self._condition:
+            self._created_at.pop(id(connection), None)
+            self._stats["discarded"] += 1
+            if release_slot:
+                self._size -= 1
+                self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for connection, *_ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._condition:
+            return {
+                **self._stats,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def get_pool(key, **options):
+    """Pool of the process for the key. Pools inherited from a parent
+    process, e.g. with preloading app servers, are dropped after fork"""
+    global _pid
+
+    with _pools_lock:
+        if os.getpid() != _pid:
+            _pools.clear()
+            _pid = os.getpid()
+
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(**options)
+        return pool
+
+
+def close_pools(alias):
+    """Close idle connections of the alias and forget its pools, e.g. before
+    dropping the database they are connected to"""
+    with _pools_lock:
+        keys = [key for key in _pools if key[0] == alias]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def get_stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {str(key[0]): pool.stats() for key, pool in pools.items()}
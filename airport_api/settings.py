@@ -46,15 +46,15 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "drf_spectacular",
-    "debug_toolbar",
     "rest_framework",
     "airport",
     "user",
 ]
 
 MIDDLEWARE = [
+    "airport_api.telemetry.ServerTimingMiddleware",
+    "airport_api.db_routing.ReadYourWritesMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -63,6 +63,16 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(2, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
+# Share of requests reported in Server-Timing headers and timing logs,
+# 0 removes the middleware
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.environ.get("SERVER_TIMING_SAMPLE_RATE", 1 if DEBUG else 0)
+)
+
 ROOT_URLCONF = "airport_api.urls"
 
 TEMPLATES = [
@@ -94,9 +104,107 @@ DATABASES = {
         "USER": os.environ.get("POSTGRES_USER"),
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST"),
+        "PORT": os.environ.get("POSTGRES_PORT", ""),
+        # Keep connections open between requests and check them before reuse
+        "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# With a pool size set, connections are taken from a bounded pool shared by
+# the threads of each worker process and returned to it after each request
+DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 0))
+
+if DATABASE_POOL_SIZE:
+    DATABASES["default"].update(
+        {
+            "ENGINE": "airport_api.pooled_postgresql",
+            "CONN_MAX_AGE": 0,
+            "OPTIONS": {
+                "pool": {
+                    "max_size": DATABASE_POOL_SIZE,
+                    "timeout": float(
+                        os.environ.get("DATABASE_POOL_TIMEOUT", 5)
+                    ),
+                    "max_lifetime": float(
+                        os.environ.get("DATABASE_POOL_MAX_LIFETIME", 1800)
+                    ),
+                    "check_after": float(
+                        os.environ.get("DATABASE_POOL_CHECK_AFTER", 30)
+                    ),
+                }
+            },
+        }
+    )
+
+# Read replicas of the default database as space-separated host[:port],
+# GET requests read from them unless the client wrote in the last
+# READ_YOUR_WRITES_SECONDS, known by a cookie and, with a shared cache, by
+# their token. Cached responses and the graphs of each process are always
+# built from the primary. The router works with any aliases listed in
+# DATABASE_REPLICAS, e.g. SQLite files of a local settings module
+DATABASE_REPLICAS = []
+
+for number, replica in enumerate(
+    os.environ.get("POSTGRES_REPLICA_HOSTS", "").split(), start=1
+):
+    host, _, port = replica.partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ["airport_api.db_routing.PrimaryReplicaRouter"]
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# The default cache and throttle counters are shared by all worker
+# processes in Redis when REDIS_URL is set. Otherwise the cache is local to
+# each process and throttle counters are kept in the database
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+        "throttle": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "throttle",
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+        "throttle": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "throttle",
+        },
+    }
+
+# "cache" keeps throttle counters in the throttle cache, "database" in
+# ThrottleCounter rows
+THROTTLE_STORE = "cache" if REDIS_URL else "database"
+
+# Cached responses, seat maps and the graphs each process keeps are expired
+# through version stamps in the default cache, which reach other worker
+# processes only when the cache is shared by them
+SHARED_CACHE = bool(REDIS_URL)
+
+# Seconds entries other processes can't expire are kept for, when the
+# default cache is local to each process
+LOCAL_CACHE_TIMEOUT = int(os.environ.get("LOCAL_CACHE_TIMEOUT", 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -146,17 +254,25 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "user.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "airport.permissions.IsAdminOrIfAuthenticatedReadOnly",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "airport_api.throttling.AnonRateThrottle",
+        "airport_api.throttling.UserRateThrottle",
+        "airport_api.throttling.ScopedRateThrottle",
     ],
-    "DEFAULT_THROTTLE_RATES": {"anon": "30/day", "user": "100/day"},
+    # Views with a throttle_scope are limited by the rate of their scope
+    # instead of the anon and user rates
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": os.environ.get("THROTTLE_RATE_ANON", "30/day"),
+        "user": os.environ.get("THROTTLE_RATE_USER", "100/day"),
+        "flights": os.environ.get("THROTTLE_RATE_FLIGHTS", "1000/hour"),
+        "orders": os.environ.get("THROTTLE_RATE_ORDERS", "100/day"),
+    },
 }
 
 SPECTACULAR_SETTINGS = {
@@ -177,3 +293,53 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "ROTATE_REFRESH_TOKENS": False,
 }
+
+# Seconds the flags of authenticated users are cached for, they are also
+# expired as soon as a change of the user is committed. Flags are only
+# cached with a shared cache
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get("AUTH_USER_CACHE_TIMEOUT", 300))
+
+# Flight list and detail responses are expired as soon as the flights they
+# show change, the timeout only bounds how long an entry may live
+FLIGHT_CACHE_TIMEOUT = int(os.environ.get("FLIGHT_CACHE_TIMEOUT", 300))
+
+# Serve the flight list from the denormalized flight search rows, which
+# saves joins of routes, airports, countries and airplanes
+FLIGHT_LIST_FROM_SEARCH_ROWS = bool(
+    int(os.environ.get("FLIGHT_LIST_FROM_SEARCH_ROWS", 1))
+)
+
+# Days ahead flights of recurring schedules are created for
+FLIGHT_SCHEDULE_HORIZON_DAYS = int(
+    os.environ.get("FLIGHT_SCHEDULE_HORIZON_DAYS", 90)
+)
+
+# Without a shared cache, seconds the flight graph and route network of
+# each process are used for before they are rebuilt, as changes made by
+# other processes can't be seen
+GRAPH_LOCAL_MAX_AGE = int(os.environ.get("GRAPH_LOCAL_MAX_AGE", 60))
+
+# Shortest and longest connection between flights of an itinerary
+CONNECTION_MIN_MINUTES = int(os.environ.get("CONNECTION_MIN_MINUTES", 45))
+CONNECTION_MAX_HOURS = int(os.environ.get("CONNECTION_MAX_HOURS", 24))
+
+# Minutes seats are held for by default and at most before ordering
+SEAT_HOLD_MINUTES = int(os.environ.get("SEAT_HOLD_MINUTES", 10))
+SEAT_HOLD_MAX_MINUTES = int(os.environ.get("SEAT_HOLD_MAX_MINUTES", 30))
+# Seats of one hold and active holds of a user on one flight, so a client
+# can't hold a flight back from sale
+SEAT_HOLD_MAX_SEATS = int(os.environ.get("SEAT_HOLD_MAX_SEATS", 9))
+SEAT_HOLD_MAX_ACTIVE = int(os.environ.get("SEAT_HOLD_MAX_ACTIVE", 1))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "airport_api.telemetry": {
+            "handlers": ["console"],
+            "level": os.environ.get("TELEMETRY_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
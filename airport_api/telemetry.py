@@ -0,0 +1,203 @@
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+_timing = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    __slots__ = (
+        "start",
+        "view_start",
+        "view_end",
+        "view_name",
+        "queries",
+        "db",
+        "serializer",
+        "serializing",
+    )
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = self.view_end = None
+        self.view_name = None
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.serializing = False
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection, counts the query
+    towards the request being timed, if any"""
+    timing = _timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.db += time.perf_counter() - start
+        timing.queries += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def timed_serializer_data(get_data):
+    """Wrap the data property of serializers to sum the time spent on
+    serialization of the request being timed, nested calls are counted once"""
+
+    def data(self):
+        timing = _timing.get()
+        if timing is None or timing.serializing:
+            return get_data(self)
+
+        timing.serializing = True
+        start = time.perf_counter()
+        try:
+            return get_data(self)
+        finally:
+            timing.serializer += time.perf_counter() - start
+            timing.serializing = False
+
+    data.timed = True
+    return property(data)
+
+
+def get_view_name(request, view_func):
+    """ViewSet.action, View.method or function name of the view"""
+    view_class = getattr(view_func, "cls", None) or getattr(
+        view_func, "view_class", None
+    )
+    if view_class is None:
+        return getattr(view_func, "__name__", "view")
+
+    method = request.method.lower()
+    actions = getattr(view_func, "actions", None) or {}
+    return f"{view_class.__name__}.{actions.get(method, method)}"
+
+
+class ServerTimingMiddleware:
+    """Time a SERVER_TIMING_SAMPLE_RATE share of requests and report
+    database queries and time, serializer, view, render and total time in
+    the Server-Timing header and a structured log line. View and render
+    time are split where the template response is rendered, so they are
+    left out for views which render their own response, e.g. the async
+    views. Disabled entirely when the sample rate is 0"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        connection_created.connect(install_query_timer)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+        if not getattr(BaseSerializer.data.fget, "timed", False):
+            BaseSerializer.data = timed_serializer_data(
+                BaseSerializer.data.fget
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _timing.reset(token)
+
+        return self.report(request, response, timing)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timing.reset(token)
+
+        return self.report(request, response, timing)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = _timing.get()
+        if timing is not None:
+            timing.view_name = get_view_name(request, view_func)
+            timing.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = _timing.get()
+        if timing is not None:
+            timing.view_end = time.perf_counter()
+        return response
+
+    def report(self, request, response, timing):
+        end = time.perf_counter()
+        metrics = {
+            "db": timing.db * 1000,
+            "serializer": timing.serializer * 1000,
+        }
+        if timing.view_end is not None:
+            metrics["view"] = (timing.view_end - timing.view_start) * 1000
+            metrics["render"] = (end - timing.view_end) * 1000
+        metrics["total"] = (end - timing.start) * 1000
+
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={metrics["db"]:.2f};desc="{timing.queries} queries"',
+                *(
+                    f"{name};dur={value:.2f}"
+                    for name, value in metrics.items()
+                    if name != "db"
+                ),
+                f'app;desc="{timing.view_name}"',
+            ]
+        )
+
+        logger.info(
+            json.dumps(
+                {
+                    "view": timing.view_name,
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "queries": timing.queries,
+                    **{
+                        f"{name}_ms": round(value, 2)
+                        for name, value in metrics.items()
+                    },
+                }
+            )
+        )
+        return response
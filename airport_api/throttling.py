@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from rest_framework import throttling
+
+from airport.models import ThrottleCounter
+
+THROTTLE_CACHE = "throttle"
+
+
+class CacheCounters:
+    """Counters of windows in the "throttle" cache, atomic in Redis"""
+
+    def __init__(self):
+        self.cache = caches[THROTTLE_CACHE]
+
+    def count(self, key, window, expires_at, now):
+        """Increment the counter of the window, return it and the counter
+        of the previous window"""
+        current_key = f"{key}:{window}"
+        timeout = expires_at - now
+        self.cache.add(current_key, 0, timeout)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            current = 1
+            self.cache.set(current_key, 1, timeout)
+        return current, self.cache.get(f"{key}:{window - 1}", 0)
+
+    def decrement(self, key, window):
+        try:
+            self.cache.decr(f"{key}:{window}")
+        except ValueError:
+            pass
+
+
+class DatabaseCounters:
+    """Counters of windows in ThrottleCounter rows shared by all worker
+    processes, incremented atomically by an UPDATE. Expired rows are
+    deleted when a row is created, so each row is deleted once"""
+
+    def count(self, key, window, expires_at, now):
+        current = ThrottleCounter.objects.filter(key=key, window=window)
+        if not current.update(count=F("count") + 1):
+            ThrottleCounter.objects.filter(expires_at__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    ThrottleCounter.objects.create(
+                        key=key, window=window, count=1, expires_at=expires_at
+                    )
+            except IntegrityError:
+                # created by a concurrent request
+                current.update(count=F("count") + 1)
+
+        counts = dict(
+            ThrottleCounter.objects.filter(
+                key=key, window__in=(window - 1, window)
+            ).values_list("window", "count")
+        )
+        return counts[window], counts.get(window - 1, 0)
+
+    def decrement(self, key, window):
+        ThrottleCounter.objects.filter(key=key, window=window).update(
+            count=F("count") - 1
+        )
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """Rate throttle which keeps two counters per client, in the throttle
+    cache with THROTTLE_STORE "cache" or in the database with "database",
+    instead of a list of request timestamps in the cache of the process.
+    Requests of the previous window are weighted by the part of it still
+    covered by the sliding window, which bounds the rate over any window
+    of the period"""
+
+    @property
+    def counters(self):
+        if settings.THROTTLE_STORE == "database":
+            return DatabaseCounters()
+        return CacheCounters()
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        counters = self.counters
+
+        # Counter of a window is kept for the next one as well, where it
+        # is the previous window
+        self.current, self.previous = counters.count(
+            self.key, window, (window + 2) * self.duration, self.now
+        )
+
+        if self.estimate(self.current) > self.num_requests:
+            # Rejected requests don't count towards the limit
+            counters.decrement(self.key, window)
+            self.current -= 1
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def estimate(self, current):
+        elapsed = (self.now % self.duration) / self.duration
+        return self.previous * (1 - elapsed) + current
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        """Seconds until the next request fits into the window"""
+        offset = self.now % self.duration
+        available = self.num_requests - self.current - 1
+
+        if available >= 0:
+            if not self.previous:
+                return 0
+            elapsed = self.duration - self.duration * available / self.previous
+            return max(elapsed - offset, 0)
+
+        # Only fits in the next window, where the current one is previous
+        if not self.num_requests:
+            return None
+        elapsed = self.duration * (self.num_requests - 1) / self.current
+        return self.duration - offset + max(self.duration - elapsed, 0)
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowRateThrottle):
+    """Limits anonymous requests to views without their own throttle_scope"""
+
+    def allow_request(self, request, view):
+        if getattr(view, "throttle_scope", None):
+            return True
+        return super().allow_request(request, view)
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowRateThrottle):
+    """Limits requests of each user to views without their own
+    throttle_scope"""
+
+    def allow_request(self, request, view):
+        if getattr(view, "throttle_scope", None):
+            return True
+        return super().allow_request(request, view)
+
+
+class ScopedRateThrottle(
+    throttling.ScopedRateThrottle, SlidingWindowRateThrottle
+):
+    """Limits requests to views with throttle_scope by the rate of the
+    scope, per user or per IP address of anonymous clients"""
@@ -0,0 +1,160 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from airport_api.db_routing import primary_reads
+
+FLAGS = ("is_active", "is_staff", "is_superuser")
+
+
+def user_cache_key(user_id):
+    return f"user:auth:{user_id}"
+
+
+def get_user_flags(user):
+    """Flags of the user checked on authentication and by permissions"""
+    flags = {flag: getattr(user, flag) for flag in FLAGS}
+    if api_settings.CHECK_REVOKE_TOKEN:
+        flags["password"] = get_md5_hash_password(user.password)
+    return flags
+
+
+def user_cache_enabled():
+    """Flags are only cached when the cache is shared by all worker
+    processes, others would keep honouring the flags of a changed user"""
+    return settings.SHARED_CACHE and settings.AUTH_USER_CACHE_TIMEOUT > 0
+
+
+def invalidate_users(user_ids):
+    """Expire cached flags of the users once the transaction is committed,
+    so flags cached from the rows before the commit are dropped too"""
+    keys = [user_cache_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_user(user_id):
+    invalidate_users([user_id])
+
+
+class LazyUser(SimpleLazyObject):
+    """User with the id and flags known from the cache, loaded from the
+    database on first access to any other attribute"""
+
+    def __init__(self, user_id, flags):
+        self.__dict__["_user_id"] = user_id
+        self.__dict__["_auth_flags"] = flags
+        super().__init__(
+            lambda: get_user_model().objects.get(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        )
+
+    @property
+    def pk(self):
+        return self._user_id
+
+    id = pk
+
+    is_active = property(lambda self: self._auth_flags["is_active"])
+    is_staff = property(lambda self: self._auth_flags["is_staff"])
+    is_superuser = property(lambda self: self._auth_flags["is_superuser"])
+    is_authenticated = True
+    is_anonymous = False
+
+    def __bool__(self):
+        return True
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication which checks the flags of the user cached for
+    AUTH_USER_CACHE_TIMEOUT seconds and expired when the user changes,
+    so the user is only loaded by views which use more than its id and
+    flags. Without a shared cache the user is loaded on every request"""
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                "Token contained no recognizable user identification"
+            )
+
+    def check_flags(self, validated_token, flags):
+        if not flags["is_active"]:
+            raise AuthenticationFailed(
+                "User is inactive", code="user_inactive"
+            )
+
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != flags.get("password"):
+            raise AuthenticationFailed(
+                "The user's password has been changed.",
+                code="password_changed",
+            )
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        flags = None
+        if user_cache_enabled():
+            flags = cache.get(user_cache_key(user_id))
+        if flags is not None:
+            self.check_flags(validated_token, flags)
+            return LazyUser(user_id, flags)
+
+        try:
+            with primary_reads():
+                user = self.user_model.objects.get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        flags = get_user_flags(user)
+        if user_cache_enabled():
+            cache.set(
+                user_cache_key(user_id),
+                flags,
+                settings.AUTH_USER_CACHE_TIMEOUT,
+            )
+        self.check_flags(validated_token, flags)
+        return user
+
+    async def aget_user(self, validated_token):
+        """get_user with the async cache and ORM, a cached user must only
+        be loaded outside of the event loop"""
+        user_id = self.get_user_id(validated_token)
+        flags = None
+        if user_cache_enabled():
+            flags = await cache.aget(user_cache_key(user_id))
+        if flags is not None:
+            self.check_flags(validated_token, flags)
+            return LazyUser(user_id, flags)
+
+        try:
+            with primary_reads():
+                user = await self.user_model.objects.aget(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        flags = get_user_flags(user)
+        if user_cache_enabled():
+            await cache.aset(
+                user_cache_key(user_id),
+                flags,
+                settings.AUTH_USER_CACHE_TIMEOUT,
+            )
+        self.check_flags(validated_token, flags)
+        return user
@@ -2,12 +2,26 @@ from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 from django.utils.translation import gettext as _
 
+from user.authentication import FLAGS, invalidate_users
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Update the users and expire their cached authentication flags,
+        as post_save isn't sent for queryset updates"""
+        if set(kwargs) & {*FLAGS, "password"}:
+            invalidate_users(list(self.values_list("pk", flat=True)))
+        return super().update(**kwargs)
+
 
 class UserManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
 
     use_in_migrations = True
 
+    def get_queryset(self):
+        return UserQuerySet(self.model, using=self._db)
+
     def _create_user(self, email, password, **extra_fields):
         """Create and save a User with the given email and password."""
         if not email:
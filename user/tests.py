@@ -1,3 +1,134 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from user.authentication import user_cache_key
+
+
+@override_settings(THROTTLE_STORE="cache")
+class UserViewQueryCountTests(APITestCase):
+    """Query counts of the user views, so that regressions fail the build.
+    Throttle counters are kept in the cache, so they aren't counted"""
+
+    def setUp(self):
+        cache.clear()
+        caches["throttle"].clear()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"
+        }
+
+    def test_register(self):
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                reverse("user:create"),
+                {"email": "new@test.com", "password": "password"},
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_token_obtain(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse("user:token_obtain_pair"),
+                {"email": "user@test.com", "password": "password"},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_me(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("user:manage"), **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update_me(self):
+        with self.assertNumQueries(3):
+            response = self.client.patch(
+                reverse("user:manage"),
+                {"password": "new-password"},
+                **self.auth,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(SHARED_CACHE=True, THROTTLE_STORE="cache")
+class UserFlagsCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        caches["throttle"].clear()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"
+        }
+        self.url = reverse("airport:order-list")
+
+    def test_authenticated_user_flags_are_cached(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_flags_are_expired_on_commit(self):
+        self.client.get(self.url, **self.auth)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_staff = True
+            self.user.save()
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.id)))
+
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+
+    def test_queryset_update_expires_cached_flags(self):
+        self.client.get(self.url, **self.auth)
+
+        users = get_user_model().objects.filter(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            users.update(first_name="Jane")
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.id)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            users.update(is_active=False)
+        response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_staff_flag_change_expires_cached_flags(self):
+        url = reverse("airport:route-list")
+        response = self.client.get(url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_staff = True
+            self.user.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("airport-async:route-list"), **self.auth
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_flags_are_not_cached_without_shared_cache(self):
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, **self.auth)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
@@ -12,6 +12,7 @@ class CreateUserView(generics.CreateAPIView):
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
+    # Loads the user on authentication, as the view serializes it anyway
     authentication_classes = (JWTAuthentication,)
     permission_classes = (IsAuthenticated,)
 